@@ -7,9 +7,22 @@ import random
 import dns.resolver
 import csv
 import io
-from datetime import datetime
+import threading
+import mmap
+import struct
+import heapq
+import tempfile
+import atexit
+import queue
+import zlib
+import hashlib
+import functools
+import base64
+import gzip
+from datetime import datetime, timedelta, timezone as dt_timezone
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from flask import Flask, render_template, request, jsonify, g, Response
+import click
+from flask import Flask, render_template, request, jsonify, g, Response, redirect, url_for
 import requests
 
 # For PDF generation
@@ -23,6 +36,13 @@ try:
 except ImportError:
     PDF_AVAILABLE = False
 
+# For offline IP range databases
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 app = Flask(__name__)
 
 # --- Config ---
@@ -38,54 +58,1579 @@ HEADERS = {"User-Agent": "OSINT-Portal-Demo/1.0"}
 TIMEOUT = 6
 MAX_WORKERS = 6
 CACHE_TTL = 60  # seconds for demo caching
+DOMAIN_CACHE_TTL = int(os.environ.get("DOMAIN_CACHE_TTL", 3600))  # seconds; domain facts change slowly
+DOMAIN_CACHE_MAX = int(os.environ.get("DOMAIN_CACHE_MAX", 50000))
 
 # --- Simple in-memory cache: username -> (timestamp, result_json) ---
 _cache = {}
 
 # --- DB helpers ---
+# history.db is shared by every gunicorn worker. Connections run in WAL mode
+# with a busy timeout so readers never block the writer, and history inserts
+# go through an in-process queue that a background thread writes in batched
+# transactions. At most HISTORY_FLUSH_INTERVAL seconds (or HISTORY_BATCH_MAX
+# rows) of history can be lost if a worker is killed; the queue is drained
+# on normal shutdown.
 DB_PATH = "history.db"
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", 10000))
+HISTORY_FLUSH_INTERVAL = float(os.environ.get("HISTORY_FLUSH_INTERVAL", 0.5))
+HISTORY_BATCH_MAX = int(os.environ.get("HISTORY_BATCH_MAX", 500))
+HISTORY_QUEUE_MAX = int(os.environ.get("HISTORY_QUEUE_MAX", 10000))
+HISTORY_WRITE_RETRIES = 3  # attempts per batch before rows are written one by one
+
+# Summary fields materialized on every history row at write time, so the
+# history list never has to load or decompress full results
+HISTORY_SUMMARY_COLUMNS = (
+    ("result_type", "TEXT"),
+    ("found_count", "INTEGER"),
+    ("risk_level", "TEXT"),
+    ("provider_status", "TEXT"),
+)
+
+HISTORY_SUMMARY_SYNC_BACKFILL = 5000
+
+# Full-text search over history (targets plus selected result fields) needs
+# SQLite's FTS5 extension, which every CPython build since 3.9 bundles.
+try:
+    sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE fts5_probe USING fts5(x)")
+    HISTORY_FTS_AVAILABLE = True
+except sqlite3.OperationalError:
+    HISTORY_FTS_AVAILABLE = False
+HISTORY_SEARCH_TARGET_WEIGHT = 5.0
+
+_db_schema_ready = set()  # DB paths whose schema this process has ensured
+_db_schema_lock = threading.Lock()
+
+def connect_db(path=None):
+    """Open a connection with the WAL/busy-timeout pragmas every worker uses."""
+    path = path or DB_PATH
+    db = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    db.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    # Lets retention hand freed pages back in small steps. Only takes effect on a new
+    # file (before WAL mode writes the header) or at the next VACUUM of an existing one
+    db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")  # WAL stays consistent; only the last commits can roll back on power loss
+    db.execute("PRAGMA temp_store = MEMORY")
+    db.execute("PRAGMA cache_size = -16000")  # KiB
+    if path not in _db_schema_ready:
+        # gunicorn never runs __main__, so the first connection in each worker ensures the schema
+        with _db_schema_lock:
+            if path not in _db_schema_ready:
+                ensure_schema(db)
+                _db_schema_ready.add(path)
+                _backfill_history_indexes(db, path)
+                if path == DB_PATH:
+                    _ensure_history_retention()
+    return db
+
+def _backfill_history_indexes(db, path):
+    """Summarize and search-index rows written before those existed.
+
+    Type filters, sorts and search need every row covered, so small backlogs
+    are filled before the first query and large ones on a background thread.
+    """
+    pending = db.execute(
+        "SELECT COUNT(*) FROM (SELECT 1 FROM history WHERE result_type IS NULL OR target_key IS NULL LIMIT ?)",
+        (HISTORY_SUMMARY_SYNC_BACKFILL + 1,)
+    ).fetchone()[0]
+    # The search and identifier backfills run newest-first, so unindexed rows are always the ids below the oldest indexed one
+    floors = [_identifier_index_floor(db)] + ([_history_fts_floor(db)] if HISTORY_FTS_AVAILABLE else [])
+    for floor in floors:
+        pending += db.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM history WHERE id < ? LIMIT ?)", (floor, HISTORY_SUMMARY_SYNC_BACKFILL + 1)
+        ).fetchone()[0]
+    if not pending:
+        return
+
+    def backfill():
+        backfill_history_summaries(path)
+        backfill_history_target_keys(path)
+        backfill_identifier_index(path)
+        if HISTORY_FTS_AVAILABLE:
+            backfill_history_search(path)
+    if pending > HISTORY_SUMMARY_SYNC_BACKFILL:
+        threading.Thread(target=backfill, name="history-backfill", daemon=True).start()
+    else:
+        backfill()
 
 def get_db():
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = sqlite3.connect(DB_PATH)
+        db = g._database = connect_db()
         db.row_factory = sqlite3.Row
     return db
 
-def init_db():
-    db = sqlite3.connect(DB_PATH)
+def ensure_schema(db):
     c = db.cursor()
     c.execute(
-        "CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, result_json TEXT, checked_at DATETIME)"
+        "CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, result_json TEXT, checked_at DATETIME, blob_hash TEXT, "
+        "result_type TEXT, found_count INTEGER, risk_level TEXT, provider_status TEXT)"
     )
     c.execute(
         "CREATE TABLE IF NOT EXISTS watchlist (id INTEGER PRIMARY KEY AUTOINCREMENT, item TEXT UNIQUE, item_type TEXT, added_at DATETIME, last_checked DATETIME)"
     )
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS result_blobs (hash TEXT PRIMARY KEY, codec TEXT NOT NULL, raw_size INTEGER NOT NULL, data BLOB NOT NULL)"
+    )
+    # Databases created before result blobs / summary columns existed
+    columns = {row[1] for row in c.execute("PRAGMA table_info(history)")}
+    if "blob_hash" not in columns:
+        c.execute("ALTER TABLE history ADD COLUMN blob_hash TEXT")
+    for column, column_type in HISTORY_SUMMARY_COLUMNS:
+        if column not in columns:
+            c.execute(f"ALTER TABLE history ADD COLUMN {column} {column_type}")
+    if "target_key" not in columns:
+        c.execute("ALTER TABLE history ADD COLUMN target_key TEXT")
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS identifier_index (key TEXT NOT NULL, history_id INTEGER NOT NULL, relation TEXT NOT NULL, "
+        "PRIMARY KEY (key, history_id)) WITHOUT ROWID"
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS identifier_by_history ON identifier_index (history_id)")
+    if HISTORY_FTS_AVAILABLE:
+        if not c.execute("SELECT 1 FROM sqlite_master WHERE name = 'history_fts'").fetchone():
+            c.execute(
+                "CREATE VIRTUAL TABLE history_fts USING fts5(target, fields, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+            # Matches on the target outrank matches in extracted fields
+            c.execute(f"INSERT INTO history_fts (history_fts, rank) VALUES ('rank', 'bm25({HISTORY_SEARCH_TARGET_WEIGHT}, 1.0)')")
+    # One index per history list ordering (see HISTORY_SORTS) so every page is an index range scan
+    c.execute("CREATE INDEX IF NOT EXISTS history_by_checked_at ON history (checked_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS history_by_type ON history (result_type, checked_at DESC, id DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS history_by_target ON history (username)")
+    c.execute("CREATE INDEX IF NOT EXISTS history_by_type_target ON history (result_type, username)")
+    c.execute("CREATE INDEX IF NOT EXISTS history_by_target_key ON history (target_key, result_type, checked_at DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS history_by_blob ON history (blob_hash)")
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS history_archive (id INTEGER PRIMARY KEY AUTOINCREMENT, month TEXT NOT NULL, result_type TEXT NOT NULL, "
+        "path TEXT NOT NULL UNIQUE, rows INTEGER NOT NULL, first_id INTEGER NOT NULL, last_id INTEGER NOT NULL, bytes INTEGER NOT NULL, archived_at DATETIME)"
+    )
+    if not c.execute("SELECT 1 FROM sqlite_master WHERE name = 'history_stats'").fetchone():
+        c.execute(
+            "CREATE TABLE history_stats (day TEXT NOT NULL, result_type TEXT NOT NULL, risk_level TEXT NOT NULL, "
+            "searches INTEGER NOT NULL, found INTEGER NOT NULL, found_items INTEGER NOT NULL, "
+            "PRIMARY KEY (day, result_type, risk_level)) WITHOUT ROWID"
+        )
+        # Seed from rows summarized so far; backfill_history_summaries counts the rest as it fills them
+        c.execute(
+            "INSERT INTO history_stats SELECT substr(checked_at, 1, 10), result_type, COALESCE(risk_level, ''), "
+            "COUNT(*), SUM(found_count > 0), COALESCE(SUM(found_count), 0) FROM history "
+            "WHERE result_type IS NOT NULL GROUP BY 1, 2, 3"
+        )
     db.commit()
+
+def init_db():
+    db = connect_db()
     db.close()
 
+# --- Result blob storage ---
+# Investigation results are stored once per distinct document in
+# result_blobs, keyed by the SHA-256 of their JSON, compressed with zlib and
+# a preset dictionary of the keys and OSINT URL prefixes every result
+# repeats. History rows reference blobs through blob_hash; rows written
+# before blobs existed keep inline result_json until `flask --app app
+# history-compress` migrates them. The dictionary is part of the
+# "zlib-d1" codec and must never change; a new dictionary needs a new codec.
+RESULT_BLOB_CODEC = "zlib-d1"
+RESULT_BLOB_LEVEL = 6
+RESULT_BLOB_CACHE_SIZE = 256  # decompressed documents kept per process
+
+_RESULT_BLOB_DICT_KEYS = (
+    "url", "exists", "likely", "note", "type", "confidence", "name", "ok", "found", "Reddit",
+    "GitHub", "Instagram", "data", "valid", "StackOverflow", "Twitter/X", "phone_check", "number",
+    "local_format", "international_format", "country_name", "location", "carrier", "line_type",
+    "country_code", "risk_level", "TikTok", "LinkedIn", "domain", "country_prefix",
+    "validation_sources", "risk_assessment", "risk_factors", "trust_score", "recommendations",
+    "linkedin_search", "length", "pattern", "account_age", "estimated_creation",
+    "estimated_age_days", "profile_analysis", "reverse_search_urls", "engagement_metrics",
+    "estimated_followers", "estimated_following", "activity_level", "username_results", "profiles",
+    "domain_analysis", "is_educational", "is_government", "is_corporate", "google_search",
+    "timezone", "country", "source", "clean_number", "carrier_info", "location_info",
+    "social_media_links", "additional_data", "search_urls", "truecaller_search", "whocalld_search",
+    "phonevalidator", "freecarrierlookup", "facebook_search", "telegram_search", "whatsapp_check",
+    "format_analysis", "is_mobile", "is_landline", "is_tollfree", "is_premium",
+    "search_variations", "timezone_info", "circle", "operator_type", "osint_search_urls", "email",
+    "local_part", "mx_records", "social_media", "breach_check", "reputation_score", "whois",
+    "securitytrails", "virustotal", "urlvoid", "facebook", "linkedin", "twitter", "instagram",
+    "github", "reddit", "breach_count", "has_mail_service", "domain_reputation", "is_disposable",
+    "provider_type", "security_features", "https_supported", "security_headers", "ssl_grade",
+    "breach_intelligence", "email_hash", "sha1_hash", "estimated_breach_risk", "hibp_check_url",
+    "dehashed_search_url", "breach_analysis", "social_media_presence", "gravatar", "profile_url",
+    "hash", "platform_likely_presence", "Facebook", "Twitter", "YouTube"
+)
+_RESULT_BLOB_DICT_URLS = (
+    "https://twitter.com/", "https://www.instagram.com/", "https://www.reddit.com/user/",
+    "https://github.com/", "https://www.google.com/search?q=", "https://www.linkedin.com/in/",
+    "https://stackoverflow.com/users/", "https://www.facebook.com/", "https://yandex.com/",
+    "https://wa.me/", "https://t.me/", "https://www.tiktok.com/@", "https://haveibeenpwned.com/account/",
+    "https://www.dehashed.com/search?query=", "https://www.truecaller.com/search/", "https://whocalld.com/",
+    "https://www.bing.com/search?q=", "https://whois.net/", "https://securitytrails.com/",
+    "https://www.virustotal.com/gui/", "https://www.urlvoid.com/", "https://duckduckgo.com/?q=",
+    "https://www.shodan.io/host/", "https://search.censys.io/hosts/", "https://www.abuseipdb.com/check/",
+    "https://ipinfo.io/"
+)
+# zlib favours the end of the dictionary, so the most common keys go last
+RESULT_BLOB_ZDICT_V1 = (
+    "".join(f'"{url}' for url in _RESULT_BLOB_DICT_URLS)
+    + "".join(f'"{key}": ' for key in reversed(_RESULT_BLOB_DICT_KEYS))
+    + '"exists": false, "ok": true, "data": {"confidence": "Medium""confidence": "High""likely": true, '
+    + '"found": false, "Unknown", null, "risk_level": "Low", '
+).encode("utf-8")
+
+def encode_result_blob(json_text):
+    """(hash, codec, raw_size, compressed bytes) for a serialized result."""
+    raw = json_text.encode("utf-8")
+    compressor = zlib.compressobj(RESULT_BLOB_LEVEL, zdict=RESULT_BLOB_ZDICT_V1)
+    return hashlib.sha256(raw).hexdigest(), RESULT_BLOB_CODEC, len(raw), compressor.compress(raw) + compressor.flush()
+
+def decode_result_blob(codec, data):
+    if codec == "zlib-d1":
+        decompressor = zlib.decompressobj(zdict=RESULT_BLOB_ZDICT_V1)
+        return (decompressor.decompress(data) + decompressor.flush()).decode("utf-8")
+    raise ValueError(f"Unknown result blob codec: {codec}")
+
+def store_result_blobs(db, json_texts):
+    """Insert each distinct document once; returns the blob hashes in input order."""
+    encoded = [encode_result_blob(text) for text in json_texts]
+    db.executemany(
+        "INSERT OR IGNORE INTO result_blobs (hash, codec, raw_size, data) VALUES (?, ?, ?, ?)",
+        {blob[0]: blob for blob in encoded}.values()
+    )
+    return [blob[0] for blob in encoded]
+
+@functools.lru_cache(maxsize=RESULT_BLOB_CACHE_SIZE)
+def _load_result_blob(db_path, blob_hash):
+    db = connect_db(db_path)
+    try:
+        row = db.execute("SELECT codec, data FROM result_blobs WHERE hash = ?", (blob_hash,)).fetchone()
+    finally:
+        db.close()
+    if row is None:
+        raise KeyError(f"Missing result blob {blob_hash}")
+    return decode_result_blob(row[0], row[1])
+
+def load_history_result(row):
+    """Parsed result for a history row (blob or legacy inline JSON), decompressed on demand."""
+    if row["blob_hash"]:
+        return json.loads(_load_result_blob(DB_PATH, row["blob_hash"]))
+    return json.loads(row["result_json"])
+
+def migrate_history_blobs(db_path=None, batch_size=500, vacuum=True):
+    """Convert inline history results to blobs in place; returns (rows migrated, bytes before, bytes after)."""
+    db = connect_db(db_path)
+    try:
+        page_size = db.execute("PRAGMA page_size").fetchone()[0]
+        before = db.execute("PRAGMA page_count").fetchone()[0] * page_size
+        migrated, last_id = 0, 0
+        while True:
+            rows = db.execute(
+                "SELECT id, result_json FROM history WHERE blob_hash IS NULL AND result_json IS NOT NULL AND id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            with db:
+                hashes = store_result_blobs(db, [row[1] for row in rows])
+                db.executemany(
+                    "UPDATE history SET blob_hash = ?, result_json = NULL WHERE id = ?",
+                    [(blob_hash, row[0]) for blob_hash, row in zip(hashes, rows)]
+                )
+            migrated += len(rows)
+            last_id = rows[-1][0]
+        if vacuum and migrated:
+            db.execute("VACUUM")
+        after = db.execute("PRAGMA page_count").fetchone()[0] * page_size
+        return migrated, before, after
+    finally:
+        db.close()
+
+@app.cli.command("history-compress")
+@click.option("--db", "db_path", default=None, type=click.Path(exists=True, dir_okay=False), help="Database file (defaults to DB_PATH).")
+@click.option("--batch-size", default=500, show_default=True, help="Rows converted per transaction.")
+@click.option("--vacuum/--no-vacuum", default=True, show_default=True, help="Reclaim freed pages afterwards.")
+def history_compress_command(db_path, batch_size, vacuum):
+    """Move inline history results into compressed, deduplicated blobs."""
+    migrated, before, after = migrate_history_blobs(db_path, batch_size, vacuum)
+    click.echo(f"Migrated {migrated} history rows; database {before // 1024} KiB -> {after // 1024} KiB")
+
+# --- History summaries ---
+# Result shapes saved to history: {"type": ..., "<type>_check": {"ok", "data"}}
+# from /api/check, bare data dicts from the *-enhanced endpoints, and legacy
+# rows that are only a {platform: {"exists", "url"}} mapping.
+_HISTORY_PAYLOAD_KEYS = {
+    "email": "email_check", "phone": "phone_check", "ip": "ip_check",
+    "name": "name_check", "enhanced_username": "enhanced_check",
+}
+
+def _history_target_type(target):
+    """Same fallback detection as getItemType() in static/app.js."""
+    target = target or ""
+    if "@" in target:
+        return "email"
+    if re.match(r"^\+?\d+", target):
+        return "phone"
+    if re.match(r"^\d+\.\d+\.\d+\.\d+$", target) or (":" in target and re.match(r"^[0-9a-fA-F:]+$", target)):
+        return "ip"
+    if len(target.split(" ")) >= 2:
+        return "name"
+    return "username"
+
+def _is_platform_map(value):
+    return isinstance(value, dict) and bool(value) and all(isinstance(v, dict) and "exists" in v for v in value.values())
+
+def summarize_history_result(target, result):
+    """(result_type, found_count, risk_level, provider_status) for a saved result."""
+    if not isinstance(result, dict):
+        return _history_target_type(target), 0, None, "error"
+
+    result_type = result.get("type")
+    if not isinstance(result_type, str):
+        if "domain_analysis" in result and "email" in result:
+            result_type = "email"
+        elif "clean_number" in result:
+            result_type = "phone"
+        elif "geolocation" in result and "ip" in result:
+            result_type = "ip"
+        elif _is_platform_map(result):
+            result_type = "username"
+        else:
+            result_type = _history_target_type(target)
+
+    if result_type == "bulk_search":
+        failed, successful = result.get("failed") or 0, result.get("successful") or 0
+        status = "ok" if not failed else ("partial" if successful else "error")
+        return result_type, successful, None, status
+
+    if result_type == "username":
+        platforms = result.get("username_results", result)
+        found = sum(1 for p in platforms.values() if isinstance(p, dict) and p.get("exists")) if _is_platform_map(platforms) else 0
+        return result_type, found, None, "ok"
+
+    payload = result.get(_HISTORY_PAYLOAD_KEYS.get(result_type, ""), result)
+    if not isinstance(payload, dict):
+        return result_type, 0, None, "error"
+    if "ok" in payload:
+        if not payload.get("ok"):
+            return result_type, 0, None, "error"
+        payload = payload.get("data") or {}
+    elif payload.get("error"):
+        return result_type, 0, None, "error"
+
+    if result_type == "enhanced_username":
+        platforms = payload.get("platform_results")
+        found = sum(1 for p in platforms.values() if p.get("exists")) if _is_platform_map(platforms) else 0
+    else:
+        # One successful lookup, as the history stats have always counted it
+        found = 1
+
+    risk_level = None
+    for section in ("risk_assessment", "security_analysis"):
+        level = (payload.get(section) or {}).get("risk_level")
+        if isinstance(level, str):
+            risk_level = level
+            break
+    return result_type, found, risk_level, "ok"
+
+def _load_history_result_from(db, row):
+    try:
+        if row["blob_hash"]:
+            blob = db.execute("SELECT codec, data FROM result_blobs WHERE hash = ?", (row["blob_hash"],)).fetchone()
+            return json.loads(decode_result_blob(blob[0], blob[1])) if blob else None
+        return json.loads(row["result_json"]) if row["result_json"] else None
+    except (ValueError, TypeError):
+        return None
+
+def store_history_summaries(db, rows):
+    """Set summary columns from (id, checked_at, summary) triples in one transaction; returns rows updated.
+
+    Every worker backfills, and list reads fill rows as they show them; only
+    the writer whose UPDATE lands counts the row in history_stats.
+    """
+    with db:
+        changed = []
+        for history_id, checked_at, summary in rows:
+            cur = db.execute(
+                "UPDATE history SET result_type = ?, found_count = ?, risk_level = ?, provider_status = ? "
+                "WHERE id = ? AND result_type IS NULL",
+                tuple(summary) + (history_id,)
+            )
+            if cur.rowcount:
+                changed.append((checked_at, summary))
+        record_history_stats(db, changed)
+    return len(changed)
+
+def backfill_history_summaries(db_path=None, batch_size=500):
+    """Fill summary columns on rows written before they existed; returns rows updated."""
+    db = connect_db(db_path)
+    db.row_factory = sqlite3.Row
+    try:
+        updated, last_id = 0, 0
+        while True:
+            rows = db.execute(
+                "SELECT id, username, checked_at, result_json, blob_hash FROM history WHERE result_type IS NULL AND id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            updated += store_history_summaries(db, [
+                (row["id"], row["checked_at"], summarize_history_result(row["username"], _load_history_result_from(db, row)))
+                for row in rows
+            ])
+            last_id = rows[-1]["id"]
+        return updated
+    finally:
+        db.close()
+
+def normalize_history_target(target):
+    """Lookup key for a history target: trimmed, lowercased, single-spaced."""
+    return " ".join((target or "").split()).lower()
+
+def backfill_history_target_keys(db_path=None, batch_size=5000):
+    """Set target_key on rows written before it existed; returns rows updated."""
+    db = connect_db(db_path)
+    try:
+        updated = 0
+        while True:
+            rows = db.execute("SELECT id, username FROM history WHERE target_key IS NULL LIMIT ?", (batch_size,)).fetchall()
+            if not rows:
+                break
+            with db:
+                db.executemany("UPDATE history SET target_key = ? WHERE id = ?", [(normalize_history_target(u), i) for i, u in rows])
+            updated += len(rows)
+        return updated
+    finally:
+        db.close()
+
+@app.cli.command("history-summarize")
+@click.option("--db", "db_path", default=None, type=click.Path(exists=True, dir_okay=False), help="Database file (defaults to DB_PATH).")
+@click.option("--batch-size", default=500, show_default=True, help="Rows updated per transaction.")
+def history_summarize_command(db_path, batch_size):
+    """Materialize history summary columns and target keys for rows saved before they existed."""
+    updated = backfill_history_summaries(db_path, batch_size)
+    keyed = backfill_history_target_keys(db_path)
+    click.echo(f"Summarized {updated} history rows; keyed {keyed}")
+
+# --- History search ---
+# history_fts holds one row per history row (same rowid): the target and the
+# text of the result fields analysts pivot on. Rows are added in the same
+# transaction as the history insert.
+HISTORY_SEARCH_KEYS = frozenset({
+    "email", "domain", "related_domains", "mx_records", "nameservers", "registrar", "registrant",
+    "abuse_contact", "carrier", "circle", "operator_type", "country", "country_name", "city",
+    "region", "location", "isp", "org", "organization", "asn", "network_range", "hostname",
+    "hostnames", "ptr_record", "ip", "international_format", "clean_number", "breaches",
+    "common_breach_sources",
+})
+HISTORY_SEARCH_MAX_CHARS = 4000
+HISTORY_SEARCH_PAGE_MAX = 100
+# bm25 ranking costs a few microseconds per matching row; broader queries
+# (e.g. a country every phone result shares) are returned newest first instead
+HISTORY_SEARCH_RANK_LIMIT = int(os.environ.get("HISTORY_SEARCH_RANK_LIMIT", 5000))
+
+def extract_history_search_text(result):
+    """Distinct values of HISTORY_SEARCH_KEYS anywhere in a result, space-separated."""
+    values = {}
+    stack = [(result, None, 0)]
+    while stack:
+        node, key, depth = stack.pop()
+        if isinstance(node, dict):
+            if depth < 8:
+                stack.extend((value, k, depth + 1) for k, value in node.items())
+        elif isinstance(node, list):
+            if depth < 8:
+                stack.extend((value, key, depth + 1) for value in node)
+        elif key in HISTORY_SEARCH_KEYS and isinstance(node, str):
+            value = node.strip()
+            if value and value != "Unknown" and not value.startswith(("http://", "https://")):
+                values.setdefault(value, None)
+    return " ".join(values)[:HISTORY_SEARCH_MAX_CHARS]
+
+def _history_fts_floor(db):
+    """Lowest history id in the search index (one past the newest row when it is empty)."""
+    row = db.execute("SELECT rowid FROM history_fts ORDER BY rowid LIMIT 1").fetchone()
+    if row:
+        return row[0]
+    return (db.execute("SELECT MAX(id) FROM history").fetchone()[0] or 0) + 1
+
+def backfill_history_search(db_path=None, batch_size=500):
+    """Index rows written before history_fts existed, newest first; returns rows indexed."""
+    db = connect_db(db_path)
+    db.row_factory = sqlite3.Row
+    try:
+        indexed = 0
+        while True:
+            rows = db.execute(
+                "SELECT id, username, result_json, blob_hash FROM history WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (_history_fts_floor(db), batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO history_fts (rowid, target, fields) VALUES (?, ?, ?)",
+                    [(row["id"], row["username"], extract_history_search_text(_load_history_result_from(db, row))) for row in rows]
+                )
+            indexed += len(rows)
+        return indexed
+    finally:
+        db.close()
+
+def _history_search_query(text):
+    """FTS5 query for free text: every word must match, a trailing * matches prefixes."""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+def search_history(text, limit=20, offset=0, types=None, order="relevance"):
+    """One page of history hits for free text, with a highlighted snippet of the matching fields.
+
+    Returns (hits, next offset or None, order used). Relevance order falls
+    back to "recent" when more than HISTORY_SEARCH_RANK_LIMIT rows match.
+    """
+    if not HISTORY_FTS_AVAILABLE:
+        raise RuntimeError("History search needs SQLite FTS5")
+    if order not in ("relevance", "recent"):
+        raise ValueError(f"Unknown order: {order}")
+    query = _history_search_query(text)
+    if not query:
+        raise ValueError("Search text required")
+    limit = max(1, min(int(limit), HISTORY_SEARCH_PAGE_MAX))
+    offset = max(0, int(offset))
+    conditions, params = ["history_fts MATCH ?"], [query]
+    if types:
+        conditions.append(f"h.result_type IN ({','.join('?' * len(types))})")
+        params.extend(types)
+
+    flush_history()
+    db = get_db()
+    try:
+        if order == "relevance":
+            matches = db.execute(
+                "SELECT COUNT(*) FROM (SELECT 1 FROM history_fts WHERE history_fts MATCH ? LIMIT ?)",
+                (query, HISTORY_SEARCH_RANK_LIMIT + 1)
+            ).fetchone()[0]
+            if matches > HISTORY_SEARCH_RANK_LIMIT:
+                order = "recent"
+        rows = db.execute(
+            f"SELECT {', '.join('h.' + field for field in HISTORY_SUMMARY_FIELDS.split(', '))}, "
+            "snippet(history_fts, 1, '**', '**', '...', 12) AS snippet, "
+            + ("rank AS score " if order == "relevance" else "NULL AS score ")
+            + f"FROM history_fts JOIN history h ON h.id = history_fts.rowid WHERE {' AND '.join(conditions)} "
+            + ("ORDER BY rank" if order == "relevance" else "ORDER BY history_fts.rowid DESC")
+            + " LIMIT ? OFFSET ?",
+            params + [limit + 1, offset]
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        raise ValueError(f"Invalid search: {e}") from e
+    hits = [dict(row) for row in rows[:limit]]
+    return hits, (offset + limit if len(rows) > limit else None), order
+
+@app.cli.command("history-index")
+@click.option("--db", "db_path", default=None, type=click.Path(exists=True, dir_okay=False), help="Database file (defaults to DB_PATH).")
+@click.option("--batch-size", default=500, show_default=True, help="Rows indexed per transaction.")
+def history_index_command(db_path, batch_size):
+    """Add history rows saved before full-text search existed to the search index."""
+    indexed = backfill_history_search(db_path, batch_size)
+    click.echo(f"Indexed {indexed} history rows")
+
+# --- Identifier index ---
+# Maps canonical forms of every history target to the rows that mention
+# them, so "+91 98765 43210", "09876543210" and "919876543210" (or
+# john.doe@gmail.com and johndoe+osint@gmail.com) find each other's prior
+# investigations. Each row is keyed by its target's canonical form
+# (relation "canonical") and by the canonical forms of the target's
+# generated variations (relation "variation"). Keys are prefixed with the
+# identifier kind: "phone:+919876543210", "email:johndoe@gmail.com",
+# "username:john_doe", "ip:2001:db8::1", "name:john smith".
+PHONE_DEFAULT_COUNTRY_CODE = os.environ.get("PHONE_DEFAULT_COUNTRY_CODE", "91")
+PHONE_DEFAULT_NATIONAL_LENGTH = int(os.environ.get("PHONE_DEFAULT_NATIONAL_LENGTH", 10))
+GMAIL_DOMAINS = ("gmail.com", "googlemail.com")
+IDENTIFIER_MATCH_LIMIT = 100
+
+def canonical_phone(value):
+    """E.164 form of a phone number; national numbers use PHONE_DEFAULT_COUNTRY_CODE."""
+    value = (value or "").strip()
+    digits = re.sub(r"\D", "", value)
+    if value.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]  # international call prefix
+    elif digits.startswith("0") and len(digits) == PHONE_DEFAULT_NATIONAL_LENGTH + 1:
+        digits = PHONE_DEFAULT_COUNTRY_CODE + digits[1:]  # trunk prefix
+    elif len(digits) == PHONE_DEFAULT_NATIONAL_LENGTH:
+        digits = PHONE_DEFAULT_COUNTRY_CODE + digits
+    if not 7 <= len(digits) <= 15:
+        return None
+    return f"+{digits}"
+
+def canonical_email(value):
+    """Lowercased address without +tags; Gmail local parts also lose their dots."""
+    local, _, domain = (value or "").strip().lower().rpartition("@")
+    local = local.split("+", 1)[0]
+    if domain in GMAIL_DOMAINS:
+        local, domain = local.replace(".", ""), "gmail.com"
+    if not local or "." not in domain:
+        return None
+    return f"{local}@{domain}"
+
+def identifier_kind(target):
+    """Kind of a target as /api/check detects it, except that any IP address spelling counts as an IP."""
+    import ipaddress
+    try:
+        ipaddress.ip_address(target)
+        return "ip"
+    except ValueError:
+        return check_input_type(target)
+
+def canonical_identifier(target, kind=None):
+    """'kind:canonical' key for a target (kind from identifier_kind when omitted), or None."""
+    target = (target or "").strip()
+    kind = kind or identifier_kind(target)
+    if kind == "email":
+        value = canonical_email(target)
+    elif kind == "phone":
+        value = canonical_phone(target)
+    elif kind == "ip":
+        import ipaddress
+        try:
+            value = str(ipaddress.ip_address(target))
+        except ValueError:
+            value = None
+    elif kind == "name":
+        value = " ".join(target.split()).lower()
+    else:
+        kind = "username"
+        value = target.lstrip("@").lower()
+        if not value or any(ch.isspace() for ch in value):
+            value = None
+    return f"{kind}:{value}" if value else None
+
+def identifier_keys(target):
+    """{key: relation} for a target: its canonical form plus its variations' canonical forms."""
+    target = (target or "").strip()
+    kind = identifier_kind(target)
+    canonical = canonical_identifier(target, kind)
+    if canonical is None:
+        return {}
+    keys = {canonical: "canonical"}
+    if kind == "email":
+        local, _, domain = target.rpartition("@")
+        variations = generate_email_variations(local, domain)
+    elif kind == "phone":
+        variations = generate_phone_variations(canonical_phone(target)[1:])
+    else:
+        variations = []
+    for variation in variations:
+        key = canonical_identifier(variation, kind)
+        if key:
+            keys.setdefault(key, "variation")
+    return keys
+
+def _identifier_index_floor(db):
+    """Lowest history id in the identifier index (one past the newest row when it is empty)."""
+    row = db.execute("SELECT MIN(history_id) FROM identifier_index").fetchone()
+    if row[0] is not None:
+        return row[0]
+    return (db.execute("SELECT MAX(id) FROM history").fetchone()[0] or 0) + 1
+
+def _identifier_rows(history_id, target):
+    return [(key, history_id, relation) for key, relation in identifier_keys(target).items()]
+
+def backfill_identifier_index(db_path=None, batch_size=2000):
+    """Index targets of rows written before the identifier index existed, newest first; returns rows indexed."""
+    db = connect_db(db_path)
+    try:
+        indexed = 0
+        while True:
+            rows = db.execute(
+                "SELECT id, username FROM history WHERE id < ? ORDER BY id DESC LIMIT ?", (_identifier_index_floor(db), batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            keyed = [entry for history_id, target in rows for entry in _identifier_rows(history_id, target)]
+            if not any(entry[1] == rows[-1][0] for entry in keyed):
+                # Targets without identifiers still need a marker so the floor moves past them
+                keyed.append(("", rows[-1][0], "none"))
+            with db:
+                db.executemany("INSERT OR IGNORE INTO identifier_index (key, history_id, relation) VALUES (?, ?, ?)", keyed)
+            indexed += len(rows)
+        return indexed
+    finally:
+        db.close()
+
+def find_prior_investigations(value, limit=IDENTIFIER_MATCH_LIMIT):
+    """History summaries whose targets share a canonical identifier with value, newest first.
+
+    Each match has matched_key and relation: "canonical" when the stored
+    target is the same identifier, "variation" when only a generated
+    variation of one side matches the other.
+    """
+    query_keys = identifier_keys(value)
+    if not query_keys:
+        return [], []
+    canonical = next(key for key, relation in query_keys.items() if relation == "canonical")
+    flush_history()
+    db = get_db()
+    rows = db.execute(
+        f"SELECT key, history_id, relation FROM identifier_index WHERE key IN ({','.join('?' * len(query_keys))}) "
+        "ORDER BY history_id DESC LIMIT ?",
+        list(query_keys) + [limit * 4]
+    ).fetchall()
+    best = {}
+    for key, history_id, relation in rows:
+        exact = key == canonical and relation == "canonical"
+        if history_id not in best or (exact and best[history_id][1] != "canonical"):
+            best[history_id] = (key, "canonical" if exact else "variation")
+    ids = sorted(best, reverse=True)[:limit]
+    if not ids:
+        return list(query_keys), []
+    summaries = {
+        row["id"]: _history_summary(row) for row in db.execute(
+            f"SELECT {HISTORY_SUMMARY_FIELDS} FROM history WHERE id IN ({','.join('?' * len(ids))})", ids
+        )
+    }
+    matches = []
+    for history_id in ids:
+        if history_id in summaries:
+            key, relation = best[history_id]
+            matches.append({**summaries[history_id], "matched_key": key, "relation": relation})
+    return list(query_keys), matches
+
+# --- History retention and archive ---
+# History is retained per investigation type in calendar-month partitions:
+# once a whole month is older than the type's retention, its rows are
+# written to a gzipped JSONL file under HISTORY_ARCHIVE_DIR/<YYYY-MM>/,
+# recorded in history_archive, and deleted from the live tables in short
+# batches so the history writer is never blocked for long. Freed pages are
+# returned with incremental vacuum. Archived rows stay readable through
+# query_history_archive and /api/history/<id>. Retention 0 keeps a type forever.
+HISTORY_ARCHIVE_DIR = os.environ.get("HISTORY_ARCHIVE_DIR", os.path.join("data", "history_archive"))
+HISTORY_RETENTION_DEFAULT_DAYS = int(os.environ.get("HISTORY_RETENTION_DAYS", 365))
+HISTORY_RETENTION_DAYS = {
+    kind: int(os.environ.get(f"HISTORY_RETENTION_{kind.upper()}", default))
+    for kind, default in (
+        ("email", HISTORY_RETENTION_DEFAULT_DAYS),
+        ("phone", HISTORY_RETENTION_DEFAULT_DAYS),
+        ("ip", 180),
+        ("name", HISTORY_RETENTION_DEFAULT_DAYS),
+        ("username", HISTORY_RETENTION_DEFAULT_DAYS),
+        ("enhanced_username", HISTORY_RETENTION_DEFAULT_DAYS),
+        ("bulk_search", 90),
+    )
+}
+HISTORY_RETENTION_INTERVAL = int(os.environ.get("HISTORY_RETENTION_INTERVAL", 6 * 3600))  # 0 disables the background pass
+HISTORY_RETENTION_BATCH = 500
+HISTORY_VACUUM_STEP_PAGES = 256
+
+_history_retention_thread = None
+
+def _next_month(month):
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+def expired_history_partitions(db, now=None):
+    """[(result_type, month, rows)] for whole months past their type's retention, oldest first."""
+    now = now or datetime.utcnow()
+    partitions = []
+    for kind, days in HISTORY_RETENTION_DAYS.items():
+        if days <= 0:
+            continue
+        # Only months that ended before the retention cutoff's month began
+        cutoff = (now - timedelta(days=days)).strftime("%Y-%m") + "-01"
+        partitions.extend(
+            (kind, month, rows) for month, rows in db.execute(
+                "SELECT substr(checked_at, 1, 7) AS month, COUNT(*) FROM history WHERE result_type = ? AND checked_at < ? "
+                "GROUP BY month ORDER BY month", (kind, cutoff)
+            )
+        )
+    partitions.sort(key=lambda p: p[1])
+    return partitions
+
+def _archive_line(db, row):
+    entry = {key: row[key] for key in HISTORY_SUMMARY_FIELDS.split(", ")}
+    entry["result"] = _load_history_result_from(db, row)
+    return json.dumps(entry, separators=(",", ":")) + "\n"
+
+def archive_history_partition(db, result_type, month):
+    """Write one month of one type to a gzipped JSONL file and drop it from the live tables.
+
+    Returns the history_archive row as a dict, or None if the partition is empty.
+    """
+    start, end = f"{month}-01", f"{_next_month(month)}-01"
+    where = "result_type = ? AND checked_at >= ? AND checked_at < ?"
+    first_id, last_id, rows = db.execute(f"SELECT MIN(id), MAX(id), COUNT(*) FROM history WHERE {where}", (result_type, start, end)).fetchone()
+    if not rows:
+        return None
+
+    # Named by id range, so an interrupted run rewrites the same file
+    os.makedirs(os.path.join(HISTORY_ARCHIVE_DIR, month), exist_ok=True)
+    path = os.path.join(HISTORY_ARCHIVE_DIR, month, f"{result_type}-{first_id}-{last_id}.jsonl.gz")
+    tmp_path = path + ".tmp"
+    written, after = 0, ("", 0)
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as fh:
+        while True:
+            # Walk the month along the (result_type, checked_at, id) index
+            batch = db.execute(
+                f"SELECT {HISTORY_SUMMARY_FIELDS}, result_json, blob_hash FROM history WHERE {where} AND (checked_at, id) > (?, ?) "
+                "AND id <= ? ORDER BY checked_at, id LIMIT ?",
+                (result_type, start, end) + after + (last_id, HISTORY_RETENTION_BATCH)
+            ).fetchall()
+            if not batch:
+                break
+            fh.writelines(_archive_line(db, row) for row in batch)
+            written += len(batch)
+            after = (batch[-1]["checked_at"], batch[-1]["id"])
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, path)
+    archive = {
+        "month": month, "result_type": result_type, "path": path, "rows": written,
+        "first_id": first_id, "last_id": last_id, "bytes": os.path.getsize(path),
+        "archived_at": datetime.utcnow().isoformat(),
+    }
+    with db:
+        db.execute(
+            "INSERT OR REPLACE INTO history_archive (month, result_type, path, rows, first_id, last_id, bytes, archived_at) "
+            "VALUES (:month, :result_type, :path, :rows, :first_id, :last_id, :bytes, :archived_at)", archive
+        )
+
+    # Short delete transactions; the history writer gets the lock between batches
+    while True:
+        batch = db.execute(
+            f"SELECT id, blob_hash FROM history WHERE {where} AND id <= ? LIMIT ?", (result_type, start, end, last_id, HISTORY_RETENTION_BATCH)
+        ).fetchall()
+        if not batch:
+            break
+        ids = [row["id"] for row in batch]
+        hashes = list({row["blob_hash"] for row in batch if row["blob_hash"]})
+        marks = ",".join("?" * len(ids))
+        with db:
+            db.execute(f"DELETE FROM history WHERE id IN ({marks})", ids)
+            db.execute(f"DELETE FROM identifier_index WHERE history_id IN ({marks})", ids)
+            if HISTORY_FTS_AVAILABLE:
+                db.execute(f"DELETE FROM history_fts WHERE rowid IN ({marks})", ids)
+            if hashes:
+                # Blobs are shared by identical results; drop only those nothing references any more
+                db.execute(
+                    f"DELETE FROM result_blobs WHERE hash IN ({','.join('?' * len(hashes))}) "
+                    "AND NOT EXISTS (SELECT 1 FROM history WHERE history.blob_hash = result_blobs.hash)", hashes
+                )
+        time.sleep(0)
+    return archive
+
+def incremental_vacuum(db, step_pages=HISTORY_VACUUM_STEP_PAGES):
+    """Return free pages to the filesystem a step at a time; returns pages freed (0 unless auto_vacuum is INCREMENTAL)."""
+    if db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    freed = 0
+    while True:
+        free = db.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            return freed
+        db.execute(f"PRAGMA incremental_vacuum({min(step_pages, free)})").fetchall()
+        freed += min(step_pages, free)
+
+def run_history_retention(db_path=None, now=None, dry_run=False):
+    """Archive and drop every expired partition; returns the partitions handled.
+
+    Only one process runs retention at a time; others return [] immediately.
+    """
+    os.makedirs(HISTORY_ARCHIVE_DIR, exist_ok=True)
+    with open(os.path.join(HISTORY_ARCHIVE_DIR, ".retention.lock"), "a") as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return []
+        flush_history()
+        db = connect_db(db_path)
+        db.row_factory = sqlite3.Row
+        try:
+            partitions = expired_history_partitions(db, now)
+            if dry_run:
+                return [{"result_type": kind, "month": month, "rows": rows} for kind, month, rows in partitions]
+            archived = []
+            for kind, month, _ in partitions:
+                archive = archive_history_partition(db, kind, month)
+                if archive:
+                    archived.append(archive)
+            if archived:
+                incremental_vacuum(db)
+            return archived
+        finally:
+            db.close()
+
+def _history_retention_loop():
+    time.sleep(60)  # let the worker finish starting up
+    while True:
+        try:
+            for archive in run_history_retention():
+                app.logger.info(
+                    "Archived %d %s history rows from %s to %s", archive["rows"], archive["result_type"], archive["month"], archive["path"]
+                )
+        except Exception:
+            app.logger.exception("History retention failed")
+        time.sleep(HISTORY_RETENTION_INTERVAL)
+
+def _ensure_history_retention():
+    global _history_retention_thread
+    if HISTORY_RETENTION_INTERVAL > 0 and _history_retention_thread is None:
+        _history_retention_thread = threading.Thread(target=_history_retention_loop, name="history-retention", daemon=True)
+        _history_retention_thread.start()
+
+def _archive_partitions(db, types=None, since=None, until=None):
+    conditions, params = [], []
+    if types:
+        conditions.append(f"result_type IN ({','.join('?' * len(types))})")
+        params.extend(types)
+    if since:
+        conditions.append("month >= ?")
+        params.append(since[:7])
+    if until:
+        conditions.append("month <= ?")
+        params.append(until[:7])
+    return db.execute(
+        "SELECT * FROM history_archive" + (f" WHERE {' AND '.join(conditions)}" if conditions else "") + " ORDER BY month DESC, first_id DESC",
+        params
+    ).fetchall()
+
+def _read_archive(path):
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                yield json.loads(line)
+    except FileNotFoundError:
+        return
+
+def query_history_archive(types=None, prefix=None, since=None, until=None, limit=100):
+    """(partitions, entries): archived history summaries matching the filters, newest month first.
+
+    Archives are scanned on demand; only partitions overlapping the type and
+    time filters are opened.
+    """
+    db = get_db()
+    partitions = [dict(row) for row in _archive_partitions(db, types, since, until)]
+    entries, seen = [], set()
+    for partition in partitions:
+        if len(entries) >= limit:
+            break
+        for entry in _read_archive(partition["path"]):
+            if entry["id"] in seen:
+                continue
+            if prefix and not entry["username"].startswith(prefix):
+                continue
+            if (since and entry["checked_at"] < since) or (until and entry["checked_at"] >= until):
+                continue
+            seen.add(entry["id"])
+            entry.pop("result", None)
+            entries.append({**entry, "archived": True})
+            if len(entries) >= limit:
+                break
+    return partitions, entries
+
+def load_archived_history_entry(entry_id):
+    """Full archived entry by history id, or None."""
+    for partition in get_db().execute(
+        "SELECT path FROM history_archive WHERE first_id <= ? AND last_id >= ?", (entry_id, entry_id)
+    ).fetchall():
+        for entry in _read_archive(partition["path"]):
+            if entry["id"] == entry_id:
+                return {**entry, "archived": True}
+    return None
+
+@app.cli.command("history-retention")
+@click.option("--db", "db_path", default=None, type=click.Path(exists=True, dir_okay=False), help="Database file (defaults to DB_PATH).")
+@click.option("--dry-run", is_flag=True, help="List expired partitions without archiving them.")
+@click.option("--enable-incremental-vacuum", is_flag=True, help="Run a one-off VACUUM first so the file can shrink incrementally.")
+def history_retention_command(db_path, dry_run, enable_incremental_vacuum):
+    """Archive history partitions past their retention and drop them from the database."""
+    if enable_incremental_vacuum and not dry_run:
+        db = connect_db(db_path)
+        db.execute("VACUUM")
+        db.close()
+    partitions = run_history_retention(db_path, dry_run=dry_run)
+    for partition in partitions:
+        target = f" -> {partition['path']}" if "path" in partition else ""
+        click.echo(f"{partition['month']} {partition['result_type']}: {partition['rows']} rows{target}")
+    click.echo(f"{'Expired' if dry_run else 'Archived'} {len(partitions)} partitions")
+
+# --- History write-behind queue ---
+_history_queue = queue.Queue(maxsize=HISTORY_QUEUE_MAX)
+_history_writer = None
+_history_writer_lock = threading.Lock()
+# Rows enqueued and rows handled by the writer; flush_history waits for the
+# second to reach the first as it was when the flush began
+_history_enqueued = 0
+_history_written = 0
+_history_progress = threading.Condition()
+# Set by flush_history to end the writer's current batch window early; the
+# wake marker unblocks a writer waiting on an empty queue
+_history_flush_requested = threading.Event()
+_HISTORY_WAKE = object()
+
+def _write_history_rows(rows):
+    db = connect_db()
+    try:
+        with db:
+            hashes = store_result_blobs(db, [row[1] for row in rows])
+            search_rows, identifier_rows = [], []
+            for (username, _, checked_at, summary, search_text), blob_hash in zip(rows, hashes):
+                cur = db.execute(
+                    "INSERT INTO history (username, checked_at, blob_hash, target_key, result_type, found_count, risk_level, provider_status) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (username, checked_at, blob_hash, normalize_history_target(username)) + summary
+                )
+                search_rows.append((cur.lastrowid, username, search_text))
+                identifier_rows.extend(_identifier_rows(cur.lastrowid, username) or [("", cur.lastrowid, "none")])
+            db.executemany("INSERT OR IGNORE INTO identifier_index (key, history_id, relation) VALUES (?, ?, ?)", identifier_rows)
+            record_history_stats(db, [(checked_at, summary) for _, _, checked_at, summary, _ in rows])
+            if HISTORY_FTS_AVAILABLE:
+                db.executemany("INSERT INTO history_fts (rowid, target, fields) VALUES (?, ?, ?)", search_rows)
+    finally:
+        db.close()
+
+def _history_writer_loop():
+    global _history_written
+    while True:
+        row = _history_queue.get()
+        rows = [] if row is _HISTORY_WAKE else [row]
+        deadline = time.monotonic() + HISTORY_FLUSH_INTERVAL
+        while len(rows) < HISTORY_BATCH_MAX and not _history_flush_requested.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                row = _history_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if row is _HISTORY_WAKE:
+                break
+            rows.append(row)
+        _history_flush_requested.clear()
+        if not rows:
+            continue
+        try:
+            _write_history_batch(rows)
+        finally:
+            with _history_progress:
+                _history_written += len(rows)
+                _history_progress.notify_all()
+
+def _write_history_batch(rows):
+    """Write a batch, retrying transient errors; rows that still fail are written one by one."""
+    for attempt in range(HISTORY_WRITE_RETRIES):
+        try:
+            _write_history_rows(rows)
+            return
+        except sqlite3.Error as e:
+            app.logger.warning("History batch write failed (%d rows, attempt %d): %s", len(rows), attempt + 1, e)
+            time.sleep(0.1 * 2 ** attempt)
+    for row in rows:
+        try:
+            _write_history_rows([row])
+        except sqlite3.Error as e:
+            app.logger.error("Dropping history row for '%s' after repeated write failures: %s", row[0], e)
+
+def _ensure_history_writer():
+    global _history_writer
+    if _history_writer is None:
+        with _history_writer_lock:
+            if _history_writer is None:
+                thread = threading.Thread(target=_history_writer_loop, name="history-writer", daemon=True)
+                thread.start()
+                atexit.register(flush_history)
+                _history_writer = thread
+
 def save_history(username, result_json):
+    """Queue a history row; it is committed by the writer thread within HISTORY_FLUSH_INTERVAL."""
+    global _history_enqueued
+    # Serialize now so later changes to shared result dicts cannot leak into the row
+    row = (username, json.dumps(result_json), datetime.utcnow().isoformat(),
+           summarize_history_result(username, result_json), extract_history_search_text(result_json))
+    _ensure_history_writer()
+    deadline = time.monotonic() + 1
+    while True:
+        # Counted under the same lock as the put, so the count matches queue order
+        with _history_progress:
+            try:
+                _history_queue.put_nowait(row)
+                _history_enqueued += 1
+                return
+            except queue.Full:
+                pass
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(0.01)
+    # Writer is behind; fall back to a direct insert rather than dropping the row
+    _write_history_batch([row])
+
+def flush_history():
+    """Block until every history row queued before this call is committed."""
+    if _history_writer is not None:
+        with _history_progress:
+            target = _history_enqueued
+            if _history_written >= target:
+                return
+            _history_flush_requested.set()
+            try:
+                _history_queue.put_nowait(_HISTORY_WAKE)
+            except queue.Full:
+                pass  # a full queue fills the batch without waiting anyway
+            _history_progress.wait_for(lambda: _history_written >= target)
+
+HISTORY_SUMMARY_FIELDS = "id, username, checked_at, " + ", ".join(column for column, _ in HISTORY_SUMMARY_COLUMNS)
+
+def _history_summary(row):
+    return {key: row[key] for key in row.keys()}
+
+# Orderings for the history list: (column, direction) pairs ending in id, so
+# every ordering is total and can be resumed from the last row of a page
+HISTORY_SORTS = {
+    "recent": (("checked_at", "DESC"), ("id", "DESC")),
+    "oldest": (("checked_at", "ASC"), ("id", "ASC")),
+    "alphabetical": (("username", "ASC"), ("id", "ASC")),
+    "type": (("result_type", "ASC"), ("checked_at", "DESC"), ("id", "DESC")),
+}
+# Sort columns that can be NULL (result_type until backfill_history_summaries reaches the row)
+HISTORY_NULLABLE_SORT_COLUMNS = ("result_type",)
+HISTORY_PAGE_DEFAULT = 10
+HISTORY_PAGE_MAX = 200
+
+def encode_history_cursor(sort, row):
+    values = [row[column] for column, _ in HISTORY_SORTS[sort]]
+    return base64.urlsafe_b64encode(json.dumps([sort] + values).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_history_cursor(cursor):
+    """(sort, key values) from a cursor returned by fetch_history; raises ValueError if malformed."""
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(decoded, list) or not decoded or decoded[0] not in HISTORY_SORTS or len(decoded) != len(HISTORY_SORTS[decoded[0]]) + 1:
+        raise ValueError("Invalid cursor")
+    return decoded[0], decoded[1:]
+
+def _keyset_branches(order, values, nullable=()):
+    """Disjoint (condition, params) branches covering the rows after `values` in `order`.
+
+    A single row-value comparison when every column sorts the same way, so
+    SQLite seeks straight into the index; mixed directions split into one
+    seekable branch per leading column instead of an OR that scans. Columns
+    in `nullable` get explicit NULL branches, since NULL fails every
+    comparison: SQLite sorts NULLs first ascending and last descending.
+    """
+    if len({direction for _, direction in order}) == 1 and not any(column in nullable for column, _ in order):
+        op = "<" if order[0][1] == "DESC" else ">"
+        columns = ", ".join(column for column, _ in order)
+        return [(f"({columns}) {op} ({', '.join('?' * len(order))})", list(values))]
+    (column, direction), rest = order[0], order[1:]
+    equal = "IS" if column in nullable else "="
+    branches = [
+        (f"{column} {equal} ? AND {condition}", [values[0]] + params)
+        for condition, params in (_keyset_branches(rest, values[1:], nullable) if rest else [])
+    ]
+    if values[0] is None:
+        return branches + ([(f"{column} IS NOT NULL", [])] if direction == "ASC" else [])
+    op = "<" if direction == "DESC" else ">"
+    branches.append((f"{column} {op} ?", [values[0]]))
+    if column in nullable and direction == "DESC":
+        branches.append((f"{column} IS NULL", []))
+    return branches
+
+def _prefix_upper_bound(prefix):
+    # Every string starting with prefix sorts below prefix + U+10FFFF under BINARY collation
+    return prefix + "\U0010ffff"
+
+def _fill_missing_summaries(db, items, store=True):
+    """Summarize rows saved before summary columns existed, once, as they are read.
+
+    With store=False the summaries are only filled into items, leaving the
+    rows for backfill_history_summaries.
+    """
+    pending = [item for item in items if item["result_type"] is None]
+    if not pending:
+        return
+    full = {r["id"]: r for r in db.execute(
+        f"SELECT id, result_json, blob_hash FROM history WHERE id IN ({','.join('?' * len(pending))})",
+        [item["id"] for item in pending]
+    )}
+    updates = []
+    for item in pending:
+        summary = summarize_history_result(item["username"], _load_history_result_from(db, full[item["id"]]))
+        item.update(zip((column for column, _ in HISTORY_SUMMARY_COLUMNS), summary))
+        updates.append((item["id"], item["checked_at"], summary))
+    if store:
+        store_history_summaries(db, updates)
+
+def _history_filter_conditions(types=None, prefix=None, since=None, until=None):
+    """WHERE conditions and parameters shared by history listings and exports."""
+    conditions, params = [], []
+    if types:
+        conditions.append(f"result_type IN ({','.join('?' * len(types))})")
+        params.extend(types)
+    if prefix:
+        conditions.append("username >= ? AND username < ?")
+        params.extend([prefix, _prefix_upper_bound(prefix)])
+    if since:
+        conditions.append("checked_at >= ?")
+        params.append(since)
+    if until:
+        conditions.append("checked_at < ?")
+        params.append(until)
+    return conditions, params
+
+def fetch_history(limit=HISTORY_PAGE_DEFAULT, cursor=None, types=None, prefix=None, since=None, until=None, sort="recent"):
+    """One page of history summaries and the cursor for the next page (None on the last page).
+
+    types filters on result_type, prefix on the start of the target (case-sensitive),
+    and since/until on checked_at as an inclusive/exclusive ISO-8601 UTC range.
+    Full results come from fetch_history_entry.
+    """
+    if cursor:
+        sort, after = decode_history_cursor(cursor)
+    elif sort not in HISTORY_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    order = HISTORY_SORTS[sort]
+    limit = max(1, min(int(limit), HISTORY_PAGE_MAX))
+
+    conditions, params = _history_filter_conditions(types, prefix, since, until)
+    order_by = ", ".join(f"{column} {direction}" for column, direction in order)
+    nullable = [column for column, _ in order if column in HISTORY_NULLABLE_SORT_COLUMNS]
+    branches = _keyset_branches(order, after, nullable) if cursor else [(None, [])]
+    selects, query_params = [], []
+    for condition, branch_params in branches:
+        where = conditions + ([condition] if condition else [])
+        selects.append(
+            f"SELECT * FROM (SELECT {HISTORY_SUMMARY_FIELDS} FROM history"
+            + (f" WHERE {' AND '.join(where)}" if where else "")
+            + f" ORDER BY {order_by} LIMIT ?)"
+        )
+        query_params += params + branch_params + [limit + 1]
+
+    flush_history()  # read-your-writes within this worker
     db = get_db()
-    db.execute(
-        "INSERT INTO history (username, result_json, checked_at) VALUES (?, ?, ?)",
-        (username, json.dumps(result_json), datetime.utcnow().isoformat()),
+    sql = selects[0] if len(selects) == 1 else " UNION ALL ".join(selects) + f" ORDER BY {order_by} LIMIT ?"
+    rows = db.execute(sql, query_params + ([limit + 1] if len(selects) > 1 else [])).fetchall()
+    out = [_history_summary(r) for r in rows[:limit]]
+    # The cursor keeps the row's position as sorted, before its summary is filled in
+    next_cursor = encode_history_cursor(sort, rows[limit - 1]) if len(rows) > limit else None
+    # Stored summaries would move rows sorted on a nullable column to a later
+    # page, showing them twice; the backfill stores those instead
+    _fill_missing_summaries(db, out, store=not nullable)
+    return out, next_cursor
+
+def fetch_history_entry(entry_id):
+    """Summary plus full result for one history entry, or None."""
+    flush_history()
+    db = get_db()
+    row = db.execute(
+        f"SELECT {HISTORY_SUMMARY_FIELDS}, result_json, blob_hash FROM history WHERE id = ?", (entry_id,)
+    ).fetchone()
+    if row is None:
+        return load_archived_history_entry(entry_id)
+    entry = {key: row[key] for key in HISTORY_SUMMARY_FIELDS.split(", ")}
+    entry["result"] = load_history_result(row)
+    return entry
+
+# --- History statistics ---
+# Dashboard counters live in history_stats, one row per UTC day, result type
+# and risk level, incremented in the same transaction as each history insert.
+# Reading them touches at most days x types x risk levels rows however long
+# the history is. Retention archives history rows but leaves the counters
+# alone: they count every investigation ever run.
+HISTORY_STATS_DAYS = 30  # daily buckets returned by default
+HISTORY_STATS_MAX_DAYS = 366
+
+def record_history_stats(db, rows):
+    """Add (checked_at, summary) pairs to the counters; call inside the inserting transaction."""
+    buckets = {}
+    for checked_at, (result_type, found_count, risk_level, _) in rows:
+        if result_type is None:
+            continue
+        key = (checked_at[:10], result_type, risk_level or "")
+        searches, found, found_items = buckets.get(key, (0, 0, 0))
+        buckets[key] = (searches + 1, found + (1 if found_count else 0), found_items + (found_count or 0))
+    db.executemany(
+        "INSERT INTO history_stats (day, result_type, risk_level, searches, found, found_items) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (day, result_type, risk_level) DO UPDATE SET searches = searches + excluded.searches, "
+        "found = found + excluded.found, found_items = found_items + excluded.found_items",
+        [key + counts for key, counts in buckets.items()]
     )
-    db.commit()
 
-def fetch_history(limit=10):
+def _stats_counts(searches, found, found_items):
+    return {
+        "searches": searches,
+        "found": found,
+        "found_items": found_items,
+        "found_rate": round(found / searches, 4) if searches else 0.0,
+    }
+
+def fetch_history_stats(days=HISTORY_STATS_DAYS):
+    """Totals, per-type counts, risk distribution and the last `days` daily buckets.
+
+    found counts searches with at least one hit; found_items sums the hits.
+    """
+    days = max(1, min(int(days), HISTORY_STATS_MAX_DAYS))
+    flush_history()
     db = get_db()
-    cur = db.execute("SELECT username, result_json, checked_at FROM history ORDER BY id DESC LIMIT ?", (limit,))
-    rows = cur.fetchall()
-    out = []
-    for r in rows:
-        result_data = json.loads(r["result_json"])
-        
-        out.append({
-            "username": r["username"],
-            "result": result_data,
-            "checked_at": r["checked_at"]
-        })
-    return out
+    by_type, risk_levels = {}, {}
+    totals = [0, 0, 0]
+    for row in db.execute(
+        "SELECT result_type, risk_level, SUM(searches), SUM(found), SUM(found_items) FROM history_stats GROUP BY result_type, risk_level"
+    ):
+        counts = row[2:]
+        type_counts = by_type.setdefault(row[0], [0, 0, 0])
+        for i, value in enumerate(counts):
+            type_counts[i] += value
+            totals[i] += value
+        if row[1]:
+            risk_levels[row[1]] = risk_levels.get(row[1], 0) + row[2]
+    first_day = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    daily = {}
+    for day, result_type, searches, found in db.execute(
+        "SELECT day, result_type, SUM(searches), SUM(found) FROM history_stats WHERE day >= ? "
+        "GROUP BY day, result_type ORDER BY day", (first_day,)
+    ):
+        bucket = daily.setdefault(day, {"day": day, "searches": 0, "found": 0, "by_type": {}})
+        bucket["searches"] += searches
+        bucket["found"] += found
+        bucket["by_type"][result_type] = searches
+    return {
+        "totals": _stats_counts(*totals),
+        "by_type": {result_type: _stats_counts(*counts) for result_type, counts in by_type.items()},
+        "risk_levels": risk_levels,
+        "daily": list(daily.values()),
+    }
+
+# --- History export ---
+# /api/history/export streams every matching history row as NDJSON (summary
+# plus full result) or CSV (summary columns), walking the table by id in
+# batches so memory stays flat however large the export is. Each export is
+# pinned to a snapshot id, which makes its bytes reproducible: a planning
+# pass over the summary columns and stored result sizes (no decompression)
+# fixes the length up front and records a checkpoint every
+# HISTORY_EXPORT_CHECKPOINT rows, so a Range request resumes from the
+# nearest checkpoint instead of regenerating everything before it.
+HISTORY_EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+HISTORY_EXPORT_COLUMNS = ["id", "target", "checked_at", "result_type", "found_count", "risk_level", "provider_status"]
+HISTORY_EXPORT_BATCH = 500
+HISTORY_EXPORT_CHECKPOINT = 1024  # rows between resume points
+HISTORY_EXPORT_CHUNK = 64 * 1024  # bytes per streamed chunk
+HISTORY_EXPORT_PLAN_CACHE = 8
+HISTORY_EXPORT_PLAN_TTL = 900  # seconds
+
+_history_export_plans = {}  # plan key -> (created, plan)
+_history_export_plans_lock = threading.Lock()
+
+def _history_export_select(db, with_results, conditions, params, after_id, snapshot):
+    """The next batch of export rows after after_id, up to the snapshot id."""
+    columns = (
+        f"{HISTORY_SUMMARY_FIELDS}, result_json, blob_hash, codec, data" if with_results else
+        f"{HISTORY_SUMMARY_FIELDS}, CASE WHEN blob_hash IS NOT NULL THEN raw_size "
+        "ELSE length(CAST(result_json AS BLOB)) END AS result_size"
+    )
+    where = conditions + ["id > ?", "id <= ?"]
+    return db.execute(
+        f"SELECT {columns} FROM history LEFT JOIN result_blobs ON result_blobs.hash = history.blob_hash "
+        f"WHERE {' AND '.join(where)} ORDER BY id LIMIT ?",
+        params + [after_id, snapshot, HISTORY_EXPORT_BATCH]
+    ).fetchall()
+
+def _history_export_line(fmt, row, result=b"null"):
+    """One encoded export line; NDJSON lines embed the stored result JSON verbatim."""
+    summary = [row["id"], row["username"], row["checked_at"], row["result_type"],
+               row["found_count"], row["risk_level"], row["provider_status"]]
+    if fmt == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(summary)
+        return buffer.getvalue().encode("utf-8")
+    head = json.dumps(dict(zip(HISTORY_EXPORT_COLUMNS, summary)), ensure_ascii=False)[:-1]
+    return head.encode("utf-8") + b', "result": ' + result + b"}\n"
+
+def _history_export_header(fmt):
+    if fmt == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(HISTORY_EXPORT_COLUMNS)
+        return buffer.getvalue().encode("utf-8")
+    return b""
+
+def plan_history_export(db, fmt, conditions, params, snapshot):
+    """Length, row count and resume checkpoints [(byte offset, after id)] of an export.
+
+    The plan is only exact while every row is summarized; "stable" is False
+    when a summary backfill could still change a row's bytes.
+    """
+    offset = len(_history_export_header(fmt))
+    checkpoints, rows_seen, after_id, stable = [(offset, 0)], 0, 0, True
+    while True:
+        rows = _history_export_select(db, False, conditions, params, after_id, snapshot)
+        if not rows:
+            break
+        for row in rows:
+            if rows_seen and rows_seen % HISTORY_EXPORT_CHECKPOINT == 0:
+                checkpoints.append((offset, after_id))
+            stable = stable and row["result_type"] is not None
+            line = _history_export_line(fmt, row, b"")
+            offset += len(line) + ((row["result_size"] or 4) if fmt == "ndjson" else 0)
+            rows_seen += 1
+            after_id = row["id"]
+    return {"length": offset, "rows": rows_seen, "checkpoints": checkpoints, "stable": stable}
+
+def _cached_history_export_plan(db, key, fmt, conditions, params, snapshot):
+    now = time.monotonic()
+    with _history_export_plans_lock:
+        cached = _history_export_plans.get(key)
+        if cached and now - cached[0] < HISTORY_EXPORT_PLAN_TTL:
+            return cached[1]
+    plan = plan_history_export(db, fmt, conditions, params, snapshot)
+    if plan["stable"]:
+        with _history_export_plans_lock:
+            if len(_history_export_plans) >= HISTORY_EXPORT_PLAN_CACHE:
+                del _history_export_plans[min(_history_export_plans, key=lambda k: _history_export_plans[k][0])]
+            _history_export_plans[key] = (now, plan)
+    return plan
+
+def stream_history_export(fmt, conditions, params, snapshot, start=0, stop=None, checkpoint=(0, 0)):
+    """Yield the export's bytes in [start, stop), generating from a checkpoint at or before start."""
+    db = connect_db()
+    db.row_factory = sqlite3.Row
+    try:
+        offset, after_id = checkpoint
+        pending, size = [], 0
+        if offset == 0:
+            header = _history_export_header(fmt)
+            pending.append(header[start:stop])
+            size, offset = len(pending[0]), len(header)
+        while stop is None or offset < stop:
+            rows = _history_export_select(db, fmt == "ndjson", conditions, params, after_id, snapshot)
+            if not rows:
+                break
+            for row in rows:
+                result = b""
+                if fmt == "ndjson":
+                    if row["blob_hash"]:
+                        result = decode_result_blob(row["codec"], row["data"]).encode("utf-8") if row["data"] is not None else b"null"
+                    else:
+                        result = (row["result_json"] or "null").encode("utf-8")
+                line = _history_export_line(fmt, row, result)
+                end = offset + len(line)
+                if end > start:
+                    line = line[max(0, start - offset):None if stop is None else stop - offset]
+                    pending.append(line)
+                    size += len(line)
+                offset, after_id = end, row["id"]
+                if stop is not None and offset >= stop:
+                    break
+            if size >= HISTORY_EXPORT_CHUNK:
+                yield b"".join(pending)
+                pending, size = [], 0
+        if pending:
+            yield b"".join(pending)
+    finally:
+        db.close()
+
+# --- History result cache ---
+# Recent successful results in history are served instead of re-running an
+# investigation. Per type: results younger than `fresh` seconds are served
+# as-is; up to `stale` seconds they are served while a background refresh
+# runs; older ones are recomputed. A stale age of 0 disables reuse for that
+# type. Configure with HISTORY_CACHE_<TYPE>="fresh,stale".
+def _history_cache_policy(kind, fresh, stale):
+    value = os.environ.get(f"HISTORY_CACHE_{kind.upper()}")
+    if value:
+        fresh, stale = (int(part) for part in value.split(","))
+    return fresh, max(fresh, stale)
+
+HISTORY_CACHE_POLICY = {
+    "email": _history_cache_policy("email", 3600, 86400),
+    "phone": _history_cache_policy("phone", 86400, 7 * 86400),  # carrier data rarely changes
+    "ip": _history_cache_policy("ip", 900, 6 * 3600),  # reputation and feeds move quickly
+    "name": _history_cache_policy("name", 3600, 86400),
+    "username": _history_cache_policy("username", 1800, 6 * 3600),
+}
+HISTORY_CACHE_CANDIDATES = 5  # recent rows checked for one that satisfies the request's options
+
+_history_refresh_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("HISTORY_REFRESH_WORKERS", 2)))
+_history_refreshing = set()  # (kind, target_key) with a refresh in flight
+_history_refreshing_lock = threading.Lock()
+
+def _history_cache_payload(kind, result):
+    """The investigation data inside a stored result, whichever endpoint saved it."""
+    if not isinstance(result, dict):
+        return None
+    if kind == "username":
+        platforms = result.get("username_results", result)
+        return platforms if _is_platform_map(platforms) else None
+    payload = result.get(_HISTORY_PAYLOAD_KEYS[kind], result)
+    if isinstance(payload, dict) and "ok" in payload:
+        payload = payload.get("data") if payload.get("ok") else None
+    return payload if isinstance(payload, dict) and payload else None
+
+def find_cached_result(kind, target, accept=None):
+    """(data, cache info) from the newest reusable history row for target, or None.
+
+    accept(data) can reject rows computed with fewer options than the request asks for.
+    """
+    fresh, stale = HISTORY_CACHE_POLICY.get(kind, (0, 0))
+    if stale <= 0:
+        return None
+    now = datetime.utcnow()
+    cutoff = (now - timedelta(seconds=stale)).isoformat()
+    # No flush_history(): waiting out the writer's batch window would cost every
+    # check, and a row still queued was saved by a lookup that just ran anyway
+    rows = get_db().execute(
+        "SELECT id, checked_at, result_json, blob_hash FROM history "
+        "WHERE target_key = ? AND result_type = ? AND checked_at >= ? AND provider_status = 'ok' "
+        "ORDER BY checked_at DESC LIMIT ?",
+        (normalize_history_target(target), kind, cutoff, HISTORY_CACHE_CANDIDATES)
+    ).fetchall()
+    for row in rows:
+        payload = _history_cache_payload(kind, load_history_result(row))
+        if payload is None or (accept is not None and not accept(payload)):
+            continue
+        age = max(0, int((now - datetime.fromisoformat(row["checked_at"])).total_seconds()))
+        return payload, {
+            "history_id": row["id"],
+            "checked_at": row["checked_at"],
+            "age_seconds": age,
+            "stale": age > fresh,
+            "refreshing": False,
+        }
+    return None
+
+def schedule_history_refresh(kind, target, investigate):
+    """Run investigate() (which saves its own history row) in the background, once per target at a time."""
+    key = (kind, normalize_history_target(target))
+    with _history_refreshing_lock:
+        if key in _history_refreshing:
+            return True
+        _history_refreshing.add(key)
+
+    def refresh():
+        try:
+            with app.app_context():
+                investigate()
+        except Exception as e:
+            app.logger.warning("Background refresh of %s '%s' failed: %s", kind, target, e)
+        finally:
+            with _history_refreshing_lock:
+                _history_refreshing.discard(key)
+    _history_refresh_executor.submit(refresh)
+    return True
+
+def serve_cached_result(kind, target, investigate, accept=None):
+    """Cached data and cache info for target (scheduling a refresh when stale), or None."""
+    hit = find_cached_result(kind, target, accept)
+    if hit is None:
+        return None
+    payload, info = hit
+    if info["stale"]:
+        info["refreshing"] = schedule_history_refresh(kind, target, investigate)
+    return payload, info
 
 # --- Watchlist Management ---
 def add_to_watchlist(item, item_type=None):
@@ -1181,6 +2726,9 @@ def enhanced_social_media_check(username):
 # --- Email Investigation Configuration ---
 # HaveIBeenPwned API Configuration
 HIBP_API_KEY = os.environ.get("HIBP_API_KEY") or None  # Get from https://haveibeenpwned.com/API/Key
+# Offline breach corpus index (see build with: flask --app app breach-index-merge)
+BREACH_INDEX_PATH = os.environ.get("BREACH_INDEX_PATH", os.path.join("data", "breach_index.bin"))
+BREACH_INDEX_RELOAD_INTERVAL = int(os.environ.get("BREACH_INDEX_RELOAD_INTERVAL", 30))
 
 # --- Enhanced Email Investigation with Multiple Sources ---
 def is_valid_ip(ip):
@@ -1206,14 +2754,92 @@ def is_valid_email(email):
     email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(email_pattern, email) is not None
 
-def check_email_investigation_enhanced(email):
-    """Enhanced comprehensive email investigation using multiple OSINT sources."""
+# --- Domain analysis cache: domain -> (timestamp, intel) ---
+# Shared by every code path that investigates an email (single, /api/check,
+# bulk and watchlist), so addresses on the same domain reuse one analysis.
+_domain_cache = {}
+_domain_cache_lock = threading.Lock()
+
+def get_domain_intelligence(domain):
+    """Domain-level email analysis, computed once per domain and cached for DOMAIN_CACHE_TTL.
+
+    The returned dict is shared between callers and must be treated as read-only.
+    """
+    key = domain.strip().lower()
+    now = time.time()
+    cache_entry = _domain_cache.get(key)
+    if cache_entry and now - cache_entry[0] < DOMAIN_CACHE_TTL:
+        intel = cache_entry[1]
+        if intel["registration"].get("pending"):
+            # Registration is fetched in the background; swap in a copy once it lands
+            registration = get_domain_registration(key)
+            if not registration.get("pending"):
+                intel = dict(intel, registration=registration)
+                with _domain_cache_lock:
+                    _domain_cache[key] = (cache_entry[0], intel)
+        return intel
+
+    intel = {
+        "domain_analysis": get_enhanced_domain_analysis(key),
+        "is_personal_provider": is_personal_email_provider(key),
+        "is_corporate": is_corporate_domain(key),
+        "is_educational": is_educational_domain(key),
+        "is_government": is_government_domain(key),
+        "is_disposable": is_disposable_email_enhanced(key),
+        "provider_type": get_email_provider_type(key),
+        "related_domains": get_related_domains(key),
+        "timezone_estimate": estimate_timezone_from_domain(key),
+        "registration": get_domain_registration(key),
+    }
+
+    with _domain_cache_lock:
+        if len(_domain_cache) >= DOMAIN_CACHE_MAX:
+            # Drop expired entries first, then the oldest insertions
+            expired = [d for d, (ts, _) in _domain_cache.items() if now - ts >= DOMAIN_CACHE_TTL]
+            for d in expired:
+                _domain_cache.pop(d, None)
+            while len(_domain_cache) >= DOMAIN_CACHE_MAX:
+                _domain_cache.pop(next(iter(_domain_cache)))
+        _domain_cache[key] = (now, intel)
+    return intel
+
+def get_domain_registration(domain):
+    """RDAP registration summary for a domain from the cache.
+
+    {} when unavailable, {"pending": True} while a background lookup runs.
+    """
+    rdap = rdap_lookup("domain", domain, wait=False)
+    if not rdap["ok"]:
+        return {"pending": True} if rdap.get("pending") else {}
+    return dict(rdap["data"], domain_age=rdap_age(rdap["data"]["registration_date"]))
+
+def group_emails_by_domain(items):
+    """Group valid email addresses by lowercased domain, keeping first-seen order."""
+    groups = {}
+    for item in items:
+        if is_valid_email(item):
+            groups.setdefault(item.rsplit('@', 1)[1].lower(), []).append(item)
+    return groups
+
+def check_email_investigation_enhanced(email, domain_intel=None, local_intel=None, lookalikes=False,
+                                      smtp_verify=False, deliverability=None):
+    """Enhanced comprehensive email investigation using multiple OSINT sources.
+
+    With lookalikes=True the domain also gets a typosquat sweep (a few seconds
+    on first use, then cached). With smtp_verify=True the mailbox and its
+    common variations are probed over SMTP; bulk callers pass the address's
+    precomputed verify_email_addresses result as `deliverability` instead.
+    """
     try:
         if not is_valid_email(email):
             return {"ok": False, "error": "Invalid email format"}
         
         # Split email into local and domain parts
         local_part, domain = email.split('@')
+        if domain_intel is None:
+            domain_intel = get_domain_intelligence(domain)
+        if local_intel is None:
+            local_intel = classify_local_part(local_part)
         
         # Initialize comprehensive email investigation result
         email_result = {
@@ -1227,11 +2853,13 @@ def check_email_investigation_enhanced(email):
             "osint_search_urls": {},
             "risk_assessment": {},
             "professional_analysis": {},
-            "additional_intelligence": {}
+            "additional_intelligence": {},
+            "lookalike_domains": {},
+            "deliverability": {}
         }
         
-        # 1. Enhanced Domain Analysis
-        domain_analysis = get_enhanced_domain_analysis(domain)
+        # 1. Enhanced Domain Analysis (cached per domain) with RDAP registration data
+        domain_analysis = dict(domain_intel["domain_analysis"], registration=domain_intel["registration"])
         email_result["domain_analysis"] = domain_analysis
         email_result["validation_sources"].append("Domain Analysis")
         
@@ -1251,19 +2879,37 @@ def check_email_investigation_enhanced(email):
         email_result["validation_sources"].append("OSINT Search URLs")
         
         # 5. Professional Analysis
-        professional_analysis = get_professional_email_analysis(email, domain)
+        professional_analysis = get_professional_email_analysis(email, domain, domain_intel, local_intel)
         email_result["professional_analysis"] = professional_analysis
         email_result["validation_sources"].append("Professional Analysis")
         
         # 6. Risk Assessment
-        risk_assessment = assess_email_risk(email, domain, breach_intel, social_presence)
+        risk_assessment = assess_email_risk(email, domain, breach_intel, social_presence, domain_intel)
         email_result["risk_assessment"] = risk_assessment
         email_result["validation_sources"].append("Risk Assessment")
         
         # 7. Additional Intelligence
-        additional_intel = get_additional_email_intelligence(email, local_part, domain)
+        additional_intel = get_additional_email_intelligence(email, local_part, domain, domain_intel, local_intel)
         email_result["additional_intelligence"] = additional_intel
         
+        # 8. Lookalike domains for phishing triage (throwaway domains are not worth squatting)
+        if lookalikes and not domain_intel["is_disposable"]:
+            email_result["lookalike_domains"] = get_lookalike_domains(domain)
+            email_result["validation_sources"].append("Lookalike Domains")
+        
+        # 9. SMTP deliverability (mailbox existence, catch-all)
+        if deliverability is not None:
+            email_result["deliverability"] = {
+                "address": deliverability,
+                "deliverable_variations": [],
+                "variations_checked": 0,
+                "catch_all": deliverability["catch_all"]
+            }
+        elif smtp_verify:
+            email_result["deliverability"] = verify_email_deliverability(email)
+        if email_result["deliverability"]:
+            email_result["validation_sources"].append("SMTP Verification")
+        
         return {"ok": True, "data": email_result}
         
     except Exception as e:
@@ -1283,6 +2929,7 @@ def check_ip_investigation_enhanced(ip):
             "network_info": {},
             "security_analysis": {},
             "reverse_dns": {},
+            "passive_dns": {},
             "reputation": {},
             "open_ports": {},
             "osint_search_urls": {},
@@ -1310,12 +2957,16 @@ def check_ip_investigation_enhanced(ip):
         reverse_dns_info = get_reverse_dns(ip)
         ip_result["reverse_dns"] = reverse_dns_info
         
-        # 4. Security Analysis
-        security_analysis = analyze_ip_security(ip)
+        # 3b. Passive DNS pivot (local store, no network calls)
+        ip_result["passive_dns"] = pivot_passive_dns_ip(ip)
+        
+        # 4. Security Analysis (one feed index walk shared by 4, 5 and 7)
+        feed_matches = lookup_cidr_feeds(ip)
+        security_analysis = analyze_ip_security(ip, feed_matches)
         ip_result["security_analysis"] = security_analysis
         
         # 5. Reputation Check
-        reputation_info = check_ip_reputation(ip)
+        reputation_info = check_ip_reputation(ip, feed_matches)
         ip_result["reputation"] = reputation_info
         
         # 6. OSINT Search URLs
@@ -1323,7 +2974,7 @@ def check_ip_investigation_enhanced(ip):
         ip_result["osint_search_urls"] = osint_urls
         
         # 7. Threat Intelligence
-        threat_intel = get_ip_threat_intelligence(ip)
+        threat_intel = get_ip_threat_intelligence(ip, feed_matches)
         ip_result["threat_intelligence"] = threat_intel
         
         # 8. Additional Information
@@ -1335,6 +2986,330 @@ def check_ip_investigation_enhanced(ip):
     except Exception as e:
         return {"ok": False, "error": f"IP investigation error: {str(e)}"}
 
+# --- Offline IP geolocation / ASN database ---
+# Range CSVs (DB-IP / iptoasn style "start,end,..." rows, or MaxMind
+# GeoLite2/GeoIP2 "network,..." CIDR blocks mapped by their header row, with
+# City/Country blocks joined to the matching Locations CSV) are compiled by
+# `flask --app app ipdb-build` into sorted NumPy arrays under IPDB_DIR; repeated --geo/--asn files (such as
+# MaxMind's separate IPv4 and IPv6 blocks) are merged into one table. Workers memory-map the active build and
+# pick up a new one when the CURRENT pointer changes, without a restart.
+# IPv6 ranges are keyed on their upper 64 bits.
+IPDB_DIR = os.environ.get("IPDB_DIR", os.path.join("data", "ipdb"))
+IPDB_RELOAD_INTERVAL = int(os.environ.get("IPDB_RELOAD_INTERVAL", 30))
+IPDB_TABLES = ("geo", "asn")
+
+_ipdb = {"build": None, "tables": {}, "checked_at": 0.0}
+_ipdb_lock = threading.Lock()
+
+def ip_to_key(ip):
+    """Map an address to (family, sortable integer key); IPv6 keeps the upper 64 bits."""
+    import ipaddress
+    ip_obj = ipaddress.ip_address(ip.strip())
+    if ip_obj.version == 4:
+        return 4, int(ip_obj)
+    return 6, int(ip_obj) >> 64
+
+def _parse_range_row(row):
+    """Split a CSV row into (family, start_key, end_key, remaining fields)."""
+    import ipaddress
+    first = row[0].strip()
+    if '/' in first:
+        network = ipaddress.ip_network(first, strict=False)
+        start, end, fields = network.network_address, network.broadcast_address, row[1:]
+    else:
+        start, end, fields = ipaddress.ip_address(first), ipaddress.ip_address(row[1].strip()), row[2:]
+    if start.version != end.version:
+        raise ValueError("mixed address families")
+    if start.version == 4:
+        return 4, int(start), int(end), fields
+    return 6, int(start) >> 64, int(end) >> 64, fields
+
+def _geo_record(fields):
+    # DB-IP city lite: continent, country, stateprov, city, latitude, longitude
+    fields = [f.strip() for f in fields] + [''] * 6
+    if fields[0] in ('AF', 'AN', 'AS', 'EU', 'NA', 'OC', 'SA') and len(fields[1]) == 2:
+        fields = fields[1:]  # drop continent
+    lat, lon = fields[3], fields[4]
+    return (fields[0], fields[1], fields[2], float(lat) if lat else 0.0, float(lon) if lon else 0.0)
+
+def _asn_record(fields):
+    # iptoasn: AS_number, country_code, AS_description
+    fields = [f.strip() for f in fields] + [''] * 3
+    return (int(fields[0] or 0), fields[1], fields[2])
+
+def maxmind_locations_path(blocks_path):
+    """The Locations CSV MaxMind ships next to a City/Country blocks file, or None."""
+    directory, name = os.path.split(blocks_path)
+    match = re.match(r"(.*)-Blocks-IPv[46](\.csv(?:\.gz)?)$", name)
+    if not match:
+        return None
+    path = os.path.join(directory, f"{match.group(1)}-Locations-en{match.group(2)}")
+    return path if os.path.exists(path) else None
+
+def load_maxmind_locations(path):
+    """geoname_id -> (country ISO code, first subdivision, city) from a MaxMind Locations CSV."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='ignore', newline='') as fh:
+        return {
+            row["geoname_id"]: (row.get("country_iso_code") or "", row.get("subdivision_1_name") or "", row.get("city_name") or "")
+            for row in csv.DictReader(fh)
+        }
+
+def _maxmind_record_fn(table, header, locations_path):
+    """Record parser for MaxMind blocks, mapping columns by their header names."""
+    column = {name: i - 1 for i, name in enumerate(header)}  # fields exclude the network column
+
+    def field(fields, name):
+        i = column.get(name)
+        return fields[i].strip() if i is not None and i < len(fields) else ""
+
+    if table == "asn":
+        return lambda fields: (
+            int(field(fields, "autonomous_system_number") or 0), "", field(fields, "autonomous_system_organization")
+        )
+    if not locations_path:
+        raise ValueError("MaxMind geolocation blocks need their Locations CSV (--geo-locations)")
+    locations = load_maxmind_locations(locations_path)
+
+    def record(fields):
+        geoname = field(fields, "geoname_id") or field(fields, "registered_country_geoname_id")
+        country, region, city = locations.get(geoname, ("", "", ""))
+        lat, lon = field(fields, "latitude"), field(fields, "longitude")
+        return (country, region, city, float(lat) if lat else 0.0, float(lon) if lon else 0.0)
+    return record
+
+def compile_ip_ranges(paths, record_fn, table=None, locations_path=None):
+    """Compile range files into per-family sorted arrays plus a deduplicated record table.
+
+    All files are merged into one table, e.g. MaxMind's separate IPv4 and
+    IPv6 blocks. A MaxMind header row ("network,...") switches that file
+    to a parser that maps its columns by name; its Locations CSV defaults
+    to the one next to the file.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    records, record_ids = [], {}
+    rows = {4: [], 6: []}
+    for path in paths:
+        delimiter = '\t' if path.endswith(('.tsv', '.tsv.gz')) else ','
+        opener = gzip.open if path.endswith('.gz') else open
+        parse = record_fn
+        with opener(path, 'rt', encoding='utf-8', errors='ignore', newline='') as fh:
+            for row in csv.reader(fh, delimiter=delimiter):
+                if not row or row[0].startswith('#'):
+                    continue
+                if table and row[0].strip().lower() == "network":
+                    parse = _maxmind_record_fn(
+                        table, [c.strip().lower() for c in row],
+                        (locations_path or maxmind_locations_path(path)) if table == "geo" else None
+                    )
+                    continue
+                try:
+                    family, start, end, fields = _parse_range_row(row)
+                    record = parse(fields)
+                except ValueError:
+                    continue  # header or malformed row
+                record_id = record_ids.get(record)
+                if record_id is None:
+                    record_id = record_ids[record] = len(records)
+                    records.append(record)
+                rows[family].append((start, end, record_id))
+
+    arrays = {}
+    for family, dtype in ((4, np.uint32), (6, np.uint64)):
+        rows[family].sort()
+        arrays[f"v{family}_start"] = np.array([r[0] for r in rows[family]], dtype=dtype)
+        arrays[f"v{family}_end"] = np.array([r[1] for r in rows[family]], dtype=dtype)
+        arrays[f"v{family}_rec"] = np.array([r[2] for r in rows[family]], dtype=np.uint32)
+    return arrays, records
+
+def _compile_ip_build(build_dir, current_dir, geo_paths, asn_paths, geo_locations_path):
+    """Write each table into build_dir; returns {table: ranges compiled}."""
+    import shutil
+    counts = {}
+    for table, paths, record_fn in (("geo", geo_paths, _geo_record), ("asn", asn_paths, _asn_record)):
+        if not paths:
+            # Carry the table over unchanged from the active build
+            if current_dir and os.path.isdir(current_dir):
+                for name in os.listdir(current_dir):
+                    if name.startswith(f"{table}_"):
+                        try:
+                            os.link(os.path.join(current_dir, name), os.path.join(build_dir, name))
+                        except OSError:
+                            shutil.copy2(os.path.join(current_dir, name), os.path.join(build_dir, name))
+            continue
+        arrays, records = compile_ip_ranges(paths, record_fn, table, geo_locations_path if table == "geo" else None)
+        for name, array in arrays.items():
+            np.save(os.path.join(build_dir, f"{table}_{name}.npy"), array)
+        with open(os.path.join(build_dir, f"{table}_records.json"), "w", encoding="utf-8") as fh:
+            json.dump(records, fh)
+        counts[table] = len(arrays["v4_start"]) + len(arrays["v6_start"])
+    return counts
+
+def build_ip_database(geo_paths=None, asn_paths=None, ipdb_dir=None, geo_locations_path=None):
+    """Compile range files into a new build directory and atomically make it current.
+
+    Each table is built from all of its files (a path or a list of paths);
+    a table given no files is carried over from the active build. MaxMind
+    City/Country blocks are joined to geo_locations_path, which defaults to
+    the Locations CSV next to each blocks file.
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("numpy is required for the offline IP database (pip install numpy)")
+    import shutil
+    ipdb_dir = ipdb_dir or IPDB_DIR
+    build_name = f"build-{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}"
+    build_dir = os.path.join(ipdb_dir, build_name)
+    os.makedirs(build_dir)
+
+    try:
+        with open(os.path.join(ipdb_dir, "CURRENT")) as fh:
+            current_dir = os.path.join(ipdb_dir, fh.read().strip())
+    except OSError:
+        current_dir = None
+
+    try:
+        counts = _compile_ip_build(build_dir, current_dir, geo_paths, asn_paths, geo_locations_path)
+    except Exception:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    pointer_tmp = os.path.join(ipdb_dir, "CURRENT.tmp")
+    with open(pointer_tmp, "w") as fh:
+        fh.write(build_name)
+    os.replace(pointer_tmp, os.path.join(ipdb_dir, "CURRENT"))
+
+    # Keep the previous build around for workers that have not swapped yet
+    builds = sorted(d for d in os.listdir(ipdb_dir) if d.startswith("build-"))
+    for old in builds[:-2]:
+        shutil.rmtree(os.path.join(ipdb_dir, old), ignore_errors=True)
+    return build_dir, counts
+
+def get_ip_database():
+    """Active IP database snapshot, swapping to a new build when CURRENT changes."""
+    global _ipdb
+    db = _ipdb
+    now = time.time()
+    if not NUMPY_AVAILABLE or now - db["checked_at"] < IPDB_RELOAD_INTERVAL:
+        return db
+
+    with _ipdb_lock:
+        db = _ipdb
+        if now - db["checked_at"] < IPDB_RELOAD_INTERVAL:
+            return db
+        try:
+            with open(os.path.join(IPDB_DIR, "CURRENT")) as fh:
+                build = fh.read().strip()
+        except OSError:
+            build = None
+
+        if build == db["build"]:
+            _ipdb = dict(db, checked_at=now)
+            return _ipdb
+
+        tables = {}
+        if build:
+            build_dir = os.path.join(IPDB_DIR, build)
+            for table in IPDB_TABLES:
+                try:
+                    loaded = {
+                        # Plain ndarray views over the shared read-only mappings
+                        name: np.asarray(np.load(os.path.join(build_dir, f"{table}_{name}.npy"), mmap_mode="r"))
+                        for name in ("v4_start", "v4_end", "v4_rec", "v6_start", "v6_end", "v6_rec")
+                    }
+                    with open(os.path.join(build_dir, f"{table}_records.json"), encoding="utf-8") as fh:
+                        loaded["records"] = json.load(fh)
+                    tables[table] = loaded
+                except (OSError, ValueError) as e:
+                    if not isinstance(e, FileNotFoundError):
+                        print(f"IP database table {table} in {build} not loaded: {e}")
+        _ipdb = {"build": build, "tables": tables, "checked_at": now}
+        return _ipdb
+
+def _lookup_range(table, family, key):
+    starts = table[f"v{family}_start"]
+    # Same-dtype scalar key, otherwise NumPy may cast the whole array to compare
+    idx = int(starts.searchsorted(starts.dtype.type(key), side="right")) - 1
+    if idx < 0 or key > int(table[f"v{family}_end"][idx]):
+        return None
+    return table["records"][int(table[f"v{family}_rec"][idx])]
+
+def lookup_ip_database(ip):
+    """Offline (geo, asn) records for one address; each is None when unknown."""
+    tables = get_ip_database()["tables"]
+    if not tables:
+        return None, None
+    family, key = ip_to_key(ip)
+    geo = _lookup_range(tables["geo"], family, key) if "geo" in tables else None
+    asn = _lookup_range(tables["asn"], family, key) if "asn" in tables else None
+    return geo, asn
+
+def lookup_ip_database_batch(families, keys):
+    """Vectorized lookup for parallel arrays of families (4/6) and integer keys.
+
+    Returns {"geo": record_index_array, "asn": record_index_array, "records": {...}}
+    where -1 marks a miss; callers resolve indexes through records[table].
+    """
+    tables = get_ip_database()["tables"]
+    families = np.asarray(families)
+    keys = np.asarray(keys, dtype=np.uint64)
+    out = {"records": {}}
+    for table_name in IPDB_TABLES:
+        result = np.full(len(keys), -1, dtype=np.int64)
+        table = tables.get(table_name)
+        if table is not None:
+            out["records"][table_name] = table["records"]
+            for family, dtype in ((4, np.uint32), (6, np.uint64)):
+                mask = families == family
+                if not mask.any() or len(table[f"v{family}_start"]) == 0:
+                    continue
+                family_keys = keys[mask].astype(dtype)
+                idx = np.searchsorted(table[f"v{family}_start"], family_keys, side="right") - 1
+                valid = idx >= 0
+                safe_idx = np.where(valid, idx, 0)
+                valid &= family_keys <= table[f"v{family}_end"][safe_idx]
+                result[mask] = np.where(valid, table[f"v{family}_rec"][safe_idx].astype(np.int64), -1)
+        out[table_name] = result
+    return out
+
+def geo_record_to_dict(geo, asn):
+    """Shape offline records like get_ip_geolocation's result fields."""
+    data = {}
+    if geo:
+        country_code, region, city, latitude, longitude = geo
+        data.update({
+            "country": country_code or "Unknown",
+            "country_code": country_code or "N/A",
+            "region": region or "Unknown",
+            "city": city or "Unknown",
+            "latitude": latitude,
+            "longitude": longitude
+        })
+    if asn:
+        asn_number, asn_country, asn_description = asn
+        data.update({
+            "isp": asn_description or "Unknown",
+            "organization": asn_description or "Unknown",
+            "asn": f"AS{asn_number}" if asn_number else "Unknown"
+        })
+        if not geo and asn_country:
+            data.update({"country": asn_country, "country_code": asn_country})
+    return data
+
+@app.cli.command("ipdb-build")
+@click.option("--geo", "geo_paths", multiple=True, type=click.Path(exists=True, dir_okay=False), help="Geolocation range CSV (DB-IP city lite style, or MaxMind City/Country blocks); repeat to merge files such as IPv4 and IPv6 blocks.")
+@click.option("--geo-locations", "geo_locations_path", type=click.Path(exists=True, dir_okay=False), help="MaxMind Locations CSV for --geo blocks (found next to them by default).")
+@click.option("--asn", "asn_paths", multiple=True, type=click.Path(exists=True, dir_okay=False), help="IP-to-ASN range TSV/CSV (iptoasn style, or MaxMind ASN blocks); repeat to merge files.")
+def ipdb_build_command(geo_paths, geo_locations_path, asn_paths):
+    """Compile range databases into the offline IP database and activate it."""
+    if not geo_paths and not asn_paths:
+        raise click.UsageError("Provide --geo and/or --asn")
+    try:
+        build_dir, counts = build_ip_database(list(geo_paths), list(asn_paths), geo_locations_path=geo_locations_path)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    click.echo(f"Activated {build_dir}: " + ", ".join(f"{k}={v} ranges" for k, v in counts.items()))
+
 def get_ip_geolocation(ip):
     """Get IP geolocation information using free services."""
     try:
@@ -1353,6 +3328,14 @@ def get_ip_geolocation(ip):
             "source": "Simulated Data"
         }
         
+        # Offline range database takes precedence over the built-in samples
+        if NUMPY_AVAILABLE:
+            geo, asn = lookup_ip_database(ip)
+            if geo or asn:
+                geolocation_data.update(geo_record_to_dict(geo, asn))
+                geolocation_data["source"] = "Offline IP Database"
+                return geolocation_data
+        
         # Enhanced simulation based on IP patterns
         if ip.startswith("8.8."):
             geolocation_data.update({
@@ -1412,27 +3395,288 @@ def get_ip_network_info(ip):
     except Exception as e:
         return {"error": f"Network info lookup failed: {str(e)}"}
 
+# --- Reverse DNS (PTR) with deadlines and TTL-aware caching ---
+REVERSE_DNS_TIMEOUT = float(os.environ.get("REVERSE_DNS_TIMEOUT", 2.0))  # total seconds per lookup
+REVERSE_DNS_CONCURRENCY = int(os.environ.get("REVERSE_DNS_CONCURRENCY", 256))
+REVERSE_DNS_NEGATIVE_TTL = 300  # used when the response carries no SOA
+REVERSE_DNS_FAILURE_TTL = 60  # timeouts/SERVFAIL, so a dead zone is not re-queried every request
+REVERSE_DNS_MIN_TTL = 30
+REVERSE_DNS_MAX_TTL = 86400
+REVERSE_DNS_CACHE_MAX = 200000
+
+_ptr_cache = {}  # ip -> (expires_at, result)
+_ptr_cache_lock = threading.Lock()
+_ptr_resolver = None
+
+def get_ptr_resolver():
+    global _ptr_resolver
+    if _ptr_resolver is None:
+        resolver = dns.resolver.Resolver()
+        resolver.lifetime = REVERSE_DNS_TIMEOUT
+        resolver.timeout = min(resolver.timeout, REVERSE_DNS_TIMEOUT)
+        _ptr_resolver = resolver
+    return _ptr_resolver
+
+def _ptr_result(hostname, status):
+    return {
+        "hostname": hostname or "No reverse DNS",
+        "has_reverse_dns": bool(hostname),
+        "ptr_record": hostname,
+        "status": status
+    }
+
+def _soa_negative_ttl(responses):
+    """Negative-caching TTL from the SOA in the authority section (RFC 2308)."""
+    for response in responses:
+        for rrset in getattr(response, "authority", []):
+            if rrset.rdtype == dns.rdatatype.SOA and len(rrset):
+                return min(rrset.ttl, rrset[0].minimum)
+    return REVERSE_DNS_NEGATIVE_TTL
+
+def _ptr_outcome(answer=None, exc=None):
+    """Turn a PTR answer or resolver exception into (result, ttl)."""
+    if answer is not None:
+        hostname = str(answer[0].target).rstrip('.')
+        return _ptr_result(hostname, "ok"), answer.rrset.ttl
+    if isinstance(exc, dns.resolver.NXDOMAIN):
+        return _ptr_result(None, "nxdomain"), _soa_negative_ttl(exc.responses().values())
+    if isinstance(exc, dns.resolver.NoAnswer):
+        return _ptr_result(None, "no_answer"), _soa_negative_ttl([exc.response()])
+    if isinstance(exc, (dns.resolver.LifetimeTimeout, dns.exception.Timeout)):
+        return _ptr_result(None, "timeout"), REVERSE_DNS_FAILURE_TTL
+    return _ptr_result(None, "error"), REVERSE_DNS_FAILURE_TTL
+
+def _ptr_cache_get(ip, now):
+    cache_entry = _ptr_cache.get(ip)
+    if cache_entry and now < cache_entry[0]:
+        return dict(cache_entry[1], cached=True)
+    return None
+
+def _ptr_cache_put(ip, result, ttl, now):
+    ttl = max(REVERSE_DNS_MIN_TTL, min(REVERSE_DNS_MAX_TTL, ttl))
+    with _ptr_cache_lock:
+        if len(_ptr_cache) >= REVERSE_DNS_CACHE_MAX:
+            for key in [k for k, (exp, _) in _ptr_cache.items() if exp <= now]:
+                _ptr_cache.pop(key, None)
+            while len(_ptr_cache) >= REVERSE_DNS_CACHE_MAX:
+                _ptr_cache.pop(next(iter(_ptr_cache)))
+        _ptr_cache[ip] = (now + ttl, result)
+
 def get_reverse_dns(ip):
-    """Perform reverse DNS lookup."""
+    """Perform reverse DNS lookup (bounded by REVERSE_DNS_TIMEOUT, cached per record TTL)."""
     try:
-        import socket
+        now = time.time()
+        cached = _ptr_cache_get(ip, now)
+        if cached:
+            return cached
+        
+        import dns.reversename
         try:
-            hostname = socket.gethostbyaddr(ip)[0]
-            return {
-                "hostname": hostname,
-                "has_reverse_dns": True,
-                "ptr_record": hostname
-            }
-        except socket.herror:
-            return {
-                "hostname": "No reverse DNS",
-                "has_reverse_dns": False,
-                "ptr_record": None
-            }
+            answer = get_ptr_resolver().resolve(dns.reversename.from_address(ip), "PTR", lifetime=REVERSE_DNS_TIMEOUT)
+            result, ttl = _ptr_outcome(answer=answer)
+            if result["has_reverse_dns"]:
+                record_dns_observations([(ip, "PTR", result["ptr_record"])])
+        except dns.exception.DNSException as e:
+            result, ttl = _ptr_outcome(exc=e)
+        
+        _ptr_cache_put(ip, result, ttl, now)
+        return dict(result, cached=False)
     except Exception as e:
         return {"error": f"Reverse DNS lookup failed: {str(e)}"}
 
-def analyze_ip_security(ip):
+def get_reverse_dns_batch(ips, concurrency=None):
+    """Resolve PTR records for many addresses concurrently; returns {ip: result}.
+
+    Cached answers are served directly; the rest are resolved on an asyncio
+    resolver with at most `concurrency` queries in flight.
+    """
+    import asyncio
+    import dns.asyncresolver
+    import dns.reversename
+
+    now = time.time()
+    results = {}
+    pending = []
+    for ip in dict.fromkeys(ips):
+        cached = _ptr_cache_get(ip, now)
+        if cached:
+            results[ip] = cached
+        else:
+            pending.append(ip)
+    if not pending:
+        return results
+
+    async def resolve_all():
+        # Same upstream servers and timeouts as the synchronous resolver
+        sync_resolver = get_ptr_resolver()
+        resolver = dns.asyncresolver.Resolver(configure=False)
+        resolver.nameservers = sync_resolver.nameservers
+        resolver.port = sync_resolver.port
+        resolver.lifetime = sync_resolver.lifetime
+        resolver.timeout = sync_resolver.timeout
+        semaphore = asyncio.Semaphore(concurrency or REVERSE_DNS_CONCURRENCY)
+
+        async def resolve_one(ip):
+            async with semaphore:
+                try:
+                    answer = await resolver.resolve(dns.reversename.from_address(ip), "PTR", lifetime=REVERSE_DNS_TIMEOUT)
+                    return ip, _ptr_outcome(answer=answer)
+                except dns.exception.DNSException as e:
+                    return ip, _ptr_outcome(exc=e)
+                except Exception as e:
+                    return ip, ({"error": f"Reverse DNS lookup failed: {str(e)}"}, 0)
+
+        return await asyncio.gather(*(resolve_one(ip) for ip in pending))
+
+    observations = []
+    for ip, (result, ttl) in asyncio.run(resolve_all()):
+        if "error" not in result:
+            _ptr_cache_put(ip, result, ttl, now)
+            if result["has_reverse_dns"]:
+                observations.append((ip, "PTR", result["ptr_record"]))
+            result = dict(result, cached=False)
+        results[ip] = result
+    record_dns_observations(observations)
+    return results
+
+# --- CIDR feed index (blocklists, Tor exits, cloud/VPN ranges) ---
+# Every file in CIDR_FEEDS_DIR is one feed: one CIDR or address per line,
+# '#'/';' comments allowed. The file name is the source tag and its first
+# '-'-separated word the category, e.g. "tor-exits.txt", "cloud-aws.txt",
+# "blocklist-spamhaus-drop.txt", "vpn-mullvad.txt", "allowlist-partners.txt".
+# Prefixes are kept in one hash table per prefix length, so a lookup is one
+# longest-to-shortest walk over the lengths present in the feeds.
+CIDR_FEEDS_DIR = os.environ.get("CIDR_FEEDS_DIR", os.path.join("data", "feeds"))
+CIDR_FEEDS_RELOAD_INTERVAL = int(os.environ.get("CIDR_FEEDS_RELOAD_INTERVAL", 60))
+CIDR_FEED_CATEGORIES = ("blocklist", "tor", "proxy", "vpn", "cloud", "hosting", "datacenter", "allowlist")
+
+BUILTIN_CIDR_FEEDS = {
+    "allowlist-google-dns": ["8.8.0.0/16"],
+    "allowlist-cloudflare-dns": ["1.1.0.0/16"],
+    "allowlist-opendns": ["208.67.0.0/16"],
+}
+
+_cidr_index = {"signature": None, "tables": {4: {}, 6: {}}, "lengths": {4: [], 6: []}, "entries": []}
+_cidr_refresh_lock = threading.Lock()
+_cidr_init_lock = threading.Lock()
+_cidr_refresh_thread = None
+
+def _iter_cidr_feeds(feeds_dir):
+    """Yield (tag, lines) for the built-in feeds and every feed file."""
+    for tag, cidrs in BUILTIN_CIDR_FEEDS.items():
+        yield tag, cidrs
+    try:
+        names = sorted(os.listdir(feeds_dir))
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(feeds_dir, name)
+        if name.startswith('.') or not os.path.isfile(path):
+            continue
+        try:
+            with open(path, encoding="utf-8", errors="ignore") as fh:
+                yield os.path.splitext(name)[0], fh.read().splitlines()
+        except OSError as e:
+            print(f"CIDR feed {path} not loaded: {e}")
+
+def build_cidr_index(feeds_dir):
+    """Build a fresh prefix index from all feeds."""
+    import ipaddress
+    tables = {4: {}, 6: {}}
+    entries = []
+    for tag, lines in _iter_cidr_feeds(feeds_dir):
+        category = tag.split('-', 1)[0].lower()
+        if category not in CIDR_FEED_CATEGORIES:
+            category = "custom"
+        entry_id = len(entries)
+        entries.append({"tag": tag, "category": category})
+        for line in lines:
+            token = re.split(r'[\s#;,]', line.strip(), 1)[0]
+            if not token:
+                continue
+            try:
+                network = ipaddress.ip_network(token, strict=False)
+            except ValueError:
+                continue
+            bits = network.max_prefixlen
+            key = int(network.network_address) >> (bits - network.prefixlen)
+            bucket = tables[network.version].setdefault(network.prefixlen, {})
+            ids = bucket.setdefault(key, [])
+            if entry_id not in ids:
+                ids.append(entry_id)
+    lengths = {family: sorted(tables[family], reverse=True) for family in tables}
+    index = {"tables": tables, "lengths": lengths, "entries": entries, "v4_arrays": None}
+    if NUMPY_AVAILABLE:
+        # Sorted key arrays per IPv4 prefix length for vectorized batch lookups
+        v4_arrays = []
+        for length in lengths[4]:
+            keys = sorted(tables[4][length])
+            v4_arrays.append((length, np.array(keys, dtype=np.uint32), [tables[4][length][k] for k in keys]))
+        index["v4_arrays"] = v4_arrays
+    return index
+
+def _cidr_feeds_signature(feeds_dir):
+    try:
+        return tuple(sorted((e.name, e.stat().st_mtime_ns, e.stat().st_size) for e in os.scandir(feeds_dir) if e.is_file()))
+    except OSError:
+        return ()
+
+def refresh_cidr_index(force=False):
+    """Rebuild the index if feed files changed, then swap it in with one assignment."""
+    global _cidr_index
+    with _cidr_refresh_lock:
+        signature = _cidr_feeds_signature(CIDR_FEEDS_DIR)
+        if not force and signature == _cidr_index["signature"]:
+            return False
+        index = build_cidr_index(CIDR_FEEDS_DIR)
+        index["signature"] = signature
+        _cidr_index = index
+        return True
+
+def _cidr_refresh_loop():
+    while True:
+        time.sleep(CIDR_FEEDS_RELOAD_INTERVAL)
+        try:
+            refresh_cidr_index()
+        except Exception as e:
+            print(f"CIDR feed refresh failed: {e}")
+
+def get_cidr_index():
+    """Current index; the first call builds it and starts the background refresher."""
+    global _cidr_refresh_thread
+    if _cidr_refresh_thread is None:
+        with _cidr_init_lock:
+            if _cidr_refresh_thread is None:
+                refresh_cidr_index(force=True)
+                thread = threading.Thread(target=_cidr_refresh_loop, name="cidr-feed-refresh", daemon=True)
+                thread.start()
+                _cidr_refresh_thread = thread
+    return _cidr_index
+
+def lookup_cidr_feeds(ip):
+    """All feeds containing the address, most specific prefix first.
+
+    Returns a list of {"tag", "category", "prefix"} dicts.
+    """
+    import ipaddress
+    index = get_cidr_index()
+    ip_obj = ipaddress.ip_address(ip)
+    value = int(ip_obj)
+    bits = ip_obj.max_prefixlen
+    tables = index["tables"][ip_obj.version]
+    matches = []
+    seen = set()
+    for length in index["lengths"][ip_obj.version]:
+        ids = tables[length].get(value >> (bits - length))
+        if ids:
+            for entry_id in ids:
+                if entry_id not in seen:
+                    seen.add(entry_id)
+                    entry = index["entries"][entry_id]
+                    matches.append({"tag": entry["tag"], "category": entry["category"], "prefix": length})
+    return matches
+
+def analyze_ip_security(ip, feed_matches=None):
     """Analyze IP for security indicators."""
     try:
         security_info = {
@@ -1442,30 +3686,40 @@ def analyze_ip_security(ip):
             "is_hosting": False,
             "is_datacenter": False,
             "security_score": 0,
-            "risk_level": "Low"
+            "risk_level": "Low",
+            "feed_matches": []
         }
         
-        # Enhanced analysis based on IP patterns and common knowledge
-        if ip.startswith(("8.8.", "1.1.", "208.67.")):
-            security_info.update({
-                "is_hosting": False,
-                "is_datacenter": True,
-                "security_score": 10,
-                "risk_level": "Very Low"
-            })
-        
-        # Check for common datacenter ranges (simplified)
-        datacenter_ranges = ["192.168.", "10.", "172.16.", "172.17.", "172.18."]
-        if any(ip.startswith(range_) for range_ in datacenter_ranges):
-            security_info["is_datacenter"] = True
-            security_info["security_score"] = 5
+        if feed_matches is None:
+            feed_matches = lookup_cidr_feeds(ip)
+        categories = {m["category"] for m in feed_matches}
+        security_info["feed_matches"] = [m["tag"] for m in feed_matches]
+        
+        security_info["is_tor_exit"] = "tor" in categories
+        security_info["is_proxy"] = "proxy" in categories
+        security_info["is_vpn"] = "vpn" in categories
+        security_info["is_hosting"] = bool(categories & {"cloud", "hosting"})
+        security_info["is_datacenter"] = bool(categories & {"cloud", "hosting", "datacenter"})
+        
+        # Score by the most serious listing
+        if "blocklist" in categories:
+            security_info.update({"security_score": 90, "risk_level": "High"})
+        elif security_info["is_tor_exit"]:
+            security_info.update({"security_score": 70, "risk_level": "High"})
+        elif security_info["is_proxy"] or security_info["is_vpn"]:
+            security_info.update({"security_score": 50, "risk_level": "Medium"})
+        elif "allowlist" in categories:
+            # Known infrastructure such as public DNS resolvers
+            security_info.update({"is_datacenter": True, "security_score": 10, "risk_level": "Very Low"})
+        elif security_info["is_datacenter"]:
+            security_info.update({"security_score": 20, "risk_level": "Low"})
             
         return security_info
         
     except Exception as e:
         return {"error": f"Security analysis failed: {str(e)}"}
 
-def check_ip_reputation(ip):
+def check_ip_reputation(ip, feed_matches=None):
     """Check IP reputation using various indicators."""
     try:
         reputation_info = {
@@ -1477,12 +3731,28 @@ def check_ip_reputation(ip):
             "confidence_level": "Medium"
         }
         
-        # Enhanced reputation based on known good IPs
-        if ip.startswith(("8.8.", "1.1.", "208.67.")):
+        if feed_matches is None:
+            feed_matches = lookup_cidr_feeds(ip)
+        reputation_info["blacklist_status"] = [m["tag"] for m in feed_matches if m["category"] == "blocklist"]
+        reputation_info["whitelist_status"] = [m["tag"] for m in feed_matches if m["category"] == "allowlist"]
+        reputation_info["threat_categories"] = sorted({m["category"] for m in feed_matches if m["category"] in ("blocklist", "tor", "proxy", "vpn")})
+        
+        if reputation_info["blacklist_status"]:
+            reputation_info.update({
+                "reputation_score": 5,
+                "reputation_status": "Blacklisted",
+                "confidence_level": "High"
+            })
+        elif reputation_info["threat_categories"]:
+            reputation_info.update({
+                "reputation_score": 30,
+                "reputation_status": "Suspicious",
+                "confidence_level": "Medium"
+            })
+        elif reputation_info["whitelist_status"]:
             reputation_info.update({
                 "reputation_score": 95,
                 "reputation_status": "Excellent",
-                "whitelist_status": ["Google DNS", "Cloudflare DNS", "OpenDNS"],
                 "confidence_level": "High"
             })
         
@@ -1513,7 +3783,7 @@ def generate_ip_osint_urls(ip):
     
     return osint_urls
 
-def get_ip_threat_intelligence(ip):
+def get_ip_threat_intelligence(ip, feed_matches=None):
     """Get threat intelligence information for IP."""
     try:
         threat_intel = {
@@ -1523,11 +3793,26 @@ def get_ip_threat_intelligence(ip):
             "last_seen_malicious": None,
             "campaigns": [],
             "threat_actors": [],
-            "confidence": "Medium"
+            "confidence": "Medium",
+            "listed_in": []
         }
         
-        # Enhanced threat intel for known good IPs
-        if ip.startswith(("8.8.", "1.1.", "208.67.")):
+        if feed_matches is None:
+            feed_matches = lookup_cidr_feeds(ip)
+        categories = {m["category"] for m in feed_matches}
+        threat_intel["listed_in"] = [m["tag"] for m in feed_matches if m["category"] != "allowlist"]
+        
+        if "blocklist" in categories:
+            threat_intel.update({"threat_level": "High", "confidence": "High"})
+            threat_intel["attack_types"].append("Listed on blocklist")
+        if "tor" in categories:
+            threat_intel["attack_types"].append("Tor exit node")
+            if threat_intel["threat_level"] == "Low":
+                threat_intel["threat_level"] = "Medium"
+        if categories & {"proxy", "vpn"}:
+            threat_intel["attack_types"].append("Anonymizing proxy/VPN")
+        if not threat_intel["listed_in"] and "allowlist" in categories:
+            # Known good infrastructure
             threat_intel.update({
                 "threat_level": "None",
                 "confidence": "High"
@@ -1538,8 +3823,299 @@ def get_ip_threat_intelligence(ip):
     except Exception as e:
         return {"error": f"Threat intelligence lookup failed: {str(e)}"}
 
-def get_additional_ip_info(ip):
-    """Get additional IP information."""
+# --- RDAP client ---
+# Queries are routed through the IANA bootstrap registries (RFC 9224), which
+# are downloaded once into RDAP_BOOTSTRAP_DIR and refreshed after
+# RDAP_BOOTSTRAP_MAX_AGE (a stale copy is kept if IANA is unreachable).
+# Each registry gets its own pooled session and request pacing; parsed
+# responses are cached for RDAP_CACHE_TTL, not-found answers for
+# RDAP_NEGATIVE_CACHE_TTL.
+RDAP_ENABLED = os.environ.get("RDAP_ENABLED", "true").lower() == "true"
+RDAP_BOOTSTRAP_URL = os.environ.get("RDAP_BOOTSTRAP_URL", "https://data.iana.org/rdap")
+RDAP_BOOTSTRAP_DIR = os.environ.get("RDAP_BOOTSTRAP_DIR", os.path.join("data", "rdap"))
+RDAP_BOOTSTRAP_MAX_AGE = int(os.environ.get("RDAP_BOOTSTRAP_MAX_AGE", 7 * 86400))
+RDAP_BOOTSTRAP_RETRY = 300  # seconds before retrying a failed bootstrap download
+RDAP_BOOTSTRAP_FILES = {"domain": "dns.json", "ipv4": "ipv4.json", "ipv6": "ipv6.json", "autnum": "asn.json"}
+RDAP_RATE_LIMIT_PER_SECOND = float(os.environ.get("RDAP_RATE_LIMIT_PER_SECOND", 2))  # per registry
+RDAP_CACHE_TTL = int(os.environ.get("RDAP_CACHE_TTL", 86400))
+RDAP_NEGATIVE_CACHE_TTL = int(os.environ.get("RDAP_NEGATIVE_CACHE_TTL", 3600))
+RDAP_CACHE_MAX = int(os.environ.get("RDAP_CACHE_MAX", 50000))
+RDAP_TIMEOUT = 10
+RDAP_MAX_RETRIES = 2
+RDAP_MAX_WORKERS = int(os.environ.get("RDAP_MAX_WORKERS", 16))
+
+_rdap_bootstrap = {"services": None, "failed_at": 0.0}
+_rdap_bootstrap_lock = threading.Lock()
+_rdap_sessions = {}  # registry base URL -> requests.Session
+_rdap_next_slot = {}  # registry base URL -> monotonic time of its next request
+_rdap_registry_lock = threading.Lock()
+_rdap_cache = {}  # (kind, query) -> (expires_at, result)
+_rdap_cache_lock = threading.Lock()
+_rdap_pending = set()  # (kind, query) queued for a background lookup
+_rdap_background_executor = ThreadPoolExecutor(max_workers=RDAP_MAX_WORKERS)
+
+def _load_rdap_bootstrap_file(filename):
+    """One IANA bootstrap file, from disk if fresh, else downloaded and saved."""
+    path = os.path.join(RDAP_BOOTSTRAP_DIR, filename)
+    stale = None
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            stale = json.load(f)
+        if time.time() - os.path.getmtime(path) < RDAP_BOOTSTRAP_MAX_AGE:
+            return stale
+    try:
+        response = requests.get(f"{RDAP_BOOTSTRAP_URL}/{filename}", headers=HEADERS, timeout=RDAP_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+        os.makedirs(RDAP_BOOTSTRAP_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=RDAP_BOOTSTRAP_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        return data
+    except Exception as e:
+        if stale is None:
+            raise
+        print(f"RDAP bootstrap refresh of {filename} failed, using cached copy: {e}")
+        return stale
+
+def _rdap_base_url(urls):
+    """Prefer the HTTPS service URL of a bootstrap entry."""
+    urls = sorted(urls, key=lambda url: not url.startswith("https://"))
+    return urls[0] if urls[0].endswith("/") else urls[0] + "/"
+
+def build_rdap_bootstrap(files):
+    """Compile bootstrap JSON into lookup tables keyed by kind."""
+    import ipaddress
+    services = {"domain": {}, "ip": {4: {}, 6: {}}, "autnum": []}
+    for kind, data in files.items():
+        for entry in data.get("services", []):
+            keys, urls = entry[0], entry[1]
+            if not urls:
+                continue
+            base = _rdap_base_url(urls)
+            for key in keys:
+                if kind == "domain":
+                    services["domain"][key.lower().rstrip('.')] = base
+                elif kind == "autnum":
+                    first, _, last = key.partition("-")
+                    services["autnum"].append((int(first), int(last or first), base))
+                else:
+                    network = ipaddress.ip_network(key, strict=False)
+                    table = services["ip"][network.version].setdefault(network.prefixlen, {})
+                    table[int(network.network_address) >> (network.max_prefixlen - network.prefixlen)] = base
+    services["ip_lengths"] = {version: sorted(tables, reverse=True) for version, tables in services["ip"].items()}
+    return services
+
+def get_rdap_bootstrap():
+    """Compiled bootstrap tables, loaded once per process (None while unavailable)."""
+    if _rdap_bootstrap["services"] is not None:
+        return _rdap_bootstrap["services"]
+    with _rdap_bootstrap_lock:
+        if _rdap_bootstrap["services"] is None and time.time() - _rdap_bootstrap["failed_at"] >= RDAP_BOOTSTRAP_RETRY:
+            try:
+                files = {kind: _load_rdap_bootstrap_file(filename) for kind, filename in RDAP_BOOTSTRAP_FILES.items()}
+                _rdap_bootstrap["services"] = build_rdap_bootstrap(files)
+            except Exception as e:
+                _rdap_bootstrap["failed_at"] = time.time()
+                print(f"RDAP bootstrap unavailable: {e}")
+    return _rdap_bootstrap["services"]
+
+def rdap_registry_for(kind, query):
+    """Registry base URL serving a domain, IP or AS number, or None."""
+    import ipaddress
+    services = get_rdap_bootstrap()
+    if services is None:
+        return None
+    if kind == "domain":
+        labels = query.split('.')
+        for i in range(len(labels)):
+            base = services["domain"].get('.'.join(labels[i:]))
+            if base:
+                return base
+        return None
+    if kind == "ip":
+        ip_obj = ipaddress.ip_address(query)
+        value = int(ip_obj)
+        for length in services["ip_lengths"][ip_obj.version]:
+            base = services["ip"][ip_obj.version][length].get(value >> (ip_obj.max_prefixlen - length))
+            if base:
+                return base
+        return None
+    number = int(str(query).upper().lstrip("AS"))
+    for first, last, base in services["autnum"]:
+        if first <= number <= last:
+            return base
+    return None
+
+def _rdap_session(base):
+    session = _rdap_sessions.get(base)
+    if session is None:
+        with _rdap_registry_lock:
+            session = _rdap_sessions.get(base)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=RDAP_MAX_WORKERS)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"Accept": "application/rdap+json", "User-Agent": HEADERS["User-Agent"]})
+                _rdap_sessions[base] = session
+    return session
+
+def _rdap_reserve_slot(base, delay=0.0):
+    """Wait for this registry's next request slot (RDAP_RATE_LIMIT_PER_SECOND per registry)."""
+    interval = 1.0 / RDAP_RATE_LIMIT_PER_SECOND if RDAP_RATE_LIMIT_PER_SECOND > 0 else 0.0
+    with _rdap_registry_lock:
+        now = time.monotonic()
+        slot = max(now + delay, _rdap_next_slot.get(base, 0.0))
+        _rdap_next_slot[base] = slot + interval
+    if slot > now:
+        time.sleep(slot - now)
+
+def _rdap_entity_name(entity):
+    for field in (entity.get("vcardArray") or [None, []])[1]:
+        if field and field[0] == "fn" and field[3]:
+            return field[3]
+    return entity.get("handle")
+
+def parse_rdap_response(data):
+    """Summarize an RDAP domain, ip network or autnum object."""
+    events = {event.get("eventAction"): event.get("eventDate") for event in data.get("events", [])}
+    roles = {}
+    for entity in data.get("entities", []):
+        for role in entity.get("roles", []):
+            roles.setdefault(role, _rdap_entity_name(entity))
+    summary = {
+        "object_class": data.get("objectClassName"),
+        "handle": data.get("handle"),
+        "name": data.get("ldhName") or data.get("name"),
+        "registrar": roles.get("registrar"),
+        "registrant": roles.get("registrant"),
+        "abuse_contact": roles.get("abuse"),
+        "registration_date": events.get("registration"),
+        "last_changed": events.get("last changed"),
+        "expiration_date": events.get("expiration"),
+        "status": data.get("status", []),
+        "country": data.get("country"),
+        "nameservers": [ns.get("ldhName", "").lower().rstrip('.') for ns in data.get("nameservers", [])]
+    }
+    if data.get("objectClassName") == "ip network":
+        summary.update({
+            "network_range": f"{data.get('startAddress')} - {data.get('endAddress')}",
+            "network_type": data.get("type")
+        })
+    return summary
+
+def _rdap_cache_put(key, result, ttl):
+    now = time.time()
+    with _rdap_cache_lock:
+        if len(_rdap_cache) >= RDAP_CACHE_MAX:
+            for k in [k for k, (exp, _) in _rdap_cache.items() if exp <= now]:
+                _rdap_cache.pop(k, None)
+            while len(_rdap_cache) >= RDAP_CACHE_MAX:
+                _rdap_cache.pop(next(iter(_rdap_cache)))
+        _rdap_cache[key] = (now + ttl, result)
+
+def _rdap_normalize(kind, query):
+    import ipaddress
+    if kind == "ip":
+        return str(ipaddress.ip_address(query.strip()))
+    if kind == "autnum":
+        return str(int(str(query).strip().upper().lstrip("AS")))
+    return query.strip().lower().rstrip('.')
+
+def rdap_lookup(kind, query, wait=True):
+    """RDAP lookup for kind "domain", "ip" or "autnum".
+
+    Returns {"ok": True, "data": summary, "registry", "url"} or
+    {"ok": False, "error"}; results are cached per (kind, query). With
+    wait=False only a cached answer is returned: a miss queues the lookup
+    on a background thread and returns {"ok": False, "pending": True}.
+    """
+    if not RDAP_ENABLED:
+        return {"ok": False, "error": "RDAP lookups disabled"}
+    try:
+        query = _rdap_normalize(kind, query)
+    except ValueError:
+        return {"ok": False, "error": f"Invalid {kind} for RDAP lookup"}
+    key = (kind, query)
+    cache_entry = _rdap_cache.get(key)
+    if cache_entry and time.time() < cache_entry[0]:
+        return cache_entry[1]
+    if not wait:
+        _rdap_schedule(kind, query)
+        return {"ok": False, "pending": True, "error": "RDAP lookup queued"}
+
+    base = rdap_registry_for(kind, query)
+    if base is None:
+        if get_rdap_bootstrap() is None:
+            return {"ok": False, "error": "RDAP bootstrap unavailable"}
+        result = {"ok": False, "error": "No RDAP service for this query"}
+        _rdap_cache_put(key, result, RDAP_NEGATIVE_CACHE_TTL)
+        return result
+
+    url = f"{base}{kind}/{query}"
+    session = _rdap_session(base)
+    try:
+        delay = 0.0
+        for attempt in range(RDAP_MAX_RETRIES + 1):
+            _rdap_reserve_slot(base, delay)
+            response = session.get(url, timeout=RDAP_TIMEOUT)
+            if response.status_code != 429 or attempt == RDAP_MAX_RETRIES:
+                break
+            try:
+                delay = float(response.headers.get("Retry-After", 2))
+            except ValueError:
+                delay = 2.0
+        if response.status_code == 404:
+            result = {"ok": False, "error": "Not found in registry", "registry": base}
+            _rdap_cache_put(key, result, RDAP_NEGATIVE_CACHE_TTL)
+            return result
+        if response.status_code != 200:
+            return {"ok": False, "error": f"RDAP registry returned HTTP {response.status_code}", "registry": base}
+        result = {"ok": True, "data": parse_rdap_response(response.json()), "registry": base, "url": response.url}
+    except (requests.RequestException, ValueError) as e:
+        return {"ok": False, "error": f"RDAP lookup failed: {str(e)}", "registry": base}
+    _rdap_cache_put(key, result, RDAP_CACHE_TTL)
+    return result
+
+def _rdap_schedule(kind, query):
+    key = (kind, query)
+    with _rdap_cache_lock:
+        if key in _rdap_pending:
+            return
+        _rdap_pending.add(key)
+
+    def lookup():
+        try:
+            rdap_lookup(kind, query)
+        except Exception as e:
+            app.logger.warning("Background RDAP lookup of %s %s failed: %s", kind, query, e)
+        finally:
+            with _rdap_cache_lock:
+                _rdap_pending.discard(key)
+    _rdap_background_executor.submit(lookup)
+
+def rdap_prefetch(kind, queries):
+    """Queue background lookups for every query not cached yet; returns without waiting.
+
+    Registries are paced at RDAP_RATE_LIMIT_PER_SECOND, so batch jobs read
+    whatever is cached and later lookups pick up the rest.
+    """
+    for query in dict.fromkeys(q for q in queries if q):
+        rdap_lookup(kind, query, wait=False)
+
+def rdap_age(date_string):
+    """Human-readable age of an RDAP event date, or "Unknown"."""
+    try:
+        registered = datetime.fromisoformat(date_string.replace("Z", "+00:00")).replace(tzinfo=None)
+    except (AttributeError, ValueError):
+        return "Unknown"
+    days = (datetime.utcnow() - registered).days
+    return f"{days // 365} years" if days >= 365 else f"{days} days"
+
+def get_additional_ip_info(ip, wait=True):
+    """Get additional IP information (wait=False uses cached registry data only)."""
     try:
         additional_info = {
             "registration_date": "Unknown",
@@ -1550,16 +4126,32 @@ def get_additional_ip_info(ip):
             "notes": "No additional notes"
         }
         
-        # Enhanced info for known IPs
+        # Registration data for the covering network from the regional registry
+        rdap = rdap_lookup("ip", ip, wait=wait)
+        if rdap.get("pending"):
+            additional_info["rdap_pending"] = True
+        if rdap["ok"]:
+            network = rdap["data"]
+            additional_info.update({
+                "registration_date": network["registration_date"] or "Unknown",
+                "last_updated": network["last_changed"] or "Unknown",
+                "registrar": network["registrant"] or network["name"] or "Unknown",
+                "network_name": network["name"],
+                "network_range": network.get("network_range"),
+                "abuse_contact": network["abuse_contact"],
+                "rdap_registry": rdap["registry"]
+            })
+        
+        # Enhanced info for known IPs (registry data takes precedence)
         if ip.startswith("8.8."):
             additional_info.update({
-                "registrar": "Google Inc.",
+                "registrar": additional_info["registrar"] if rdap["ok"] else "Google Inc.",
                 "notes": "Google Public DNS Service",
                 "country_threat_level": "Very Low"
             })
         elif ip.startswith("1.1."):
             additional_info.update({
-                "registrar": "Cloudflare Inc.",
+                "registrar": additional_info["registrar"] if rdap["ok"] else "Cloudflare Inc.",
                 "notes": "Cloudflare Public DNS Service", 
                 "country_threat_level": "Very Low"
             })
@@ -1588,6 +4180,265 @@ def get_ip_class(ip):
     except:
         return "Unknown"
 
+# --- Bulk IP investigation pipeline ---
+# Bulk lists are parsed into integer arrays once; IPv4 classification,
+# geolocation/ASN and feed lookups then run as array operations. IPv6 rows
+# are classified per address through ipaddress. Addresses are grouped by
+# prefix (/24, /48) and ASN so network-level work runs once per group.
+BULK_IP_MAX_ITEMS = int(os.environ.get("BULK_IP_MAX_ITEMS", 100000))
+BULK_IP_GROUP_PREFIX_V4 = int(os.environ.get("BULK_IP_GROUP_PREFIX_V4", 24))
+BULK_IP_GROUP_PREFIX_V6 = int(os.environ.get("BULK_IP_GROUP_PREFIX_V6", 48))
+IP_RISK_ORDER = ["Very Low", "Low", "Medium", "High"]
+
+# Mirrors ipaddress' IPv4 special-purpose tables: (network, prefix length)
+IPV4_PRIVATE_RANGES = [
+    ("0.0.0.0", 8), ("10.0.0.0", 8), ("127.0.0.0", 8), ("169.254.0.0", 16),
+    ("172.16.0.0", 12), ("192.0.0.0", 29), ("192.0.0.170", 31), ("192.0.2.0", 24),
+    ("192.168.0.0", 16), ("198.18.0.0", 15), ("198.51.100.0", 24), ("203.0.113.0", 24),
+    ("240.0.0.0", 4), ("255.255.255.255", 32)
+]
+IPV4_SHARED_RANGE = ("100.64.0.0", 10)  # carrier-grade NAT: neither private nor global
+IP_CLASS_LABELS = np.array(["Unknown", "Class A", "Class B", "Class C", "Class D (Multicast)", "Class E (Reserved)"], dtype=object) if NUMPY_AVAILABLE else None
+
+def _ipv4_range_mask(keys, network, prefixlen):
+    import socket
+    base = int.from_bytes(socket.inet_aton(network), "big")
+    shift = 32 - prefixlen
+    return (keys >> shift) == (base >> shift)
+
+def parse_ip_batch(items):
+    """Parse address strings once into parallel arrays.
+
+    Returns {"valid", "family", "key"} where key is the IPv4 value or the
+    upper 64 bits of an IPv6 address (the IP database keying).
+    """
+    import socket
+    count = len(items)
+    valid = np.zeros(count, dtype=bool)
+    family = np.zeros(count, dtype=np.int8)
+    keys = np.zeros(count, dtype=np.uint64)
+    inet_pton, af_inet, af_inet6, from_bytes = socket.inet_pton, socket.AF_INET, socket.AF_INET6, int.from_bytes
+    for i, item in enumerate(items):
+        try:
+            keys[i] = from_bytes(inet_pton(af_inet, item), "big")
+            family[i] = 4
+            valid[i] = True
+        except (OSError, TypeError):
+            try:
+                keys[i] = from_bytes(inet_pton(af_inet6, item)[:8], "big")
+                family[i] = 6
+                valid[i] = True
+            except (OSError, TypeError):
+                pass
+    return {"valid": valid, "family": family, "key": keys}
+
+def classify_ip_batch(items, parsed):
+    """Vectorized private/reserved/multicast/loopback/global flags and class for a parsed batch."""
+    import ipaddress
+    count = len(items)
+    is_v4 = parsed["valid"] & (parsed["family"] == 4)
+    keys = parsed["key"]
+
+    is_private = np.zeros(count, dtype=bool)
+    for network, prefixlen in IPV4_PRIVATE_RANGES:
+        is_private |= _ipv4_range_mask(keys, network, prefixlen)
+    is_private &= is_v4
+    first_octet = (keys >> 24) & 0xFF
+    flags = {
+        "is_private": is_private,
+        "is_reserved": is_v4 & (first_octet >= 240),
+        "is_multicast": is_v4 & (first_octet >= 224) & (first_octet < 240),
+        "is_loopback": is_v4 & (first_octet == 127),
+        "is_global": is_v4 & ~is_private & ~_ipv4_range_mask(keys, *IPV4_SHARED_RANGE),
+    }
+    class_code = np.select(
+        [(first_octet >= 1) & (first_octet <= 126), (first_octet >= 128) & (first_octet <= 191),
+         (first_octet >= 192) & (first_octet <= 223), (first_octet >= 224) & (first_octet <= 239),
+         first_octet >= 240],
+        [1, 2, 3, 4, 5], default=0)
+    flags["network_class"] = np.where(is_v4, class_code, 0)
+
+    # IPv6 rows need the full 128 bits, so classify them individually
+    for i in np.flatnonzero(parsed["valid"] & (parsed["family"] == 6)):
+        ip_obj = ipaddress.ip_address(items[i])
+        for name in ("is_private", "is_reserved", "is_multicast", "is_loopback", "is_global"):
+            flags[name][i] = getattr(ip_obj, name)
+    return flags
+
+def lookup_cidr_feeds_batch(items, parsed):
+    """Feed matches for every parsed address (list of match lists, most specific first)."""
+    index = get_cidr_index()
+    matches = [[] for _ in items]
+    is_v4 = parsed["valid"] & (parsed["family"] == 4)
+    v4_rows = np.flatnonzero(is_v4)
+    if index.get("v4_arrays") is not None and len(v4_rows):
+        v4_keys = parsed["key"][v4_rows].astype(np.uint32)
+        entries = index["entries"]
+        for length, table_keys, table_ids in index["v4_arrays"]:
+            probe = v4_keys >> np.uint32(32 - length) if length < 32 else v4_keys
+            pos = np.searchsorted(table_keys, probe)
+            pos_clipped = np.minimum(pos, len(table_keys) - 1)
+            hits = np.flatnonzero((pos < len(table_keys)) & (table_keys[pos_clipped] == probe))
+            for hit in hits:
+                row_matches = matches[v4_rows[hit]]
+                for entry_id in table_ids[pos_clipped[hit]]:
+                    entry = entries[entry_id]
+                    if all(m["tag"] != entry["tag"] for m in row_matches):
+                        row_matches.append({"tag": entry["tag"], "category": entry["category"], "prefix": length})
+    for i in np.flatnonzero(parsed["valid"] & ~is_v4):
+        matches[i] = lookup_cidr_feeds(items[i])
+    return matches
+
+def _network_group_label(family, prefix):
+    import ipaddress
+    if family == 4:
+        return f"{ipaddress.IPv4Address(prefix << (32 - BULK_IP_GROUP_PREFIX_V4))}/{BULK_IP_GROUP_PREFIX_V4}"
+    return f"{ipaddress.IPv6Address(prefix << (128 - BULK_IP_GROUP_PREFIX_V6))}/{BULK_IP_GROUP_PREFIX_V6}"
+
+def group_ip_batch(parsed, asn_idx):
+    """Assign every parsed address a network group: (prefix, ASN) pairs.
+
+    Returns (group_ids, groups) where group_ids[i] indexes into groups
+    (-1 for invalid input) and each group is (family, prefix, asn index).
+    """
+    family = parsed["family"].astype(np.uint64)
+    shift = np.where(family == 4, np.uint64(32 - BULK_IP_GROUP_PREFIX_V4), np.uint64(64 - BULK_IP_GROUP_PREFIX_V6))
+    prefix = parsed["key"] >> shift
+    valid_rows = np.flatnonzero(parsed["valid"])
+    group_ids = np.full(len(family), -1, dtype=np.int64)
+    if not len(valid_rows):
+        return group_ids, []
+    # Prefixes are at most 48 bits, so the whole table fits in int64
+    table = np.stack([family[valid_rows].astype(np.int64), prefix[valid_rows].astype(np.int64),
+                      np.asarray(asn_idx, dtype=np.int64)[valid_rows]], axis=1)
+    unique, inverse = np.unique(table, axis=0, return_inverse=True)
+    group_ids[valid_rows] = inverse.reshape(-1)
+    groups = [tuple(row) for row in unique.tolist()]
+    return group_ids, groups
+
+def run_bulk_ip_investigation(items, reverse_dns=False):
+    """Investigate a list of IPs as batch operations.
+
+    Duplicate addresses are investigated once. Addresses are grouped by
+    network prefix and ASN; geolocation, security, reputation and registry
+    lookups run once per group (and per distinct feed listing within it) and
+    are shared by every member, leaving only PTR lookups per address.
+    Returns {"results": rows in input order, "groups": per-group summaries}.
+    """
+    first_seen = {}
+    for item in items:
+        first_seen.setdefault(item, len(first_seen))
+    unique_items = list(first_seen)
+
+    parsed = parse_ip_batch(unique_items)
+    flags = classify_ip_batch(unique_items, parsed)
+    ipdb = lookup_ip_database_batch(parsed["family"], parsed["key"])
+    geo_records = ipdb["records"].get("geo", [])
+    asn_records = ipdb["records"].get("asn", [])
+    feed_matches = lookup_cidr_feeds_batch(unique_items, parsed)
+    group_ids, groups = group_ip_batch(parsed, ipdb["asn"])
+
+    public_rows = parsed["valid"] & ~flags["is_private"]
+    ptr = {}
+    if reverse_dns:
+        ptr = get_reverse_dns_batch([unique_items[i] for i in np.flatnonzero(public_rows)])
+
+    # Convert arrays to Python lists once instead of indexing NumPy per row
+    valid, family = parsed["valid"].tolist(), parsed["family"].tolist()
+    geo_idx, asn_idx = ipdb["geo"].tolist(), ipdb["asn"].tolist()
+    group_ids = group_ids.tolist()
+    flag_lists = {name: flags[name].tolist() for name in ("is_private", "is_reserved", "is_multicast", "is_loopback", "is_global")}
+    class_labels = IP_CLASS_LABELS[flags["network_class"]].tolist()
+
+    # Registry data comes from the RDAP cache; one lookup per public network
+    # group is queued in the background for groups not cached yet
+    representatives = {}
+    for i, gid in enumerate(group_ids):
+        if gid >= 0 and not flag_lists["is_private"][i]:
+            representatives.setdefault(gid, unique_items[i])
+    rdap_prefetch("ip", list(representatives.values()))
+
+    group_state = [None] * len(groups)
+    network_cache = {}
+    unique_results = []
+    for i, ip in enumerate(unique_items):
+        if not valid[i]:
+            unique_results.append({"ok": False, "error": "Invalid IP address format"})
+            continue
+        gid = group_ids[i]
+        state = group_state[gid]
+        if state is None:
+            # The first member stands in for the group's network-level lookups
+            geo = geo_records[geo_idx[i]] if geo_idx[i] >= 0 else None
+            asn = asn_records[asn_idx[i]] if asn_idx[i] >= 0 else None
+            state = group_state[gid] = {
+                "network": _network_group_label(*groups[gid][:2]),
+                "is_private": flag_lists["is_private"][i],
+                "geolocation": dict(geo_record_to_dict(geo, asn), source="Offline IP Database") if (geo or asn) else {},
+                "additional_info": None if flag_lists["is_private"][i] else get_additional_ip_info(ip, wait=False),
+                "members": 0,
+                "addresses": 0,
+                "listings": {}
+            }
+        state["addresses"] += 1
+        data = {
+            "ip": ip,
+            "ip_version": f"IPv{family[i]}",
+            "is_private": flag_lists["is_private"][i],
+            "network_group": state["network"],
+            "network_info": {
+                "is_global": flag_lists["is_global"][i],
+                "is_reserved": flag_lists["is_reserved"][i],
+                "is_multicast": flag_lists["is_multicast"][i],
+                "is_loopback": flag_lists["is_loopback"][i],
+                "network_class": class_labels[i]
+            }
+        }
+        if not data["is_private"]:
+            # Feeds can list single hosts, so share verdicts per distinct listing
+            signature = (gid, tuple(m["tag"] for m in feed_matches[i]))
+            verdict = network_cache.get(signature)
+            if verdict is None:
+                verdict = network_cache[signature] = {
+                    "security_analysis": analyze_ip_security(ip, feed_matches[i]),
+                    "reputation": check_ip_reputation(ip, feed_matches[i])
+                }
+                state["listings"][signature[1]] = verdict
+            data["geolocation"] = state["geolocation"]
+            data["security_analysis"] = verdict["security_analysis"]
+            data["reputation"] = verdict["reputation"]
+            data["additional_info"] = state["additional_info"]
+            if reverse_dns:
+                data["reverse_dns"] = ptr.get(ip, {})
+        unique_results.append({"ok": True, "data": data})
+
+    results = []
+    for item in items:
+        result = unique_results[first_seen[item]]
+        if result["ok"]:
+            group_state[group_ids[first_seen[item]]]["members"] += 1
+        results.append({"item": item, "type": "ip", "result": result, "status": "success" if result["ok"] else "error"})
+
+    summaries = []
+    for (group_family, _, _), state in zip(groups, group_state):
+        geolocation = state["geolocation"]
+        verdicts = list(state["listings"].values())
+        risk_levels = [v["security_analysis"].get("risk_level", "Low") for v in verdicts]
+        summaries.append({
+            "network": state["network"],
+            "ip_version": f"IPv{group_family}",
+            "asn": geolocation.get("asn", "Unknown"),
+            "organization": geolocation.get("organization", "Unknown"),
+            "country": geolocation.get("country", "Unknown"),
+            "is_private": state["is_private"],
+            "members": state["members"],
+            "unique_addresses": state["addresses"],
+            "listed_in": sorted({tag for tags in state["listings"] for tag in tags}),
+            "highest_risk": max(risk_levels, key=IP_RISK_ORDER.index, default="N/A" if state["is_private"] else "Low")
+        })
+    summaries.sort(key=lambda g: g["members"], reverse=True)
+    return {"results": results, "groups": summaries}
+
 def get_enhanced_domain_analysis(domain):
     """Enhanced domain analysis with multiple data points."""
     try:
@@ -1616,12 +4467,17 @@ def get_enhanced_domain_analysis(domain):
         else:
             domain_info["domain_reputation"] = "Personal/Unknown"
         
-        # Try to get MX records (simplified for demo)
-        try:
-            import socket
-            domain_info["has_mail_service"] = True  # Assume true if domain exists
-        except:
-            domain_info["has_mail_service"] = False
+        # MX and address records, then the mail hosts' addresses; answers are
+        # cached per TTL and recorded in the passive-DNS store
+        answers = resolve_names_batch([(domain, "MX"), (domain, "A"), (domain, "AAAA")])
+        mx = answers[(domain, "MX")]
+        domain_info["mx_records"] = mx["records"]
+        domain_info["addresses"] = answers[(domain, "A")]["records"] + answers[(domain, "AAAA")]["records"]
+        mx_hosts = [host for _, host in (r.split(None, 1) for r in mx["records"]) if host and host != "."]
+        if mx_hosts:
+            resolve_names_batch([(host, rtype) for host in dict.fromkeys(mx_hosts) for rtype in ("A", "AAAA")])
+        # A domain with an address but no MX still receives mail (RFC 5321 implicit MX)
+        domain_info["has_mail_service"] = bool(mx_hosts) or (mx["status"] == "no_answer" and bool(domain_info["addresses"]))
         
         return domain_info
         
@@ -1647,6 +4503,8 @@ def get_comprehensive_breach_intelligence(email):
         
         # Use simulated breach data (realistic patterns)
         hibp_result = check_hibp_breaches(email)
+        if hibp_result.get("deferred"):
+            breach_intel["hibp_pending"] = True
         if hibp_result["success"]:
             breach_intel["breach_sources"] = hibp_result["breaches"]
             breach_intel["breach_count"] = len(hibp_result["breaches"])
@@ -1693,12 +4551,236 @@ def get_comprehensive_breach_intelligence(email):
     except Exception as e:
         return {"error": str(e), "simulation_mode": True}
 
-def check_hibp_breaches(email):
-    """Check HaveIBeenPwned for email breaches (real API if key provided, simulation otherwise)."""
+# --- Offline breach corpus index ---
+# Sorted fixed-width records of (SHA-1 of normalized email, breach id), one per
+# email/breach pair, memory-mapped for O(log n) lookups shared by all workers.
+# Breach ids map to names/dates in a JSON catalog next to the index file.
+BREACH_RECORD = struct.Struct(">20sH")
+BREACH_MERGE_CHUNK = 1_000_000  # records sorted in memory per run while merging dumps
+
+_breach_index = {"mm": None, "count": 0, "catalog": {}, "stat": None, "checked_at": 0.0}
+_breach_index_lock = threading.Lock()
+
+def breach_catalog_path(index_path):
+    return os.path.splitext(index_path)[0] + ".json"
+
+def load_breach_catalog(index_path):
+    """Load the breach id catalog ({id: {"name": ..., "date": ...}})."""
     try:
-        # Check if we have a real HIBP API key
-        if HIBP_API_KEY and HIBP_API_KEY != "your_hibp_api_key_here":
-            return check_hibp_real_api(email)
+        with open(breach_catalog_path(index_path), encoding="utf-8") as fh:
+            return {int(k): v for k, v in json.load(fh).items()}
+    except (OSError, ValueError):
+        return {}
+
+def get_breach_index():
+    """Current index snapshot, remapping the file if it was replaced since the last check."""
+    global _breach_index
+    index = _breach_index
+    now = time.time()
+    if now - index["checked_at"] < BREACH_INDEX_RELOAD_INTERVAL:
+        return index
+
+    with _breach_index_lock:
+        index = _breach_index
+        if now - index["checked_at"] < BREACH_INDEX_RELOAD_INTERVAL:
+            return index
+        try:
+            st = os.stat(BREACH_INDEX_PATH)
+            stat_key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        except OSError:
+            stat_key = None
+
+        if stat_key == index["stat"]:
+            new_index = dict(index, checked_at=now)
+        elif stat_key is None or stat_key[1] == 0:
+            new_index = {"mm": None, "count": 0, "catalog": {}, "stat": stat_key, "checked_at": now}
+        else:
+            with open(BREACH_INDEX_PATH, "rb") as fh:
+                mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            new_index = {
+                "mm": mm,
+                "count": len(mm) // BREACH_RECORD.size,
+                "catalog": load_breach_catalog(BREACH_INDEX_PATH),
+                "stat": stat_key,
+                "checked_at": now
+            }
+        # Readers keep the snapshot they grabbed; the old map closes once unreferenced
+        _breach_index = new_index
+        return new_index
+
+def lookup_breach_index(email):
+    """Return breach ids recorded for the email, or None when no index is loaded."""
+    index = get_breach_index()
+    mm = index["mm"]
+    if mm is None:
+        return None
+
+    digest = bytes.fromhex(hash_email_sha1(email))
+    size = BREACH_RECORD.size
+    lo, hi = 0, index["count"]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if mm[mid * size:mid * size + 20] < digest:
+            lo = mid + 1
+        else:
+            hi = mid
+
+    breach_ids = []
+    while lo < index["count"]:
+        record_hash, breach_id = BREACH_RECORD.unpack_from(mm, lo * size)
+        if record_hash != digest:
+            break
+        breach_ids.append(breach_id)
+        lo += 1
+    return breach_ids
+
+def check_breach_index(email):
+    """Answer a breach check from the offline index (None if no index is available)."""
+    breach_ids = lookup_breach_index(email)
+    if breach_ids is None:
+        return None
+
+    catalog = get_breach_index()["catalog"]
+    breaches = []
+    latest_date = None
+    for breach_id in breach_ids:
+        entry = catalog.get(breach_id, {})
+        breach_name = entry.get("name") or f"Breach #{breach_id}"
+        breach_date = entry.get("date")
+        breaches.append(f"{breach_name} ({breach_date})" if breach_date else breach_name)
+        if breach_date and (not latest_date or breach_date > latest_date):
+            latest_date = breach_date
+
+    return {
+        "success": True,
+        "breaches": breaches,
+        "paste_count": 0,
+        "last_breach_date": latest_date,
+        "error": None,
+        "simulation_mode": False,
+        "source": "offline_index"
+    }
+
+def _iter_dump_digests(path):
+    """Yield 20-byte SHA-1 digests from a dump of emails, email:password lines or SHA-1 hex."""
+    with open(path, encoding="utf-8", errors="ignore") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            if len(line) == 40 and re.fullmatch(r'[0-9a-fA-F]{40}', line):
+                yield bytes.fromhex(line)
+                continue
+            candidate = re.split(r'[:;,\t ]', line, 1)[0]
+            if '@' in candidate:
+                yield bytes.fromhex(hash_email_sha1(candidate))
+
+def _write_sorted_run(records, directory):
+    records.sort()
+    fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(b"".join(records))
+    return path
+
+def _iter_index_records(path):
+    size = BREACH_RECORD.size
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(size * 4096)
+            if not chunk:
+                break
+            for offset in range(0, len(chunk) - size + 1, size):
+                yield chunk[offset:offset + size]
+
+def merge_breach_dump(dump_paths, breach_name, breach_date=None, index_path=None):
+    """Merge email dumps for one breach into the index; returns (added, total) record counts.
+
+    New records are sorted in bounded runs, then streamed together with the
+    existing index into a temp file that atomically replaces it.
+    """
+    index_path = index_path or BREACH_INDEX_PATH
+    directory = os.path.dirname(os.path.abspath(index_path))
+    os.makedirs(directory, exist_ok=True)
+
+    catalog = load_breach_catalog(index_path)
+    breach_id = next((bid for bid, entry in catalog.items() if entry.get("name") == breach_name), None)
+    if breach_id is None:
+        breach_id = max(catalog, default=0) + 1
+        if breach_id > 0xFFFF:
+            raise ValueError("Breach catalog is full (65535 breaches)")
+    catalog[breach_id] = {"name": breach_name, "date": breach_date or catalog.get(breach_id, {}).get("date")}
+
+    runs = []
+    try:
+        pending = []
+        for path in dump_paths:
+            for digest in _iter_dump_digests(path):
+                pending.append(BREACH_RECORD.pack(digest, breach_id))
+                if len(pending) >= BREACH_MERGE_CHUNK:
+                    runs.append(_write_sorted_run(pending, directory))
+                    pending = []
+        if pending:
+            runs.append(_write_sorted_run(pending, directory))
+
+        sources = [_iter_index_records(run) for run in runs]
+        if os.path.exists(index_path):
+            sources.append(_iter_index_records(index_path))
+
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+        added = total = 0
+        with os.fdopen(fd, "wb") as out:
+            previous = None
+            buffer = []
+            for record in heapq.merge(*sources):
+                if record == previous:
+                    continue
+                previous = record
+                buffer.append(record)
+                total += 1
+                if len(buffer) >= 4096:
+                    out.write(b"".join(buffer))
+                    buffer = []
+            out.write(b"".join(buffer))
+        previous_total = os.path.getsize(index_path) // BREACH_RECORD.size if os.path.exists(index_path) else 0
+        added = total - previous_total
+
+        catalog_tmp = breach_catalog_path(tmp_path)
+        with open(catalog_tmp, "w", encoding="utf-8") as fh:
+            json.dump({str(k): v for k, v in sorted(catalog.items())}, fh, indent=2)
+        os.replace(catalog_tmp, breach_catalog_path(index_path))
+        os.replace(tmp_path, index_path)
+        return added, total
+    finally:
+        for run in runs:
+            try:
+                os.remove(run)
+            except OSError:
+                pass
+
+@app.cli.command("breach-index-merge")
+@click.argument("dumps", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--name", "breach_name", required=True, help="Breach name shown in results, e.g. 'Adobe'.")
+@click.option("--date", "breach_date", default=None, help="Breach date (YYYY-MM-DD).")
+@click.option("--index", "index_path", default=None, help="Index file (defaults to BREACH_INDEX_PATH).")
+def breach_index_merge_command(dumps, breach_name, breach_date, index_path):
+    """Merge breach dump files into the offline breach index."""
+    added, total = merge_breach_dump(dumps, breach_name, breach_date, index_path)
+    click.echo(f"Merged {added} new records for '{breach_name}' ({total} records in index)")
+
+def check_hibp_breaches(email):
+    """Check breaches: offline index first, then real HIBP API if key provided, simulation otherwise."""
+    try:
+        # Local corpus answers without a network call when it knows the email
+        local_result = check_breach_index(email)
+        if local_result and local_result["breaches"]:
+            return local_result
+        
+        # Check if we have a real HIBP API key
+        if HIBP_API_KEY and HIBP_API_KEY != "your_hibp_api_key_here":
+            return check_hibp_real_api(email)
+        elif local_result is not None:
+            # An index is loaded and has no record of this email
+            return local_result
         else:
             return check_hibp_simulation(email)
         
@@ -1710,17 +4792,274 @@ def check_hibp_breaches(email):
             "simulation_mode": True
         }
 
-def check_hibp_real_api(email):
-    """Use real HaveIBeenPwned API with provided key."""
+# --- Shared HIBP client ---
+# Requests from every thread and gunicorn worker reserve send slots in one
+# lock-protected state file, so together they stay under the key's rate limit.
+HIBP_API_BASE = "https://haveibeenpwned.com/api/v3"
+HIBP_RATE_LIMIT_PER_MINUTE = float(os.environ.get("HIBP_RATE_LIMIT_PER_MINUTE", 10))  # depends on key tier
+HIBP_RATE_STATE_PATH = os.environ.get("HIBP_RATE_STATE_PATH", os.path.join(tempfile.gettempdir(), "osint_hibp_rate.state"))
+HIBP_CACHE_TTL = int(os.environ.get("HIBP_CACHE_TTL", 6 * 3600))
+HIBP_MAX_RETRIES = int(os.environ.get("HIBP_MAX_RETRIES", 3))
+HIBP_MAX_WAIT = 60  # seconds; never park a request longer than this for a slot
+HIBP_CACHE_MAX = 10000  # cached per-address results
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: pace within this process only
+    fcntl = None
+
+_hibp_cache = {}  # email -> (timestamp, result)
+_hibp_cache_lock = threading.Lock()
+_hibp_pace_lock = threading.Lock()
+_hibp_local_pace = {"next_slot": 0.0}  # used when fcntl is unavailable
+_hibp_session = requests.Session()
+_hibp_executor = ThreadPoolExecutor(max_workers=4)
+_hibp_deferred_executor = ThreadPoolExecutor(max_workers=2)
+_hibp_deferred = set()  # emails waiting in the background for a slot
+
+class HIBPQueueFull(Exception):
+    """Every slot within HIBP_MAX_WAIT is taken."""
+
+def _hibp_update_next_slot(update):
+    """Atomically read-modify-write the shared next-free-slot timestamp."""
+    with _hibp_pace_lock:
+        if fcntl is None:
+            _hibp_local_pace["next_slot"], result = update(_hibp_local_pace["next_slot"])
+            return result
+        with open(HIBP_RATE_STATE_PATH, "a+") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                fh.seek(0)
+                try:
+                    next_slot = float(fh.read().strip() or 0)
+                except ValueError:
+                    next_slot = 0.0
+                next_slot, result = update(next_slot)
+                fh.seek(0)
+                fh.truncate()
+                fh.write(repr(next_slot))
+                fh.flush()
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+            return result
+
+def hibp_reserve_slot(block=False):
+    """Reserve the next request slot across all workers and sleep until it arrives.
+
+    A slot further than HIBP_MAX_WAIT away is left untaken: HIBPQueueFull is
+    raised, or with block=True the call waits for the queue to drain and retries.
+    """
+    interval = 60.0 / max(HIBP_RATE_LIMIT_PER_MINUTE, 0.001)
+
+    def reserve(next_slot):
+        slot = max(time.time(), next_slot)
+        if slot - time.time() > HIBP_MAX_WAIT:
+            return next_slot, (False, slot)
+        return slot + interval, (True, slot)
+
+    while True:
+        taken, slot = _hibp_update_next_slot(reserve)
+        delay = slot - time.time()
+        if taken:
+            break
+        if not block:
+            raise HIBPQueueFull("HIBP request queue is saturated")
+        time.sleep(max(interval, delay - HIBP_MAX_WAIT))
+    if delay > 0:
+        time.sleep(delay)
+
+def hibp_backoff(seconds):
+    """Push every worker's next slot back after HIBP answered 429."""
+    resume_at = time.time() + seconds
+    _hibp_update_next_slot(lambda next_slot: (max(next_slot, resume_at), None))
+
+def hibp_get(path, params=None, timeout=10, block=False):
+    """Paced GET against the HIBP API, retrying 429s after the advertised Retry-After.
+
+    Raises HIBPQueueFull when no slot is free within HIBP_MAX_WAIT, unless block is set.
+    """
+    headers = {
+        'User-Agent': 'OSINT-Portal-Investigation-Tool',
+        'hibp-api-key': HIBP_API_KEY
+    }
+    for attempt in range(HIBP_MAX_RETRIES + 1):
+        hibp_reserve_slot(block)
+        response = _hibp_session.get(f"{HIBP_API_BASE}/{path}", headers=headers, params=params, timeout=timeout)
+        if response.status_code != 429 or attempt == HIBP_MAX_RETRIES:
+            return response
+        try:
+            retry_after = float(response.headers.get("Retry-After", 2))
+        except ValueError:
+            retry_after = 2.0
+        print(f"HIBP 429 on {path}; retrying in {retry_after}s (attempt {attempt + 1})")
+        hibp_backoff(retry_after)
+    return response
+
+# --- HIBP domain search ---
+# For domains verified on the API key, one breacheddomain call returns every
+# breached alias on the domain; bulk jobs prefetch it and per-address checks
+# are answered from it locally (pastes are not part of domain search results).
+HIBP_DOMAIN_SEARCH = os.environ.get("HIBP_DOMAIN_SEARCH", "true").lower() == "true"
+HIBP_DOMAIN_SEARCH_MIN_ADDRESSES = int(os.environ.get("HIBP_DOMAIN_SEARCH_MIN_ADDRESSES", 2))
+HIBP_FAILURE_TTL = 300  # seconds before retrying a domain list or catalog fetch that failed
+
+_hibp_domain_cache = {}  # domain -> (timestamp, {alias: [breach names]})
+_hibp_verified_domains = {"domains": frozenset(), "fetched_at": 0.0, "failed_at": 0.0}
+_hibp_breach_dates = {"dates": {}, "fetched_at": 0.0, "failed_at": 0.0}
+
+def get_hibp_verified_domains():
+    """Domains verified for domain search on this API key (cached)."""
+    now = time.time()
+    if _hibp_verified_domains["fetched_at"] and now - _hibp_verified_domains["fetched_at"] < HIBP_CACHE_TTL:
+        return _hibp_verified_domains["domains"]
+    # After a failed lookup keep the last list (or none) for HIBP_FAILURE_TTL, not the full cache TTL
+    if now - _hibp_verified_domains["failed_at"] < HIBP_FAILURE_TTL:
+        return _hibp_verified_domains["domains"]
     try:
-        api_url = f"https://haveibeenpwned.com/api/v3/breachedaccount/{email}"
+        response = hibp_get("subscribeddomains")
+        if response.status_code == 200:
+            domains = frozenset(d.get("DomainName", "").lower() for d in response.json() or [])
+            _hibp_verified_domains.update(domains=domains, fetched_at=now)
+        else:
+            app.logger.warning("HIBP subscribed domains lookup returned %s", response.status_code)
+            _hibp_verified_domains["failed_at"] = now
+    except Exception as e:
+        app.logger.warning("HIBP subscribed domains lookup failed: %s", e)
+        _hibp_verified_domains["failed_at"] = now
+    return _hibp_verified_domains["domains"]
+
+def get_hibp_breach_dates():
+    """Breach name -> BreachDate from the public breach catalog (cached)."""
+    now = time.time()
+    if _hibp_breach_dates["dates"] and now - _hibp_breach_dates["fetched_at"] < HIBP_CACHE_TTL:
+        return _hibp_breach_dates["dates"]
+    # While HIBP is degraded, serve the last catalog (or none) instead of spending key slots on retries
+    if now - _hibp_breach_dates["failed_at"] < HIBP_FAILURE_TTL:
+        return _hibp_breach_dates["dates"]
+    try:
+        response = hibp_get("breaches")
+        if response.status_code == 200:
+            dates = {b.get("Name"): b.get("BreachDate") for b in response.json() or []}
+            _hibp_breach_dates.update(dates=dates, fetched_at=now)
+        else:
+            app.logger.warning("HIBP breach catalog lookup returned %s", response.status_code)
+            _hibp_breach_dates["failed_at"] = now
+    except Exception as e:
+        app.logger.warning("HIBP breach catalog lookup failed: %s", e)
+        _hibp_breach_dates["failed_at"] = now
+    return _hibp_breach_dates["dates"]
+
+def prefetch_hibp_domain(domain):
+    """Run one domain search for a verified domain; returns False if per-address calls are needed."""
+    domain = domain.lower()
+    now = time.time()
+    cache_entry = _hibp_domain_cache.get(domain)
+    if cache_entry and now - cache_entry[0] < HIBP_CACHE_TTL:
+        return True
+    if domain not in get_hibp_verified_domains():
+        return False
+    try:
+        response = hibp_get(f"breacheddomain/{requests.utils.quote(domain)}")
+        if response.status_code == 200:
+            aliases = {alias.lower(): names for alias, names in (response.json() or {}).items()}
+        elif response.status_code == 404:
+            aliases = {}
+        else:
+            app.logger.warning("HIBP domain search for %s returned %s; using per-address calls", domain, response.status_code)
+            return False
+    except Exception as e:
+        app.logger.warning("HIBP domain search for %s failed: %s; using per-address calls", domain, e)
+        return False
+    with _hibp_cache_lock:
+        _hibp_domain_cache[domain] = (now, aliases)
+    return True
+
+def prefetch_hibp_domains(email_groups):
+    """Domain-search every verified domain with enough addresses in a bulk batch."""
+    if not (HIBP_DOMAIN_SEARCH and HIBP_API_KEY and HIBP_API_KEY != "your_hibp_api_key_here"):
+        return []
+    searched = []
+    for domain, addresses in email_groups.items():
+        if len(set(a.lower() for a in addresses)) >= HIBP_DOMAIN_SEARCH_MIN_ADDRESSES and prefetch_hibp_domain(domain):
+            searched.append(domain)
+    return searched
+
+def check_hibp_domain_cache(email):
+    """Answer a breach check from a cached domain search, or None if the domain was not searched."""
+    local_part, _, domain = email.strip().lower().rpartition('@')
+    cache_entry = _hibp_domain_cache.get(domain)
+    if not cache_entry or time.time() - cache_entry[0] >= HIBP_CACHE_TTL:
+        return None
+
+    breach_dates = get_hibp_breach_dates()
+    breach_names = []
+    latest_date = None
+    for name in cache_entry[1].get(local_part, []):
+        breach_date = breach_dates.get(name)
+        breach_names.append(f"{name} ({breach_date})" if breach_date else name)
+        if breach_date and (not latest_date or breach_date > latest_date):
+            latest_date = breach_date
+
+    return {
+        "success": True,
+        "breaches": breach_names,
+        "paste_count": 0,
+        "last_breach_date": latest_date,
+        "error": None,
+        "simulation_mode": False,
+        "source": "hibp_domain_search"
+    }
+
+def _defer_hibp_check(email):
+    """Re-run a check that found the queue full once a slot frees up, caching the answer."""
+    with _hibp_cache_lock:
+        if email in _hibp_deferred:
+            return
+        _hibp_deferred.add(email)
+
+    def check():
+        try:
+            check_hibp_real_api(email, block=True)
+        finally:
+            with _hibp_cache_lock:
+                _hibp_deferred.discard(email)
+    _hibp_deferred_executor.submit(check)
+
+def check_hibp_real_api(email, block=False):
+    """Use real HaveIBeenPwned API with provided key (cached per email, paced, breaches and pastes in parallel).
+
+    When the shared queue is full the check is deferred to a background
+    thread and reported as {"deferred": True}; a later call reads its cached answer.
+    """
+    try:
+        cache_key = email.strip().lower()
+        now = time.time()
+        cache_entry = _hibp_cache.get(cache_key)
+        if cache_entry and now - cache_entry[0] < HIBP_CACHE_TTL:
+            return cache_entry[1]
         
-        headers = {
-            'User-Agent': 'OSINT-Portal-Investigation-Tool',
-            'hibp-api-key': HIBP_API_KEY
-        }
+        domain_result = check_hibp_domain_cache(cache_key)
+        if domain_result is not None:
+            return domain_result
         
-        response = requests.get(api_url, headers=headers, timeout=10)
+        quoted = requests.utils.quote(cache_key)
+        breach_future = _hibp_executor.submit(hibp_get, f"breachedaccount/{quoted}", {"truncateResponse": "false"}, 10, block)
+        paste_future = _hibp_executor.submit(hibp_get, f"pasteaccount/{quoted}", None, 5, block)
+        
+        try:
+            response = breach_future.result()
+        except HIBPQueueFull:
+            paste_future.cancel()
+            _defer_hibp_check(cache_key)
+            return {
+                "success": False,
+                "deferred": True,
+                "breaches": [],
+                "paste_count": 0,
+                "last_breach_date": None,
+                "error": None,
+                "simulation_mode": False
+            }
         
         result = {
             "success": False,
@@ -1760,19 +5099,36 @@ def check_hibp_real_api(email):
         else:
             result["error"] = f"API returned status {response.status_code}"
         
-        # Check for pastes
+        # Pastes were fetched concurrently with the breaches; without them the
+        # result is partial and is not cached
         try:
-            paste_url = f"https://haveibeenpwned.com/api/v3/pasteaccount/{email}"
-            paste_response = requests.get(paste_url, headers=headers, timeout=5)
+            paste_response = paste_future.result()
             
             if paste_response.status_code == 200:
                 pastes_data = paste_response.json()
                 result["paste_count"] = len(pastes_data) if pastes_data else 0
             elif paste_response.status_code == 404:
                 result["paste_count"] = 0
+            else:
+                result["partial"] = True
                 
-        except:
-            pass
+        except HIBPQueueFull:
+            result.update(partial=True, deferred=True)
+            _defer_hibp_check(cache_key)
+        except (requests.RequestException, ValueError) as e:
+            app.logger.warning("HIBP paste lookup failed: %s", e)
+            result["partial"] = True
+        
+        if result["success"] and not result.get("partial"):
+            with _hibp_cache_lock:
+                if len(_hibp_cache) >= HIBP_CACHE_MAX:
+                    # Drop expired entries first, then the oldest insertions
+                    for key in [k for k, (ts, _) in _hibp_cache.items() if now - ts >= HIBP_CACHE_TTL]:
+                        _hibp_cache.pop(key, None)
+                    while len(_hibp_cache) >= HIBP_CACHE_MAX:
+                        _hibp_cache.pop(next(iter(_hibp_cache)))
+                _hibp_cache.pop(cache_key, None)
+                _hibp_cache[cache_key] = (now, result)
         
         return result
         
@@ -1940,17 +5296,21 @@ def generate_email_osint_urls(email, local_part, domain):
     except Exception as e:
         return {"error": str(e)}
 
-def get_professional_email_analysis(email, domain):
+def get_professional_email_analysis(email, domain, domain_intel=None, local_intel=None):
     """Analyze professional aspects of the email."""
     try:
+        if domain_intel is None:
+            domain_intel = get_domain_intelligence(domain)
+        if local_intel is None:
+            local_intel = classify_local_part(email.split('@')[0])
         analysis = {
-            "is_personal_provider": is_personal_email_provider(domain),
-            "is_corporate": is_corporate_domain(domain),
-            "is_educational": is_educational_domain(domain),
-            "is_government": is_government_domain(domain),
-            "likely_role": determine_email_role(email.split('@')[0]),
+            "is_personal_provider": domain_intel["is_personal_provider"],
+            "is_corporate": domain_intel["is_corporate"],
+            "is_educational": domain_intel["is_educational"],
+            "is_government": domain_intel["is_government"],
+            "likely_role": local_intel["role"],
             "business_likelihood": "Unknown",
-            "contact_type": "Unknown"
+            "contact_type": local_intel["contact_type"]
         }
         
         # Determine business likelihood
@@ -1961,32 +5321,20 @@ def get_professional_email_analysis(email, domain):
         else:
             analysis["business_likelihood"] = "Medium"
         
-        # Determine contact type
-        local_part = email.split('@')[0].lower()
-        if local_part in ['admin', 'administrator', 'root', 'webmaster']:
-            analysis["contact_type"] = "Administrative"
-        elif local_part in ['info', 'contact', 'hello', 'support']:
-            analysis["contact_type"] = "General Contact"
-        elif local_part in ['sales', 'marketing', 'business']:
-            analysis["contact_type"] = "Business"
-        elif local_part in ['hr', 'jobs', 'careers', 'recruitment']:
-            analysis["contact_type"] = "Human Resources"
-        else:
-            analysis["contact_type"] = "Personal/Individual"
-        
         return analysis
         
     except Exception as e:
         return {"error": str(e)}
 
-def assess_email_risk(email, domain, breach_intel, social_presence):
+def assess_email_risk(email, domain, breach_intel, social_presence, domain_intel=None):
     """Assess risk associated with the email address using real breach data."""
     try:
         risk_factors = []
         trust_score = 85
         
         # Check for disposable email
-        if is_disposable_email_enhanced(domain):
+        is_disposable = domain_intel["is_disposable"] if domain_intel else is_disposable_email_enhanced(domain)
+        if is_disposable:
             risk_factors.append("Disposable/temporary email service")
             trust_score -= 30
         
@@ -2074,15 +5422,19 @@ def assess_email_risk(email, domain, breach_intel, social_presence):
     except Exception as e:
         return {"error": str(e)}
 
-def get_additional_email_intelligence(email, local_part, domain):
+def get_additional_email_intelligence(email, local_part, domain, domain_intel=None, local_intel=None):
     """Gather additional intelligence about the email."""
     try:
+        if domain_intel is None:
+            domain_intel = get_domain_intelligence(domain)
+        if local_intel is None:
+            local_intel = classify_local_part(local_part)
         intelligence = {
             "email_variations": generate_email_variations(local_part, domain),
-            "related_domains": get_related_domains(domain),
-            "timezone_estimate": estimate_timezone_from_domain(domain),
-            "language_indicators": detect_language_indicators(email),
-            "pattern_analysis": analyze_email_patterns(local_part)
+            "related_domains": domain_intel["related_domains"],
+            "timezone_estimate": domain_intel["timezone_estimate"],
+            "language_indicators": local_intel["script"],
+            "pattern_analysis": local_intel["pattern_analysis"]
         }
         
         return intelligence
@@ -2092,34 +5444,78 @@ def get_additional_email_intelligence(email, local_part, domain):
 
 # Enhanced helper functions for email investigation
 
+# --- Disposable domain index ---
+# Built-in seed list; larger public lists (one domain per line, '#' comments)
+# are loaded from DISPOSABLE_DOMAINS_PATH and hot-reloaded when they change.
+DISPOSABLE_DOMAINS_PATH = os.environ.get("DISPOSABLE_DOMAINS_PATH", os.path.join("data", "disposable_domains.txt"))
+DISPOSABLE_RELOAD_INTERVAL = int(os.environ.get("DISPOSABLE_RELOAD_INTERVAL", 30))  # seconds between mtime checks
+
+BUILTIN_DISPOSABLE_DOMAINS = frozenset([
+    '10minutemail.com', 'guerrillamail.com', 'mailinator.com',
+    'tempmail.org', 'throwaway.email', 'temp-mail.org', 'yopmail.com',
+    'maildrop.cc', 'sharklasers.com', 'guerrillamailblock.com',
+    'trbvm.com', 'tmailinator.com', 'spambox.us', 'mailnator.com',
+    'trashmail.com', 'dispostable.com', '20minutemail.it'
+])
+
+# Common disposable naming patterns, compiled once into a single alternation
+DISPOSABLE_PATTERN = re.compile(r'temp.*mail|disposable|trash.*mail|10minute|guerrilla|mailinator')
+
+_disposable_index = {"domains": BUILTIN_DISPOSABLE_DOMAINS, "mtimes": None, "checked_at": 0.0}
+_disposable_lock = threading.Lock()
+
+def load_disposable_domains(paths):
+    """Read disposable domain list files into a set (missing files are skipped)."""
+    domains = set(BUILTIN_DISPOSABLE_DOMAINS)
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8", errors="ignore") as fh:
+                for line in fh:
+                    entry = line.split('#', 1)[0].strip().lower().lstrip('.')
+                    if entry:
+                        domains.add(entry)
+        except OSError as e:
+            print(f"Disposable list {path} not loaded: {e}")
+    return frozenset(domains)
+
+def get_disposable_domains():
+    """Current disposable domain set, reloading the list files if their mtimes changed."""
+    now = time.time()
+    index = _disposable_index
+    if now - index["checked_at"] < DISPOSABLE_RELOAD_INTERVAL:
+        return index["domains"]
+
+    with _disposable_lock:
+        if now - _disposable_index["checked_at"] < DISPOSABLE_RELOAD_INTERVAL:
+            return _disposable_index["domains"]
+        paths = [p for p in DISPOSABLE_DOMAINS_PATH.split(os.pathsep) if p]
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        domains = _disposable_index["domains"]
+        if mtimes != _disposable_index["mtimes"]:
+            domains = load_disposable_domains([p for p, m in mtimes.items() if m is not None])
+        # Each item assignment is atomic, so lock-free readers see either the old or new set
+        _disposable_index.update(domains=domains, mtimes=mtimes, checked_at=now)
+    return domains
+
 def is_disposable_email_enhanced(domain):
-    """Enhanced disposable email detection."""
-    disposable_domains = [
-        '10minutemail.com', 'guerrillamail.com', 'mailinator.com',
-        'tempmail.org', 'throwaway.email', 'temp-mail.org', 'yopmail.com',
-        'maildrop.cc', 'sharklasers.com', 'guerrillamailblock.com',
-        'trbvm.com', 'tmailinator.com', 'spambox.us', 'mailnator.com',
-        'trashmail.com', 'dispostable.com', '20minutemail.it'
-    ]
-    
-    # Check for common disposable patterns
-    disposable_patterns = [
-        r'.*temp.*mail.*', r'.*disposable.*', r'.*trash.*mail.*',
-        r'.*10minute.*', r'.*guerrilla.*', r'.*mailinator.*'
-    ]
-    
-    domain_lower = domain.lower()
-    
-    # Direct match check
-    if domain_lower in disposable_domains:
-        return True
-    
-    # Pattern matching
-    for pattern in disposable_patterns:
-        if re.match(pattern, domain_lower):
+    """Enhanced disposable email detection (exact domain, parent domains and naming patterns)."""
+    domain_lower = domain.lower().strip().rstrip('.')
+    domains = get_disposable_domains()
+    
+    # Direct and parent-domain match: a.b.mailinator.com -> b.mailinator.com -> mailinator.com
+    candidate = domain_lower
+    while candidate:
+        if candidate in domains:
             return True
+        _, _, candidate = candidate.partition('.')
     
-    return False
+    # Pattern matching
+    return DISPOSABLE_PATTERN.search(domain_lower) is not None
 
 def is_educational_domain(domain):
     """Check if domain is educational."""
@@ -2213,11 +5609,12 @@ def hash_email_sha1(email):
     import hashlib
     return hashlib.sha1(email.lower().strip().encode()).hexdigest()
 
-def determine_email_role(local_part):
-    """Determine the likely role/purpose of the email."""
-    local_lower = local_part.lower()
-    
-    role_patterns = {
+# --- Local-part keyword classifier ---
+# Extensible keyword table. "role" keywords match anywhere in the local part and
+# the first listed role wins; "contact_type" keywords must equal the whole local
+# part. After editing the table call build_local_part_classifier() to rebuild.
+LOCAL_PART_KEYWORDS = {
+    "role": {
         "Administrative": ['admin', 'administrator', 'root', 'webmaster', 'postmaster'],
         "Support": ['support', 'help', 'helpdesk', 'service'],
         "Sales/Marketing": ['sales', 'marketing', 'promo', 'offers', 'deals'],
@@ -2226,13 +5623,163 @@ def determine_email_role(local_part):
         "Technical": ['dev', 'developer', 'tech', 'it', 'engineering'],
         "Executive": ['ceo', 'cto', 'cfo', 'director', 'manager'],
         "No-Reply": ['noreply', 'no-reply', 'donotreply', 'automated']
+    },
+    "contact_type": {
+        "Administrative": ['admin', 'administrator', 'root', 'webmaster'],
+        "General Contact": ['info', 'contact', 'hello', 'support'],
+        "Business": ['sales', 'marketing', 'business'],
+        "Human Resources": ['hr', 'jobs', 'careers', 'recruitment']
     }
-    
-    for role, patterns in role_patterns.items():
-        if any(pattern in local_lower for pattern in patterns):
-            return role
-    
-    return "Personal/Individual"
+}
+
+# Script indicators in priority order: (label, [(first_codepoint, last_codepoint), ...])
+LOCAL_PART_SCRIPTS = [
+    ("European Language Characters", [(0xE0, 0xF6), (0xF8, 0xFF)]),
+    ("Cyrillic Characters (Russian/Eastern European)", [(0x430, 0x44F), (0x451, 0x451)]),
+    ("Chinese Characters", [(0x4E00, 0x9FFF)]),
+    ("Japanese Characters", [(0x3040, 0x309F), (0x30A0, 0x30FF)]),
+]
+DEFAULT_SCRIPT = "Latin Characters (English/International)"
+
+def build_keyword_automaton(entries):
+    """Build an Aho-Corasick automaton from (keyword, payload) pairs.
+
+    Returns {"goto": [dict], "fail": [int], "out": [list]} where out[state]
+    holds (keyword_length, payload) for every keyword ending in that state.
+    """
+    goto, fail, out = [{}], [0], [[]]
+    for keyword, payload in entries:
+        state = 0
+        for ch in keyword:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto[state][ch] = nxt
+                goto.append({})
+                fail.append(0)
+                out.append([])
+            state = nxt
+        out[state].append((len(keyword), payload))
+
+    # Breadth-first failure links; each state inherits its fallback's outputs
+    queue = list(goto[0].values())
+    for state in queue:
+        for ch, nxt in goto[state].items():
+            queue.append(nxt)
+            f = fail[state]
+            while f and ch not in goto[f]:
+                f = fail[f]
+            fail[nxt] = goto[f].get(ch, 0)
+            out[nxt] = out[nxt] + out[fail[nxt]]
+    return {"goto": goto, "fail": fail, "out": out}
+
+def build_local_part_classifier():
+    """(Re)build the shared automaton from LOCAL_PART_KEYWORDS."""
+    global _local_part_automaton, _label_priority
+    entries = []
+    _label_priority = {}
+    for kind, labels in LOCAL_PART_KEYWORDS.items():
+        for label, keywords in labels.items():
+            _label_priority.setdefault((kind, label), len(_label_priority))
+            for keyword in keywords:
+                entries.append((keyword.lower(), (kind, label)))
+    _local_part_automaton = build_keyword_automaton(entries)
+
+def _char_script(code):
+    for priority, (_, ranges) in enumerate(LOCAL_PART_SCRIPTS):
+        for lo, hi in ranges:
+            if lo <= code <= hi:
+                return priority
+    return None
+
+def classify_local_part(local_part):
+    """Classify role, contact type, script and shape of an email local part in one pass."""
+    automaton = _local_part_automaton
+    goto, fail, out = automaton["goto"], automaton["fail"], automaton["out"]
+    text = local_part.lower()
+    length = len(text)
+
+    state = 0
+    best_role = None
+    contact_type = None
+    script = None
+    shape = []  # run-length character classes: a=ASCII letter, u=other letter, 0=digit
+    has_numbers = has_separators = False
+
+    for i, ch in enumerate(text):
+        # Keyword matching
+        while state and ch not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(ch, 0)
+        for kw_len, payload in out[state]:
+            if payload[0] == "role":
+                if best_role is None or _label_priority[payload] < _label_priority[best_role]:
+                    best_role = payload
+            elif kw_len == length and i == length - 1:
+                if contact_type is None or _label_priority[payload] < _label_priority[contact_type]:
+                    contact_type = payload
+
+        # Character classes for script and pattern analysis
+        code = ord(ch)
+        if code > 0x7F:
+            priority = _char_script(code)
+            if priority is not None and (script is None or priority < script):
+                script = priority
+        if 'a' <= ch <= 'z':
+            cls = 'a'
+        elif '0' <= ch <= '9':
+            cls = '0'
+            has_numbers = True
+        elif ch in '._-':
+            cls = ch
+            has_separators = True
+        elif ch.isalpha():
+            cls = 'u'
+        elif ch.isdigit():
+            cls = 'd'
+            has_numbers = has_numbers or ch.isdecimal()
+        else:
+            cls = 'x'
+        if not shape or shape[-1] != cls or cls in '._-':
+            shape.append(cls)
+
+    shape = ''.join(shape)
+    if shape in ('a.a', 'a_a', 'a0'):
+        pattern_type = {'a.a': "FirstName.LastName", 'a_a': "FirstName_LastName", 'a0': "Name + Numbers"}[shape]
+        complexity = "Medium"
+    elif shape and set(shape) <= {'a', 'u'}:
+        pattern_type, complexity = "Letters Only", "Low"
+    elif shape and set(shape) <= {'0', 'd'}:
+        pattern_type, complexity = "Numbers Only", "Low"
+    else:
+        pattern_type, complexity = "Mixed/Complex", "High"
+
+    return {
+        "role": best_role[1] if best_role else "Personal/Individual",
+        "contact_type": contact_type[1] if contact_type else "Personal/Individual",
+        "script": LOCAL_PART_SCRIPTS[script][0] if script is not None else DEFAULT_SCRIPT,
+        "pattern_analysis": {
+            "length": length,
+            "has_numbers": has_numbers,
+            "has_separators": has_separators,
+            "pattern_type": pattern_type,
+            "complexity": complexity
+        }
+    }
+
+def classify_local_parts(local_parts):
+    """Batch form of classify_local_part; duplicate local parts are classified once."""
+    seen = {}
+    for local_part in local_parts:
+        if local_part not in seen:
+            seen[local_part] = classify_local_part(local_part)
+    return [seen[local_part] for local_part in local_parts]
+
+build_local_part_classifier()
+
+def determine_email_role(local_part):
+    """Determine the likely role/purpose of the email."""
+    return classify_local_part(local_part)["role"]
 
 def generate_email_variations(local_part, domain):
     """Generate common variations of the email address."""
@@ -2262,6 +5809,183 @@ def generate_email_variations(local_part, domain):
     
     return variations[:10]  # Limit to 10 variations
 
+# --- Local passive-DNS store ---
+# Every resolution the portal performs is kept as a (name, type, value)
+# observation with first/last seen times, in its own SQLite file. Rows are
+# only added or have their seen window widened, never rewritten. The table
+# is clustered on (name, type, value) with a (value, type, name) index, so
+# both "what did this name resolve to" and "which names pointed here" are
+# single index range scans. Observations are aggregated in memory and
+# written in batches; a triple already written within
+# PASSIVE_DNS_LAST_SEEN_GRANULARITY is not written again.
+PASSIVE_DNS_PATH = os.environ.get("PASSIVE_DNS_PATH", os.path.join("data", "passive_dns.db"))
+PASSIVE_DNS_FLUSH_INTERVAL = float(os.environ.get("PASSIVE_DNS_FLUSH_INTERVAL", 5))
+PASSIVE_DNS_FLUSH_MAX = int(os.environ.get("PASSIVE_DNS_FLUSH_MAX", 5000))
+PASSIVE_DNS_LAST_SEEN_GRANULARITY = int(os.environ.get("PASSIVE_DNS_LAST_SEEN_GRANULARITY", 3600))
+PASSIVE_DNS_WRITTEN_MAX = 200000
+PASSIVE_DNS_QUERY_LIMIT = 200
+
+_pdns_buffer = {}  # (name, rtype, value) -> [first_seen, last_seen]
+_pdns_written = {}  # (name, rtype, value) -> last_seen already on disk
+_pdns_lock = threading.Lock()
+_pdns_flush_lock = threading.Lock()
+_pdns_flush_thread = None
+_pdns_schema_ready = False
+_pdns_local = threading.local()
+
+def _pdns_connect():
+    """This thread's connection to the store (opened once per thread)."""
+    global _pdns_schema_ready
+    db = getattr(_pdns_local, "db", None)
+    if db is not None and getattr(_pdns_local, "path", None) == PASSIVE_DNS_PATH:
+        return db
+    directory = os.path.dirname(PASSIVE_DNS_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(PASSIVE_DNS_PATH, timeout=30)
+    if not _pdns_schema_ready:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS pdns (name TEXT NOT NULL, rtype TEXT NOT NULL, value TEXT NOT NULL, "
+            "first_seen INTEGER NOT NULL, last_seen INTEGER NOT NULL, PRIMARY KEY (name, rtype, value)) WITHOUT ROWID"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS pdns_by_value ON pdns (value, rtype, name)")
+        db.commit()
+        _pdns_schema_ready = True
+    db.execute("PRAGMA synchronous=NORMAL")
+    _pdns_local.db, _pdns_local.path = db, PASSIVE_DNS_PATH
+    return db
+
+def _pdns_normalize(text):
+    """Canonical form of a name or value; IP addresses in compressed form so any spelling matches."""
+    import ipaddress
+    text = str(text).strip().rstrip('.').lower()
+    try:
+        return ipaddress.ip_address(text).compressed
+    except ValueError:
+        return text
+
+def _pdns_flush_loop():
+    while True:
+        time.sleep(PASSIVE_DNS_FLUSH_INTERVAL)
+        flush_passive_dns()
+
+def record_dns_observations(observations, seen_at=None):
+    """Record (name, rtype, value) resolutions; written to disk in batches."""
+    global _pdns_flush_thread
+    now = int(seen_at or time.time())
+    with _pdns_lock:
+        for name, rtype, value in observations:
+            key = (_pdns_normalize(name), rtype.upper(), _pdns_normalize(value))
+            written = _pdns_written.get(key)
+            if written is not None and now - written < PASSIVE_DNS_LAST_SEEN_GRANULARITY:
+                continue
+            entry = _pdns_buffer.get(key)
+            if entry:
+                entry[0] = min(entry[0], now)
+                entry[1] = max(entry[1], now)
+            else:
+                _pdns_buffer[key] = [now, now]
+        pending = len(_pdns_buffer)
+        if _pdns_flush_thread is None:
+            _pdns_flush_thread = threading.Thread(target=_pdns_flush_loop, name="passive-dns-flush", daemon=True)
+            _pdns_flush_thread.start()
+            atexit.register(flush_passive_dns)
+    if pending >= PASSIVE_DNS_FLUSH_MAX:
+        flush_passive_dns()
+
+def flush_passive_dns():
+    """Write buffered observations in one transaction; returns the number of rows written."""
+    global _pdns_buffer
+    with _pdns_flush_lock:
+        with _pdns_lock:
+            batch, _pdns_buffer = _pdns_buffer, {}
+        if not batch:
+            return 0
+        try:
+            db = _pdns_connect()
+            with db:
+                db.executemany(
+                    "INSERT INTO pdns (name, rtype, value, first_seen, last_seen) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (name, rtype, value) DO UPDATE SET "
+                    "first_seen = min(first_seen, excluded.first_seen), last_seen = max(last_seen, excluded.last_seen)",
+                    [(name, rtype, value, first, last) for (name, rtype, value), (first, last) in batch.items()]
+                )
+        except sqlite3.Error as e:
+            # Keep the observations for the next flush
+            with _pdns_lock:
+                for key, (first, last) in batch.items():
+                    entry = _pdns_buffer.setdefault(key, [first, last])
+                    entry[0], entry[1] = min(entry[0], first), max(entry[1], last)
+            print(f"Passive DNS flush failed: {e}")
+            return 0
+        with _pdns_lock:
+            if len(_pdns_written) + len(batch) > PASSIVE_DNS_WRITTEN_MAX:
+                _pdns_written.clear()
+            for key, (_, last) in batch.items():
+                _pdns_written[key] = last
+        return len(batch)
+
+def query_passive_dns(name=None, value=None, rtypes=None, limit=PASSIVE_DNS_QUERY_LIMIT):
+    """Observations for a name (forward) or a value (reverse), most recently seen first.
+
+    Includes observations this process has not flushed yet.
+    """
+    column, needle = ("name", _pdns_normalize(name)) if name is not None else ("value", _pdns_normalize(value))
+    rtypes = [t.upper() for t in rtypes] if rtypes else None
+    merged = {}
+    if os.path.exists(PASSIVE_DNS_PATH):
+        sql = f"SELECT name, rtype, value, first_seen, last_seen FROM pdns WHERE {column} = ?"
+        params = [needle]
+        if rtypes:
+            sql += f" AND rtype IN ({','.join('?' * len(rtypes))})"
+            params += rtypes
+        try:
+            for row in _pdns_connect().execute(sql, params):
+                merged[row[:3]] = [row[3], row[4]]
+        except sqlite3.Error as e:
+            print(f"Passive DNS query failed: {e}")
+    position = 0 if column == "name" else 2
+    with _pdns_lock:
+        for key, (first, last) in _pdns_buffer.items():
+            if key[position] == needle and (not rtypes or key[1] in rtypes):
+                entry = merged.setdefault(key, [first, last])
+                entry[0], entry[1] = min(entry[0], first), max(entry[1], last)
+    rows = sorted(merged.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+    return [{
+        "name": name_, "type": rtype, "value": value_,
+        "first_seen": datetime.utcfromtimestamp(first).isoformat(),
+        "last_seen": datetime.utcfromtimestamp(last).isoformat()
+    } for (name_, rtype, value_), (first, last) in rows]
+
+def dns_answer_observations(name, answer):
+    """Observations from a dnspython answer, including address glue for MX/NS targets."""
+    rtype = dns.rdatatype.to_text(answer.rdtype)
+    observations = []
+    for rdata in answer:
+        if rtype == "MX":
+            observations.append((name, rtype, rdata.exchange.to_text()))
+        else:
+            observations.append((name, rtype, rdata.to_text()))
+    for rrset in getattr(answer.response, "additional", []):
+        if rrset.rdtype in (dns.rdatatype.A, dns.rdatatype.AAAA):
+            observations.extend((rrset.name.to_text(), dns.rdatatype.to_text(rrset.rdtype), rdata.to_text()) for rdata in rrset)
+    return observations
+
+def pivot_passive_dns_ip(ip):
+    """Names that have pointed at an IP, from the local store only (no network calls)."""
+    hosts = query_passive_dns(value=ip, rtypes=["A", "AAAA"])
+    mail_domains = []
+    for host in {h["name"] for h in hosts}:
+        mail_domains.extend(query_passive_dns(value=host, rtypes=["MX"]))
+    ptr = query_passive_dns(name=ip, rtypes=["PTR"])
+    return {
+        "domains": hosts,
+        "mail_domains": mail_domains,
+        "ptr_history": ptr,
+        "observation_count": len(hosts) + len(mail_domains) + len(ptr)
+    }
+
 def get_related_domains(domain):
     """Get related domains (subdomains, similar domains)."""
     # This would use real domain intelligence APIs in production
@@ -2278,6 +6002,624 @@ def get_related_domains(domain):
     
     return related[:5]
 
+# --- Lookalike (typosquat) domain sweep ---
+# Candidate names are generated from the registrable label of a domain and
+# resolved on an asyncio resolver with at most LOOKALIKE_DNS_CONCURRENCY
+# queries in flight. Answers are cached per record TTL (negative answers per
+# the zone's SOA), so repeated sweeps of the same domain stay cheap.
+LOOKALIKE_DNS_TIMEOUT = float(os.environ.get("LOOKALIKE_DNS_TIMEOUT", 1.5))
+LOOKALIKE_DNS_CONCURRENCY = int(os.environ.get("LOOKALIKE_DNS_CONCURRENCY", 500))
+LOOKALIKE_MAX_CANDIDATES = int(os.environ.get("LOOKALIKE_MAX_CANDIDATES", 5000))
+LOOKALIKE_CACHE_TTL = int(os.environ.get("LOOKALIKE_CACHE_TTL", 3600))
+LOOKALIKE_DNS_CACHE_MAX = 500000
+
+LOOKALIKE_TLDS = [
+    "com", "net", "org", "co", "io", "info", "biz", "us", "uk", "co.uk", "de", "in", "co.in",
+    "app", "xyz", "online", "site", "top", "shop", "live", "me", "cc", "ru", "cn", "eu", "ca", "au"
+]
+# Two-label public suffixes the naive "last label" split would get wrong
+LOOKALIKE_MULTI_LABEL_SUFFIXES = {
+    "co.uk", "org.uk", "ac.uk", "gov.uk", "co.in", "org.in", "ac.in", "gov.in", "net.in",
+    "com.au", "net.au", "org.au", "co.jp", "co.nz", "com.br", "com.cn", "co.za", "com.mx"
+}
+LOOKALIKE_KEYBOARD = {
+    'q': 'wa', 'w': 'qesa', 'e': 'wrds', 'r': 'etfd', 't': 'ryg', 'y': 'tuh', 'u': 'yij', 'i': 'uok',
+    'o': 'ipl', 'p': 'ol', 'a': 'qwsz', 's': 'awedxz', 'd': 'serfcx', 'f': 'drtgvc', 'g': 'ftyhbv',
+    'h': 'gyujnb', 'j': 'huikmn', 'k': 'jiolm', 'l': 'kop', 'z': 'asx', 'x': 'zsdc', 'c': 'xdfv',
+    'v': 'cfgb', 'b': 'vghn', 'n': 'bhjm', 'm': 'njk',
+    '1': '2q', '2': '13wq', '3': '24ew', '4': '35re', '5': '46tr', '6': '57yt', '7': '68uy',
+    '8': '79iu', '9': '80oi', '0': '9po'
+}
+# ASCII lookalikes stay in the label; non-ASCII ones are sent as punycode
+LOOKALIKE_HOMOGLYPHS = {
+    'a': ['4', 'à', 'á', 'â', 'ä', 'å', 'ɑ', 'а'], 'b': ['d', 'lb', 'ʙ', 'ь'], 'c': ['e', 'ç', 'ć', 'с'],
+    'd': ['b', 'cl', 'dl', 'ԁ'], 'e': ['c', '3', 'é', 'è', 'ê', 'ë', 'е'], 'g': ['q', '9', 'ɡ'],
+    'h': ['lh', 'һ'], 'i': ['1', 'l', 'í', 'ì', 'ï', 'і'], 'j': ['ј'], 'k': ['lk', 'ik', 'κ'],
+    'l': ['1', 'i', 'ł', 'ӏ'], 'm': ['n', 'nn', 'rn', 'rr'], 'n': ['m', 'r', 'ń', 'ñ'],
+    'o': ['0', 'ο', 'о', 'ó', 'ö', 'ø'], 'p': ['р', 'ρ'], 'q': ['g', 'ԛ'], 'r': ['ʀ', 'г'],
+    's': ['5', 'ѕ', 'ś'], 't': ['7', 'τ'], 'u': ['v', 'ü', 'ú', 'υ'], 'v': ['u', 'ѵ', 'ν'],
+    'w': ['vv', 'ѡ', 'ԝ'], 'x': ['х'], 'y': ['ү', 'у', 'ý'], 'z': ['2', 'ʐ', 'ż']
+}
+# Label variants are also tried under these, besides the domain's own suffix
+LOOKALIKE_VARIANT_TLDS = ["com", "net", "org"]
+# Phishing-style prefixes/suffixes, e.g. example-login.com, secure-example.com
+LOOKALIKE_KEYWORDS = ["login", "secure", "mail", "support", "account", "verify", "online", "auth", "my", "portal", "help", "update"]
+LOOKALIKE_VALID_LABEL = re.compile(r'^(?!-)[a-z0-9-]{1,63}(?<!-)$')
+
+_lookalike_dns_cache = {}  # (name, rtype) -> (expires_at, outcome)
+_lookalike_dns_cache_lock = threading.Lock()
+_lookalike_cache = {}  # domain -> (timestamp, sweep result)
+
+def split_registrable_domain(domain):
+    """Split into (label, suffix) using the known multi-label suffixes."""
+    labels = domain.lower().rstrip('.').split('.')
+    if len(labels) >= 3 and '.'.join(labels[-2:]) in LOOKALIKE_MULTI_LABEL_SUFFIXES:
+        return labels[-3], '.'.join(labels[-2:])
+    if len(labels) >= 2:
+        return labels[-2], labels[-1]
+    return labels[0], ""
+
+def _lookalike_label_variants(label):
+    """(fuzzer, candidate label) pairs for one registrable label."""
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789-"
+    length = len(label)
+    for i in range(length):
+        yield "omission", label[:i] + label[i + 1:]
+        yield "repetition", label[:i] + label[i] + label[i:]
+        if i < length - 1 and label[i] != label[i + 1]:
+            yield "transposition", label[:i] + label[i + 1] + label[i] + label[i + 2:]
+        for key in LOOKALIKE_KEYBOARD.get(label[i], ""):
+            yield "replacement", label[:i] + key + label[i + 1:]
+            yield "insertion", label[:i] + key + label[i:]
+            yield "insertion", label[:i + 1] + key + label[i + 1:]
+        for glyph in LOOKALIKE_HOMOGLYPHS.get(label[i], []):
+            yield "homoglyph", label[:i] + glyph + label[i + 1:]
+        if label[i] in "aeiou":
+            for vowel in "aeiou":
+                if vowel != label[i]:
+                    yield "vowel-swap", label[:i] + vowel + label[i + 1:]
+        for bit in range(8):
+            flipped = chr(ord(label[i]) ^ (1 << bit))
+            if flipped in alphabet:
+                yield "bitsquatting", label[:i] + flipped + label[i + 1:]
+        if 0 < i < length:
+            yield "hyphenation", label[:i] + "-" + label[i:]
+    for char in "abcdefghijklmnopqrstuvwxyz0123456789":
+        yield "addition", label + char
+    # Two homoglyph substitutions at once
+    positions = [i for i in range(length) if label[i] in LOOKALIKE_HOMOGLYPHS]
+    for a_index, i in enumerate(positions):
+        for j in positions[a_index + 1:]:
+            for glyph_i in LOOKALIKE_HOMOGLYPHS[label[i]]:
+                for glyph_j in LOOKALIKE_HOMOGLYPHS[label[j]]:
+                    yield "homoglyph", label[:i] + glyph_i + label[i + 1:j] + glyph_j + label[j + 1:]
+    for word in LOOKALIKE_KEYWORDS:
+        yield "dictionary", f"{label}-{word}"
+        yield "dictionary", f"{word}-{label}"
+        yield "dictionary", f"{label}{word}"
+        yield "dictionary", f"{word}{label}"
+    yield "subdomain", f"www{label}"
+    yield "subdomain", f"www-{label}"
+
+def generate_lookalike_domains(domain, max_candidates=None):
+    """Typosquat/lookalike candidates for a domain: {candidate: fuzzer}.
+
+    Covers omission, repetition, transposition, keyboard replacement and
+    insertion, homoglyphs (IDN ones as punycode), vowel swaps, bit-flips,
+    hyphenation, addition and TLD swaps.
+    """
+    label, suffix = split_registrable_domain(domain)
+    original = f"{label}.{suffix}" if suffix else label
+    suffixes = list(dict.fromkeys([suffix] + LOOKALIKE_VARIANT_TLDS)) if suffix else [""]
+    variants = {}
+    for fuzzer, variant in _lookalike_label_variants(label):
+        if variant == label or variant in variants:
+            continue
+        try:
+            ascii_label = variant.encode("idna").decode("ascii") if not variant.isascii() else variant
+        except UnicodeError:
+            continue
+        if LOOKALIKE_VALID_LABEL.match(ascii_label):
+            variants[variant] = (fuzzer, ascii_label)
+    candidates = {}
+    # Own suffix first so truncation at max_candidates keeps the closest lookalikes
+    for candidate_suffix in suffixes:
+        for fuzzer, ascii_label in variants.values():
+            candidates.setdefault(f"{ascii_label}.{candidate_suffix}" if candidate_suffix else ascii_label, fuzzer)
+    for tld in LOOKALIKE_TLDS:
+        if tld != suffix:
+            candidates.setdefault(f"{label}.{tld}", "tld-swap")
+    if suffix and "." not in suffix:
+        # e.g. example.com -> examplecom.com, example-com.com
+        candidates.setdefault(f"{label}{suffix}.com", "dot-omission")
+        candidates.setdefault(f"{label}-{suffix}.com", "hyphenation")
+    candidates.pop(original, None)
+    limit = max_candidates or LOOKALIKE_MAX_CANDIDATES
+    return dict(list(candidates.items())[:limit])
+
+def _lookalike_cache_get(key, now):
+    cache_entry = _lookalike_dns_cache.get(key)
+    if cache_entry and now < cache_entry[0]:
+        return cache_entry[1]
+    return None
+
+def _lookalike_cache_put(key, outcome, ttl, now):
+    ttl = max(REVERSE_DNS_MIN_TTL, min(REVERSE_DNS_MAX_TTL, ttl))
+    with _lookalike_dns_cache_lock:
+        if len(_lookalike_dns_cache) >= LOOKALIKE_DNS_CACHE_MAX:
+            for k in [k for k, (exp, _) in _lookalike_dns_cache.items() if exp <= now]:
+                _lookalike_dns_cache.pop(k, None)
+            while len(_lookalike_dns_cache) >= LOOKALIKE_DNS_CACHE_MAX:
+                _lookalike_dns_cache.pop(next(iter(_lookalike_dns_cache)))
+        _lookalike_dns_cache[key] = (now + ttl, outcome)
+
+def resolve_names_batch(queries, concurrency=None, timeout=None):
+    """Resolve many (name, rtype) pairs concurrently; returns {(name, rtype): outcome}.
+
+    outcome is {"status": "ok"|"nxdomain"|"no_answer"|"timeout"|"error",
+    "records": [...]}. Answers are cached per TTL and recorded in the
+    passive-DNS store.
+    """
+    import asyncio
+    import dns.asyncresolver
+
+    now = time.time()
+    timeout = timeout or LOOKALIKE_DNS_TIMEOUT
+    results = {}
+    pending = []
+    for key in dict.fromkeys(queries):
+        cached = _lookalike_cache_get(key, now)
+        if cached:
+            results[key] = cached
+        else:
+            pending.append(key)
+    if not pending:
+        return results
+
+    async def resolve_all():
+        # Same upstream servers as the PTR resolver
+        sync_resolver = get_ptr_resolver()
+        resolver = dns.asyncresolver.Resolver(configure=False)
+        resolver.nameservers = sync_resolver.nameservers
+        resolver.port = sync_resolver.port
+        resolver.lifetime = timeout
+        resolver.timeout = min(sync_resolver.timeout, timeout)
+        semaphore = asyncio.Semaphore(concurrency or LOOKALIKE_DNS_CONCURRENCY)
+
+        async def resolve_one(key):
+            name, rtype = key
+            async with semaphore:
+                try:
+                    answer = await resolver.resolve(name, rtype, lifetime=timeout)
+                    return key, answer, None
+                except dns.exception.DNSException as e:
+                    return key, None, e
+
+        return await asyncio.gather(*(resolve_one(key) for key in pending))
+
+    observations = []
+    for (name, rtype), answer, exc in asyncio.run(resolve_all()):
+        if answer is not None:
+            if rtype == "MX":
+                records = [f"{r.preference} {r.exchange.to_text().rstrip('.')}" for r in answer]
+            else:
+                records = [r.to_text() for r in answer]
+            outcome, ttl = {"status": "ok", "records": records}, answer.rrset.ttl
+            observations.extend(dns_answer_observations(name, answer))
+        elif isinstance(exc, dns.resolver.NXDOMAIN):
+            outcome, ttl = {"status": "nxdomain", "records": []}, _soa_negative_ttl(exc.responses().values())
+        elif isinstance(exc, dns.resolver.NoAnswer):
+            outcome, ttl = {"status": "no_answer", "records": []}, _soa_negative_ttl([exc.response()])
+        elif isinstance(exc, (dns.resolver.LifetimeTimeout, dns.exception.Timeout)):
+            outcome, ttl = {"status": "timeout", "records": []}, REVERSE_DNS_FAILURE_TTL
+        else:
+            outcome, ttl = {"status": "error", "records": []}, REVERSE_DNS_FAILURE_TTL
+        _lookalike_cache_put((name, rtype), outcome, ttl, now)
+        results[(name, rtype)] = outcome
+    record_dns_observations(observations)
+    return results
+
+def sweep_lookalike_domains(domain, max_candidates=None):
+    """Generate lookalikes of a domain and report which are registered and receive mail.
+
+    A candidate counts as registered when its A query returns anything other
+    than NXDOMAIN; registered candidates then get an MX query.
+    """
+    started = time.time()
+    candidates = generate_lookalike_domains(domain, max_candidates)
+    a_results = resolve_names_batch([(name, "A") for name in candidates])
+    registered = [name for name in candidates if a_results[(name, "A")]["status"] in ("ok", "no_answer")]
+    mx_results = resolve_names_batch([(name, "MX") for name in registered])
+
+    lookalikes = []
+    for name in registered:
+        mx = mx_results[(name, "MX")]
+        lookalikes.append({
+            "domain": name,
+            "fuzzer": candidates[name],
+            "addresses": a_results[(name, "A")]["records"],
+            "has_mx": mx["status"] == "ok" and bool(mx["records"]),
+            "mx_records": mx["records"]
+        })
+    lookalikes.sort(key=lambda item: (not item["has_mx"], item["domain"]))
+    statuses = [a_results[(name, "A")]["status"] for name in candidates]
+    return {
+        "domain": domain,
+        "candidates_checked": len(candidates),
+        "registered_count": len(lookalikes),
+        "with_mx_count": sum(1 for item in lookalikes if item["has_mx"]),
+        "unresolved_count": statuses.count("timeout") + statuses.count("error"),
+        "registered": lookalikes,
+        "elapsed_seconds": round(time.time() - started, 2)
+    }
+
+def get_lookalike_domains(domain):
+    """Cached lookalike sweep for a domain (LOOKALIKE_CACHE_TTL)."""
+    key = domain.strip().lower()
+    now = time.time()
+    cache_entry = _lookalike_cache.get(key)
+    if cache_entry and now - cache_entry[0] < LOOKALIKE_CACHE_TTL:
+        return cache_entry[1]
+    result = sweep_lookalike_domains(key)
+    if len(_lookalike_cache) >= DOMAIN_CACHE_MAX:
+        _lookalike_cache.pop(next(iter(_lookalike_cache)))
+    _lookalike_cache[key] = (now, result)
+    return result
+
+# --- SMTP deliverability verification ---
+# MX hosts are resolved once per domain and addresses are grouped by their
+# primary MX, so each mail server gets one session. Inside a session all
+# RCPT TO probes (plus one random address per domain to detect catch-all
+# configurations) are pipelined when the server advertises PIPELINING.
+# Temporary 4xx answers (greylisting) come back as "unknown" straight away
+# and are retried on a background thread after SMTP_GREYLIST_RETRY_DELAYS,
+# whose answers land in the cache for the next lookup. Each MX host has a
+# token bucket so probes stay within SMTP_MX_RCPT_PER_MINUTE. No message is
+# ever sent: sessions end with RSET/QUIT after the RCPT stage. Probing is
+# opt-in: port-25 sessions from a web server get its address blocklisted.
+SMTP_VERIFY_DEFAULT = os.environ.get("SMTP_VERIFY_DEFAULT", "false").lower() == "true"
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 25))
+SMTP_HELO_HOST = os.environ.get("SMTP_HELO_HOST", "osint-portal.localdomain")
+SMTP_MAIL_FROM = os.environ.get("SMTP_MAIL_FROM", "")  # empty = null reverse-path <>
+SMTP_CONNECT_TIMEOUT = float(os.environ.get("SMTP_CONNECT_TIMEOUT", 5))
+SMTP_COMMAND_TIMEOUT = float(os.environ.get("SMTP_COMMAND_TIMEOUT", 15))
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_MAX_RCPT_PER_TRANSACTION = int(os.environ.get("SMTP_MAX_RCPT_PER_TRANSACTION", 50))
+SMTP_MX_RCPT_PER_MINUTE = float(os.environ.get("SMTP_MX_RCPT_PER_MINUTE", 120))
+SMTP_MX_BURST = int(os.environ.get("SMTP_MX_BURST", 30))
+SMTP_GREYLIST_RETRY_DELAYS = [float(d) for d in os.environ.get("SMTP_GREYLIST_RETRY_DELAYS", "10,30").split(",") if d.strip()]
+SMTP_MAX_PARALLEL_HOSTS = int(os.environ.get("SMTP_MAX_PARALLEL_HOSTS", 8))
+SMTP_MAX_MX_HOSTS = int(os.environ.get("SMTP_MAX_MX_HOSTS", 2))  # hosts tried per domain before giving up
+SMTP_CACHE_TTL = int(os.environ.get("SMTP_CACHE_TTL", 86400))
+SMTP_HOST_FAILURE_TTL = 300  # skip an unreachable MX for this long
+
+_smtp_cache = {}  # address -> (expires_at, result)
+_smtp_buckets = {}  # MX host -> [tokens, updated_at]
+_smtp_host_failures = {}  # MX host -> failed_at
+_smtp_retrying = set()  # addresses with a greylist retry in flight
+_smtp_lock = threading.Lock()
+_smtp_retry_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("SMTP_RETRY_WORKERS", 2)))
+
+class SMTPProbeError(Exception):
+    """The session could not reach the RCPT stage."""
+
+def _smtp_acquire(host, count):
+    """Take `count` RCPT tokens from the host's bucket, waiting for refill if needed."""
+    rate = SMTP_MX_RCPT_PER_MINUTE / 60.0
+    while True:
+        with _smtp_lock:
+            now = time.monotonic()
+            tokens, updated = _smtp_buckets.get(host, (float(SMTP_MX_BURST), now))
+            tokens = min(float(SMTP_MX_BURST), tokens + (now - updated) * rate)
+            if tokens >= count or rate <= 0:
+                _smtp_buckets[host] = [tokens - count, now]
+                return
+            _smtp_buckets[host] = [tokens, now]
+            wait = (count - tokens) / rate
+        time.sleep(wait)
+
+class SMTPSession:
+    """Minimal ESMTP client for RCPT probing with optional pipelining."""
+
+    def __init__(self, host, port=None):
+        import socket
+        self.host = host
+        self.sock = socket.create_connection((host, port or SMTP_PORT), timeout=SMTP_CONNECT_TIMEOUT)
+        self.sock.settimeout(SMTP_COMMAND_TIMEOUT)
+        self.reader = self.sock.makefile("rb")
+        self.extensions = set()
+        code, message = self.read_reply()
+        if code != 220:
+            self.close()
+            raise SMTPProbeError(f"Greeting {code} {message}")
+        self.ehlo()
+        if SMTP_STARTTLS and "STARTTLS" in self.extensions:
+            self.starttls()
+
+    def read_reply(self):
+        lines = []
+        while True:
+            line = self.reader.readline()
+            if not line:
+                raise SMTPProbeError("Connection closed by server")
+            line = line.decode("utf-8", "replace").rstrip("\r\n")
+            lines.append(line[4:])
+            if len(line) < 4 or line[3] != "-":
+                try:
+                    return int(line[:3]), " ".join(lines).strip()
+                except ValueError:
+                    raise SMTPProbeError(f"Malformed reply: {line}")
+
+    def send(self, *commands):
+        self.sock.sendall("".join(f"{command}\r\n" for command in commands).encode("utf-8"))
+
+    def command(self, command):
+        self.send(command)
+        return self.read_reply()
+
+    def ehlo(self):
+        code, message = self.command(f"EHLO {SMTP_HELO_HOST}")
+        if code != 250:
+            code, message = self.command(f"HELO {SMTP_HELO_HOST}")
+            if code != 250:
+                raise SMTPProbeError(f"HELO rejected: {code} {message}")
+            self.extensions = set()
+            return
+        # "250-host Hello ... 250-PIPELINING 250 STARTTLS" flattened by read_reply
+        self.extensions = {word.upper() for word in message.split()}
+
+    def starttls(self):
+        import ssl
+        code, _ = self.command("STARTTLS")
+        if code != 220:
+            return
+        # MX certificates rarely match their names; the channel only protects the probe
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        self.sock = context.wrap_socket(self.sock, server_hostname=self.host)
+        self.reader = self.sock.makefile("rb")
+        self.ehlo()
+
+    def probe(self, addresses):
+        """RCPT TO each address in one transaction; returns [(code, message)] in order."""
+        mail_from = f"MAIL FROM:<{SMTP_MAIL_FROM}>"
+        rcpts = [f"RCPT TO:<{address}>" for address in addresses]
+        if "PIPELINING" in self.extensions:
+            self.send(mail_from, *rcpts)
+            mail_reply = self.read_reply()
+            replies = [self.read_reply() for _ in rcpts]
+            if mail_reply[0] != 250:
+                raise SMTPProbeError(f"MAIL FROM rejected: {mail_reply[0]} {mail_reply[1]}")
+        else:
+            mail_reply = self.command(mail_from)
+            if mail_reply[0] != 250:
+                raise SMTPProbeError(f"MAIL FROM rejected: {mail_reply[0]} {mail_reply[1]}")
+            replies = [self.command(rcpt) for rcpt in rcpts]
+        self.command("RSET")
+        return replies
+
+    def close(self):
+        try:
+            self.send("QUIT")
+            self.read_reply()
+        except Exception:
+            pass
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+
+def resolve_mx_hosts(domains):
+    """MX hosts per domain, most preferred first; {domain: [hosts]} or {domain: None} if the domain does not exist.
+
+    Falls back to the domain itself when it has an address but no MX (RFC 5321 implicit MX).
+    """
+    mx_answers = resolve_names_batch([(domain, "MX") for domain in domains])
+    no_mx = [domain for domain in domains if mx_answers[(domain, "MX")]["status"] == "no_answer"]
+    a_answers = resolve_names_batch([(domain, "A") for domain in no_mx]) if no_mx else {}
+    hosts = {}
+    for domain in domains:
+        answer = mx_answers[(domain, "MX")]
+        if answer["status"] == "ok":
+            records = sorted((int(pref), host) for pref, host in (r.split(None, 1) for r in answer["records"]))
+            hosts[domain] = [host for _, host in records if host and host != "."]
+        elif answer["status"] == "nxdomain":
+            hosts[domain] = None
+        elif domain in no_mx and a_answers[(domain, "A")]["status"] == "ok":
+            hosts[domain] = [domain]
+        else:
+            hosts[domain] = []
+    return hosts
+
+def _smtp_result(email, status, code=None, message=None, mx_host=None, catch_all=False, greylisted=False):
+    return {
+        "email": email,
+        "status": status,  # deliverable, undeliverable, accept_all, unknown
+        "smtp_code": code,
+        "smtp_message": message,
+        "mx_host": mx_host,
+        "catch_all": catch_all,
+        "greylisted": greylisted
+    }
+
+def _smtp_probe_host(hosts, addresses_by_domain):
+    """One session against the first reachable host; returns (host, {address: (code, message)}).
+
+    Each domain's addresses are preceded by a random catch-all probe.
+    """
+    last_error = None
+    for host in hosts[:SMTP_MAX_MX_HOSTS]:
+        failed_at = _smtp_host_failures.get(host)
+        if failed_at and time.time() - failed_at < SMTP_HOST_FAILURE_TTL:
+            last_error = f"{host} recently unreachable"
+            continue
+        try:
+            session = SMTPSession(host)
+        except (OSError, SMTPProbeError) as e:
+            _smtp_host_failures[host] = time.time()
+            last_error = f"{host}: {e}"
+            continue
+        replies = {}
+        try:
+            probes = []
+            for domain, addresses in addresses_by_domain.items():
+                probes.append(f"catchall-{os.urandom(6).hex()}@{domain}")
+                probes.extend(addresses)
+            for start in range(0, len(probes), SMTP_MAX_RCPT_PER_TRANSACTION):
+                chunk = probes[start:start + SMTP_MAX_RCPT_PER_TRANSACTION]
+                _smtp_acquire(host, min(len(chunk), SMTP_MX_BURST))
+                replies.update(zip(chunk, session.probe(chunk)))
+        except (OSError, SMTPProbeError) as e:
+            last_error = f"{host}: {e}"
+            if not replies:
+                continue
+        finally:
+            session.close()
+        return host, replies
+    raise SMTPProbeError(last_error or "No MX host available")
+
+def _smtp_classify(email, reply, catch_all_reply, host):
+    code, message = reply
+    catch_all = catch_all_reply is not None and catch_all_reply[0] == 250
+    if code in (250, 251):
+        return _smtp_result(email, "accept_all" if catch_all else "deliverable", code, message, host, catch_all)
+    if 500 <= code < 600:
+        return _smtp_result(email, "undeliverable", code, message, host, catch_all)
+    return _smtp_result(email, "unknown", code, message, host, catch_all, greylisted=400 <= code < 500)
+
+def _smtp_verify_host_group(hosts, addresses_by_domain):
+    """One probe pass over an MX host's addresses; returns (results, {domain: greylisted addresses})."""
+    results = {}
+    try:
+        host, replies = _smtp_probe_host(hosts, addresses_by_domain)
+    except SMTPProbeError as e:
+        for addresses in addresses_by_domain.values():
+            for address in addresses:
+                results[address] = _smtp_result(address, "unknown", message=str(e))
+        return results, {}
+    retry = {}
+    for domain, addresses in addresses_by_domain.items():
+        probe_reply = next((reply for address, reply in replies.items() if address.startswith("catchall-") and address.endswith("@" + domain)), None)
+        catch_all = probe_reply if probe_reply and not 400 <= probe_reply[0] < 500 else None
+        for address in addresses:
+            reply = replies.get(address)
+            if reply is None:
+                results[address] = _smtp_result(address, "unknown", message="Session ended before probe", mx_host=host)
+                continue
+            results[address] = _smtp_classify(address, reply, catch_all, host)
+            if results[address]["greylisted"]:
+                retry.setdefault(domain, []).append(address)
+    return results, retry
+
+def _smtp_store(results):
+    """Cache every definitive result for SMTP_CACHE_TTL."""
+    now = time.time()
+    with _smtp_lock:
+        for email, result in results.items():
+            if result["status"] != "unknown":
+                _smtp_cache[email.lower()] = (now + SMTP_CACHE_TTL, result)
+        if len(_smtp_cache) > DOMAIN_CACHE_MAX:
+            for key in [k for k, (exp, _) in _smtp_cache.items() if exp <= now]:
+                _smtp_cache.pop(key, None)
+
+def _smtp_retry_greylisted(hosts, addresses_by_domain):
+    """Re-probe greylisted addresses after each SMTP_GREYLIST_RETRY_DELAYS step, caching the answers."""
+    pending = addresses_by_domain
+    try:
+        for delay in SMTP_GREYLIST_RETRY_DELAYS:
+            time.sleep(delay)
+            results, pending = _smtp_verify_host_group(hosts, pending)
+            _smtp_store(results)
+            if not pending:
+                break
+    except Exception as e:
+        app.logger.warning("Greylist retry against %s failed: %s", hosts[0], e)
+    finally:
+        with _smtp_lock:
+            _smtp_retrying.difference_update(a.lower() for addresses in addresses_by_domain.values() for a in addresses)
+
+def _smtp_schedule_retry(hosts, addresses_by_domain, results):
+    """Queue a background retry for greylisted addresses not already being retried."""
+    if not SMTP_GREYLIST_RETRY_DELAYS:
+        return
+    with _smtp_lock:
+        scheduled = {}
+        for domain, addresses in addresses_by_domain.items():
+            for address in addresses:
+                if address.lower() not in _smtp_retrying:
+                    _smtp_retrying.add(address.lower())
+                    scheduled.setdefault(domain, []).append(address)
+    for addresses in addresses_by_domain.values():
+        for address in addresses:
+            results[address]["retry_scheduled"] = True
+    if scheduled:
+        _smtp_retry_executor.submit(_smtp_retry_greylisted, hosts, scheduled)
+
+def verify_email_addresses(emails):
+    """SMTP deliverability for many addresses; returns {email: result}.
+
+    Addresses are grouped by domain for MX resolution and by primary MX host
+    for sessions; hosts are probed in parallel, one session each. Results
+    (except greylisted/unknown ones) are cached for SMTP_CACHE_TTL; greylisted
+    addresses are retried in the background, so a later call picks up their answer.
+    """
+    now = time.time()
+    results = {}
+    by_domain = {}
+    for email in dict.fromkeys(emails):
+        if not is_valid_email(email):
+            results[email] = _smtp_result(email, "undeliverable", message="Invalid email format")
+            continue
+        cache_entry = _smtp_cache.get(email.lower())
+        if cache_entry and now < cache_entry[0]:
+            results[email] = dict(cache_entry[1], email=email, cached=True)
+            continue
+        by_domain.setdefault(email.rsplit('@', 1)[1].lower(), []).append(email)
+    if not by_domain:
+        return results
+
+    mx_hosts = resolve_mx_hosts(list(by_domain))
+    by_host = {}
+    for domain, addresses in by_domain.items():
+        hosts = mx_hosts.get(domain)
+        if not hosts:
+            reason = "Domain does not exist" if hosts is None else "Domain has no mail server"
+            for address in addresses:
+                results[address] = _smtp_result(address, "undeliverable", message=reason)
+            continue
+        group = by_host.setdefault(hosts[0], {"hosts": hosts, "domains": {}})
+        group["domains"][domain] = addresses
+
+    if by_host:
+        with ThreadPoolExecutor(max_workers=min(SMTP_MAX_PARALLEL_HOSTS, len(by_host))) as executor:
+            futures = {executor.submit(_smtp_verify_host_group, group["hosts"], group["domains"]): group for group in by_host.values()}
+            for future in as_completed(futures):
+                group_results, greylisted = future.result()
+                results.update(group_results)
+                if greylisted:
+                    _smtp_schedule_retry(futures[future]["hosts"], greylisted, results)
+
+    _smtp_store(results)
+    for email, result in results.items():
+        result.setdefault("cached", False)
+    return results
+
+def verify_email_deliverability(email, include_variations=True):
+    """Deliverability of an address and (optionally) its generate_email_variations permutations.
+
+    All probes for the domain share one SMTP session.
+    """
+    local_part, domain = email.rsplit('@', 1)
+    variations = [v for v in generate_email_variations(local_part, domain) if v != email] if include_variations else []
+    results = verify_email_addresses([email] + variations)
+    return {
+        "address": results[email],
+        "deliverable_variations": [v for v in variations if results[v]["status"] == "deliverable"],
+        "variations_checked": len(variations),
+        "catch_all": results[email]["catch_all"]
+    }
+
 def estimate_timezone_from_domain(domain):
     """Estimate timezone based on domain TLD."""
     tld_timezones = {
@@ -2301,51 +6643,11 @@ def estimate_timezone_from_domain(domain):
 
 def detect_language_indicators(email):
     """Detect language indicators from email address."""
-    # Simple detection based on character patterns
-    local_part = email.split('@')[0].lower()
-    
-    if re.search(r'[àáâãäåæçèéêëìíîïðñòóôõöøùúûüýþÿ]', local_part):
-        return "European Language Characters"
-    elif re.search(r'[а-яё]', local_part):
-        return "Cyrillic Characters (Russian/Eastern European)"
-    elif re.search(r'[\u4e00-\u9fff]', local_part):
-        return "Chinese Characters"
-    elif re.search(r'[\u3040-\u309f\u30a0-\u30ff]', local_part):
-        return "Japanese Characters"
-    else:
-        return "Latin Characters (English/International)"
+    return classify_local_part(email.split('@')[0])["script"]
 
 def analyze_email_patterns(local_part):
     """Analyze patterns in the email local part."""
-    analysis = {
-        "length": len(local_part),
-        "has_numbers": bool(re.search(r'\d', local_part)),
-        "has_separators": bool(re.search(r'[._-]', local_part)),
-        "pattern_type": "Unknown",
-        "complexity": "Low"
-    }
-    
-    # Determine pattern type
-    if re.match(r'^[a-zA-Z]+\.[a-zA-Z]+$', local_part):
-        analysis["pattern_type"] = "FirstName.LastName"
-        analysis["complexity"] = "Medium"
-    elif re.match(r'^[a-zA-Z]+_[a-zA-Z]+$', local_part):
-        analysis["pattern_type"] = "FirstName_LastName"
-        analysis["complexity"] = "Medium"
-    elif re.match(r'^[a-zA-Z]+\d+$', local_part):
-        analysis["pattern_type"] = "Name + Numbers"
-        analysis["complexity"] = "Medium"
-    elif local_part.isalpha():
-        analysis["pattern_type"] = "Letters Only"
-        analysis["complexity"] = "Low"
-    elif local_part.isdigit():
-        analysis["pattern_type"] = "Numbers Only"
-        analysis["complexity"] = "Low"
-    else:
-        analysis["pattern_type"] = "Mixed/Complex"
-        analysis["complexity"] = "High"
-    
-    return analysis
+    return classify_local_part(local_part)["pattern_analysis"]
 
 def check_domain_info(domain):
     """Check domain information and MX records."""
@@ -2616,6 +6918,13 @@ def is_likely_name(text):
 def index():
     return render_template("index.html")
 
+def run_email_enhanced(email, lookalikes=False, smtp_verify=False):
+    """Enhanced email investigation, saved to history when it succeeds."""
+    result = check_email_investigation_enhanced(email, lookalikes=lookalikes, smtp_verify=smtp_verify)
+    if result["ok"]:
+        save_history(email, result["data"])
+    return result
+
 @app.route("/api/email-enhanced", methods=["POST"])
 def api_email_enhanced():
     """Enhanced email investigation endpoint."""
@@ -2625,10 +6934,22 @@ def api_email_enhanced():
     if not email:
         return jsonify({"error": "Email address required"}), 400
 
+    lookalikes = bool(data.get("lookalikes", False))  # a sweep is ~1,700 DNS queries; opt-in
+    smtp_verify = bool(data.get("smtp_verify", SMTP_VERIFY_DEFAULT))
     try:
-        result = check_email_investigation_enhanced(email)
+        if not data.get("refresh"):
+            # A stored result only counts if it ran the optional checks this request wants
+            cached = serve_cached_result(
+                "email", email, lambda: run_email_enhanced(email, lookalikes, smtp_verify),
+                accept=lambda d: (
+                    (not lookalikes or d.get("lookalike_domains") or (d.get("domain_analysis") or {}).get("is_disposable"))
+                    and (not smtp_verify or d.get("deliverability"))
+                )
+            )
+            if cached:
+                return jsonify({**cached[0], "history_cache": cached[1]})
+        result = run_email_enhanced(email, lookalikes, smtp_verify)
         if result["ok"]:
-            save_history(email, result["data"])
             return jsonify(result["data"])
         else:
             return jsonify({"error": result["error"]}), 400
@@ -2637,6 +6958,31 @@ def api_email_enhanced():
         app.logger.error("Enhanced email investigation failed for '%s': %s", email, e)
         return jsonify({"error": f"Investigation failed: {str(e)}"}), 500
 
+@app.route("/api/lookalike-domains", methods=["POST"])
+def api_lookalike_domains():
+    """Typosquat/lookalike sweep for a domain (or an email's domain)."""
+    data = request.get_json() or {}
+    domain = (data.get("domain") or data.get("email") or "").strip().lower()
+    if "@" in domain:
+        domain = domain.rsplit("@", 1)[1]
+    
+    if not domain or "." not in domain:
+        return jsonify({"error": "Domain or email address required"}), 400
+    
+    try:
+        return jsonify(get_lookalike_domains(domain))
+    except Exception as e:
+        app.logger.error("Lookalike sweep failed for '%s': %s", domain, e)
+        return jsonify({"error": f"Lookalike sweep failed: {str(e)}"}), 500
+
+def run_phone_enhanced(phone_number):
+    """Enhanced phone investigation, saved to history when it succeeds."""
+    result = check_phone_number_enhanced(phone_number)
+    if result["ok"]:
+        # Save data directly to history  
+        save_history(phone_number, result["data"])
+    return result
+
 @app.route("/api/phone-enhanced", methods=["POST"])
 def api_phone_enhanced():
     """Enhanced phone investigation endpoint with multiple data sources."""
@@ -2647,13 +6993,20 @@ def api_phone_enhanced():
         return jsonify({"error": "Phone number required"}), 400
     
     try:
+        if not data.get("refresh"):
+            cached = serve_cached_result("phone", phone_number, lambda: run_phone_enhanced(phone_number))
+            if cached:
+                return jsonify({
+                    "success": True,
+                    "data": cached[0],
+                    "message": "Enhanced phone investigation served from history",
+                    "history_cache": cached[1]
+                })
+
         # Use enhanced phone validation
-        result = check_phone_number_enhanced(phone_number)
+        result = run_phone_enhanced(phone_number)
         
         if result["ok"]:
-            # Save data directly to history  
-            save_history(phone_number, result["data"])
-            
             return jsonify({
                 "success": True,
                 "data": result["data"],
@@ -2668,6 +7021,13 @@ def api_phone_enhanced():
     except Exception as e:
         return jsonify({"error": f"Enhanced phone investigation failed: {str(e)}"}), 500
 
+def run_ip_enhanced(ip_address):
+    """Enhanced IP investigation, saved to history when it succeeds."""
+    result = check_ip_investigation_enhanced(ip_address)
+    if result["ok"]:
+        save_history(ip_address, result["data"])
+    return result
+
 @app.route("/api/ip-enhanced", methods=["POST"])
 def api_ip_enhanced():
     """Enhanced IP address investigation endpoint."""
@@ -2678,9 +7038,12 @@ def api_ip_enhanced():
         return jsonify({"error": "IP address required"}), 400
 
     try:
-        result = check_ip_investigation_enhanced(ip_address)
+        if not data.get("refresh"):
+            cached = serve_cached_result("ip", ip_address, lambda: run_ip_enhanced(ip_address))
+            if cached:
+                return jsonify({**cached[0], "history_cache": cached[1]})
+        result = run_ip_enhanced(ip_address)
         if result["ok"]:
-            save_history(ip_address, result["data"])
             return jsonify(result["data"])
         else:
             return jsonify({"error": result["error"]}), 400
@@ -2850,134 +7213,255 @@ def api_check():
             pass
         return jsonify(response)
 
+def _parse_history_time(value):
+    """ISO-8601 date or datetime as a naive UTC string comparable with checked_at."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat()
+
 @app.route("/api/history", methods=["GET"])
 def api_history():
+    """Keyset-paginated history summaries.
+
+    Query parameters: limit, cursor (next_cursor from the previous page),
+    type (comma-separated), q (target prefix), since, until and
+    sort (recent, oldest, alphabetical or type).
+    """
+    args = request.args
     try:
-        h = fetch_history(limit=10)
+        types = [t for t in args.get("type", "").split(",") if t and t != "all"]
+        h, next_cursor = fetch_history(
+            limit=args.get("limit", HISTORY_PAGE_DEFAULT),
+            cursor=args.get("cursor") or None,
+            types=types,
+            prefix=args.get("q", "").strip() or None,
+            since=_parse_history_time(args["since"]) if args.get("since") else None,
+            until=_parse_history_time(args["until"]) if args.get("until") else None,
+            sort=args.get("sort", "recent"),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         app.logger.warning("Failed to fetch history: %s", e)
-        h = []
-    return jsonify({"history": h})
+        h, next_cursor = [], None
+    return jsonify({"history": h, "next_cursor": next_cursor})
+
+@app.route("/api/history/search", methods=["GET"])
+def api_history_search():
+    """Full-text search over history targets and extracted result fields.
+
+    Query parameters: q (words to match; a trailing * matches prefixes),
+    type (comma-separated), order (relevance or recent), limit and offset
+    (next_offset from the previous page). Pass the returned order back with
+    offset so later pages keep the same ordering.
+    """
+    args = request.args
+    try:
+        hits, next_offset, order = search_history(
+            args.get("q", ""),
+            limit=args.get("limit", 20),
+            offset=args.get("offset", 0),
+            types=[t for t in args.get("type", "").split(",") if t and t != "all"],
+            order=args.get("order", "relevance"),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        app.logger.warning("History search failed: %s", e)
+        return jsonify({"error": "History search failed"}), 500
+    return jsonify({"query": args.get("q", ""), "order": order, "hits": hits, "next_offset": next_offset})
+
+@app.route("/api/history/identifiers", methods=["GET"])
+def api_history_identifiers():
+    """Prior investigations of any form of an identifier (q = email, phone, username, IP or name)."""
+    value = request.args.get("q", "").strip()
+    if not value:
+        return jsonify({"error": "q required"}), 400
+    try:
+        keys, matches = find_prior_investigations(value, min(int(request.args.get("limit", IDENTIFIER_MATCH_LIMIT)), IDENTIFIER_MATCH_LIMIT))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        app.logger.warning("Identifier lookup failed for '%s': %s", value, e)
+        return jsonify({"error": "Identifier lookup failed"}), 500
+    return jsonify({"query": value, "keys": keys, "matches": matches})
+
+@app.route("/api/history/archive", methods=["GET"])
+def api_history_archive():
+    """Archived history partitions and the archived entries matching type, q (target prefix), since and until."""
+    args = request.args
+    try:
+        partitions, entries = query_history_archive(
+            types=[t for t in args.get("type", "").split(",") if t and t != "all"],
+            prefix=args.get("q", "").strip() or None,
+            since=_parse_history_time(args["since"]) if args.get("since") else None,
+            until=_parse_history_time(args["until"]) if args.get("until") else None,
+            limit=max(1, min(int(args.get("limit", 100)), HISTORY_PAGE_MAX)),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        app.logger.warning("Failed to read history archive: %s", e)
+        return jsonify({"error": "Failed to read history archive"}), 500
+    return jsonify({"partitions": partitions, "history": entries})
+
+@app.route("/api/history/export", methods=["GET"])
+def api_history_export():
+    """Stream history as NDJSON (summaries with full results) or CSV (summaries).
+
+    Query parameters: format (ndjson or csv), type (comma-separated), q (target
+    prefix), since, until and snapshot (the highest id included). Requests
+    without a snapshot are redirected to the current one, so the URL names a
+    fixed document that Range requests can resume.
+    """
+    args = request.args
+    fmt = args.get("format", "ndjson")
+    if fmt not in HISTORY_EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown export format: {fmt}"}), 400
+    try:
+        conditions, params = _history_filter_conditions(
+            types=[t for t in args.get("type", "").split(",") if t and t != "all"],
+            prefix=args.get("q", "").strip() or None,
+            since=_parse_history_time(args["since"]) if args.get("since") else None,
+            until=_parse_history_time(args["until"]) if args.get("until") else None,
+        )
+        snapshot = int(args["snapshot"]) if args.get("snapshot") else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        flush_history()
+        db = get_db()
+        if snapshot is None:
+            snapshot = db.execute("SELECT COALESCE(MAX(id), 0) FROM history").fetchone()[0]
+            return redirect(url_for("api_history_export", **{**args.to_dict(), "snapshot": snapshot}))
+        # Retention archiving rows out of the snapshot changes its bytes, so it is part of the key
+        archived = db.execute("SELECT COUNT(*) FROM history_archive").fetchone()[0]
+        key = (fmt, tuple(conditions), tuple(params), snapshot, archived)
+        plan = _cached_history_export_plan(db, key, fmt, conditions, params, snapshot)
+    except Exception as e:
+        app.logger.warning("Failed to plan history export: %s", e)
+        return jsonify({"error": "Failed to export history"}), 500
+
+    headers = {
+        "Content-Disposition": f'attachment; filename="history-{snapshot}.{fmt}"',
+        "X-History-Rows": str(plan["rows"]),
+    }
+    if not plan["stable"]:
+        # A summary backfill is still running, so the length is not final: no resume support
+        return Response(stream_history_export(fmt, conditions, params, snapshot),
+                        content_type=HISTORY_EXPORT_FORMATS[fmt], headers=headers)
+
+    length = plan["length"]
+    etag = '"%s"' % hashlib.sha1(repr((key, length, plan["rows"])).encode()).hexdigest()
+    headers.update({"Accept-Ranges": "bytes", "ETag": etag})
+    start, stop, status = 0, length, 200
+    byte_range = request.range
+    if byte_range is not None and len(byte_range.ranges) == 1 and request.headers.get("If-Range", etag) == etag:
+        span = byte_range.range_for_length(length)
+        if span is None:
+            headers["Content-Range"] = f"bytes */{length}"
+            return Response(status=416, headers=headers)
+        start, stop = span
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{length}"
+    headers["Content-Length"] = str(stop - start)
+    checkpoint = max((point for point in plan["checkpoints"] if point[0] <= start), default=(0, 0))
+    return Response(stream_history_export(fmt, conditions, params, snapshot, start, stop, checkpoint),
+                    status=status, content_type=HISTORY_EXPORT_FORMATS[fmt], headers=headers)
+
+@app.route("/api/stats", methods=["GET"])
+def api_stats():
+    """Dashboard statistics from the incremental counters; days sets how many daily buckets to return."""
+    try:
+        stats = fetch_history_stats(request.args.get("days", HISTORY_STATS_DAYS))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        app.logger.warning("Failed to fetch stats: %s", e)
+        return jsonify({"error": "Failed to load stats"}), 500
+    return jsonify(stats)
+
+@app.route("/api/history/<int:entry_id>", methods=["GET"])
+def api_history_entry(entry_id):
+    """Full result document for one history entry, loaded on demand by the history list."""
+    try:
+        entry = fetch_history_entry(entry_id)
+    except Exception as e:
+        app.logger.warning("Failed to fetch history entry %s: %s", entry_id, e)
+        return jsonify({"error": "Failed to load history entry"}), 500
+    if entry is None:
+        return jsonify({"error": "History entry not found"}), 404
+    response = jsonify(entry)
+    # Entries never change once written
+    response.headers["Cache-Control"] = "private, max-age=86400"
+    return response
+
+def check_input_type(raw):
+    """Investigation type /api/check runs for an input."""
+    if is_valid_email(raw):
+        return "email"
+    if is_possible_ip(raw):
+        return "ip"
+    if is_possible_phone(raw):
+        return "phone"
+    if is_likely_name(raw):
+        return "name"
+    return "username"
+
+def _check_response(kind, payload):
+    """/api/check response body around investigation data, as saved to history."""
+    if kind == "username":
+        return {"type": "username", "username_results": payload}
+    return {"type": kind, _HISTORY_PAYLOAD_KEYS[kind]: payload}
+
+def run_check_investigation(raw):
+    """Investigate raw by its detected type and save the result to history."""
+    kind = check_input_type(raw)
+    if kind == "email":
+        # Enhanced email investigation
+        email_res = check_email_investigation_enhanced(raw)
+        history_data = _check_response(kind, {"ok": True, "data": email_res["data"]} if email_res["ok"] else email_res)
+    elif kind == "ip":
+        # Enhanced IP investigation
+        ip_res = check_ip_investigation_enhanced(raw)
+        history_data = _check_response(kind, {"ok": True, "data": ip_res["data"]} if ip_res["ok"] else ip_res)
+    elif kind == "phone":
+        # Enhanced phone investigation
+        history_data = _check_response(kind, check_phone_number_enhanced(raw))
+    elif kind == "name":
+        # Name investigation
+        history_data = _check_response(kind, check_name_investigation(raw))
+    else:
+        # Username investigation
+        history_data = _check_response(kind, run_checks(raw))
+    # Save consistent structure to history
+    save_history(raw, history_data)
+    return history_data
 
 @app.route("/api/check", methods=["POST"])
 def api_check():
-    """Main investigation endpoint that handles all types of searches."""
+    """Main investigation endpoint that handles all types of searches.
+
+    Recent results for the same target are served from history (see
+    HISTORY_CACHE_POLICY) with a history_cache block; pass "refresh": true
+    to always re-investigate.
+    """
     data = request.get_json() or {}
     raw = (data.get("username") or "").strip()
     if not raw:
         return jsonify({"error": "Input required"}), 400
 
     try:
-        # Determine what type of input this is and investigate accordingly
-        if is_valid_email(raw):
-            # Enhanced email investigation
-            email_res = check_email_investigation_enhanced(raw)
-            if email_res["ok"]:
-                # Save consistent structure to history
-                history_data = {
-                    "type": "email",
-                    "email_check": {"ok": True, "data": email_res["data"]}
-                }
-                save_history(raw, history_data)
-                return jsonify({
-                    "type": "email",
-                    "email_check": {"ok": True, "data": email_res["data"]},
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-            else:
-                # Email investigation failed
-                history_data = {
-                    "type": "email",
-                    "email_check": email_res
-                }
-                save_history(raw, history_data)
-                return jsonify({
-                    "type": "email",
-                    "email_check": email_res,
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-        elif is_possible_ip(raw):
-            # Enhanced IP investigation
-            ip_res = check_ip_investigation_enhanced(raw)
-            if ip_res["ok"]:
-                # Save consistent structure to history
-                history_data = {
-                    "type": "ip",
-                    "ip_check": {"ok": True, "data": ip_res["data"]}
-                }
-                save_history(raw, history_data)
-                return jsonify({
-                    "type": "ip",
-                    "ip_check": {"ok": True, "data": ip_res["data"]},
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-            else:
-                # IP investigation failed
-                history_data = {
-                    "type": "ip",
-                    "ip_check": ip_res
-                }
-                save_history(raw, history_data)
-                return jsonify({
-                    "type": "ip",
-                    "ip_check": ip_res,
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-        elif is_possible_phone(raw):
-            # Enhanced phone investigation
-            phone_res = check_phone_number_enhanced(raw)
-            if phone_res["ok"]:
-                # Save consistent structure to history
-                history_data = {
-                    "type": "phone", 
-                    "phone_check": phone_res
-                }
-                save_history(raw, history_data)
-                return jsonify({
-                    "type": "phone", 
-                    "phone_check": phone_res,
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-            else:
-                # Phone investigation failed
-                history_data = {
-                    "type": "phone",
-                    "phone_check": phone_res
-                }
-                save_history(raw, history_data)
-                return jsonify({
-                    "type": "phone",
-                    "phone_check": phone_res,
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-        elif is_likely_name(raw):
-            # Name investigation
-            name_res = check_name_investigation(raw)
-            # Save consistent structure to history
-            history_data = {
-                "type": "name",
-                "name_check": name_res
-            }
-            save_history(raw, history_data)
-            return jsonify({
-                "type": "name",
-                "name_check": name_res,
-                "timestamp": datetime.utcnow().isoformat()
-            })
-        else:
-            # Username investigation
-            username_results = run_checks(raw)
-            # Save consistent structure to history
-            history_data = {
-                "type": "username",
-                "username_results": username_results
-            }
-            save_history(raw, history_data)
-            return jsonify({
-                "type": "username",
-                "username_results": username_results,
-                "timestamp": datetime.utcnow().isoformat()
-            })
+        kind = check_input_type(raw)
+        if not data.get("refresh"):
+            cached = serve_cached_result(kind, raw, lambda: run_check_investigation(raw))
+            if cached:
+                payload, cache_info = cached
+                response = _check_response(kind, payload if kind == "username" else {"ok": True, "data": payload})
+                return jsonify({**response, "timestamp": datetime.utcnow().isoformat(), "history_cache": cache_info})
+        response = run_check_investigation(raw)
+        return jsonify({**response, "timestamp": datetime.utcnow().isoformat()})
             
     except Exception as e:
         app.logger.error("Investigation failed for '%s': %s", raw, e)
@@ -3004,28 +7488,81 @@ def api_enhanced_username():
 
 @app.route("/api/bulk-search", methods=["POST"])
 def api_bulk_search():
-    """Bulk search multiple usernames/emails/phones."""
+    """Bulk search multiple usernames/emails/phones/IPs."""
     data = request.get_json() or {}
     items = data.get("items", [])
-    search_type = data.get("type", "auto")  # auto, username, email, phone, name
+    search_type = data.get("type", "auto")  # auto, username, email, phone, name, ip
+    reverse_dns = bool(data.get("reverse_dns", False))
+    smtp_verify = bool(data.get("smtp_verify", False))
     
-    if not items or len(items) > 50:  # Limit to 50 items for demo
-        return jsonify({"error": "Provide 1-50 items to search"}), 400
+    max_items = max(50, BULK_IP_MAX_ITEMS) if NUMPY_AVAILABLE else 50
+    if not items or len(items) > max_items:
+        return jsonify({"error": f"Provide 1-{max_items} items to search"}), 400
     
     results = []
     
     try:
-        for item in items:
-            item = item.strip()
+        items = [item.strip() for item in items]
+        
+        # IP lists run through the batch pipeline and may be much larger
+        ip_items = []
+        if NUMPY_AVAILABLE and search_type in ("auto", "ip"):
+            ip_mask = parse_ip_batch(items)["valid"].tolist() if search_type == "auto" else [bool(item) for item in items]
+            ip_items = [item for item, is_ip in zip(items, ip_mask) if is_ip]
+            if ip_items:
+                ip_set = set(ip_items)
+                items_other = [item for item in items if item not in ip_set]
+            else:
+                items_other = items
+        else:
+            items_other = items
+        if len(items_other) > 50:  # Limit to 50 items for demo
+            return jsonify({"error": f"Provide 1-50 items to search (IP lists up to {BULK_IP_MAX_ITEMS})"}), 400
+        
+        slots = {}
+        ip_groups = []
+        if ip_items:
+            ip_batch = run_bulk_ip_investigation(ip_items, reverse_dns=reverse_dns)
+            ip_groups = ip_batch["groups"]
+            for row in ip_batch["results"]:
+                slots.setdefault(row["item"], []).append(row)
+        
+        # Group email items by domain so domain analysis runs once per distinct domain;
+        # everything else keeps its original position in the queue.
+        if search_type in ("auto", "email"):
+            email_groups = group_emails_by_domain(items_other)
+        else:
+            email_groups = {}
+        grouped = [item for group in email_groups.values() for item in group]
+        grouped_set = set(grouped)
+        local_intel = dict(zip(grouped, classify_local_parts([item.rsplit('@', 1)[0] for item in grouped])))
+        # One HIBP domain search per verified corporate domain instead of one call per address
+        prefetch_hibp_domains(email_groups)
+        # Registration data for every distinct domain is filled in from the RDAP cache as it arrives
+        rdap_prefetch("domain", list(email_groups))
+        # SMTP probes share one session per MX host across the whole batch
+        deliverability = verify_email_addresses(grouped) if smtp_verify and grouped else {}
+        ordered_items = grouped + [item for item in items_other if item not in grouped_set]
+        
+        for item in ordered_items:
             if not item:
                 continue
                 
             try:
+                domain_intel = None
+                item_local_intel = local_intel.get(item)
+                if item in grouped_set:
+                    domain_intel = get_domain_intelligence(item.rsplit('@', 1)[1])
+                
                 # Determine search type automatically or use specified type
                 if search_type == "auto":
                     if is_valid_email(item):
-                        search_result = check_email_investigation_enhanced(item)
+                        search_result = check_email_investigation_enhanced(item, domain_intel, item_local_intel,
+                                                                           deliverability=deliverability.get(item))
                         result_type = "email"
+                    elif is_possible_ip(item):
+                        search_result = check_ip_investigation_enhanced(item)
+                        result_type = "ip"
                     elif is_possible_phone(item):
                         search_result = check_phone_number_enhanced(item)
                         result_type = "phone"
@@ -3038,11 +7575,15 @@ def api_bulk_search():
                 else:
                     # Use specified type
                     if search_type == "email":
-                        search_result = check_email_investigation_enhanced(item)
+                        search_result = check_email_investigation_enhanced(item, domain_intel, item_local_intel,
+                                                                           deliverability=deliverability.get(item))
                         result_type = "email"
                     elif search_type == "phone":
                         search_result = check_phone_number_enhanced(item)
                         result_type = "phone"
+                    elif search_type == "ip":
+                        search_result = check_ip_investigation_enhanced(item)
+                        result_type = "ip"
                     elif search_type == "name":
                         search_result = check_name_investigation(item)
                         result_type = "name"
@@ -3053,7 +7594,7 @@ def api_bulk_search():
                         search_result = {"error": "Invalid search type"}
                         result_type = "error"
                 
-                results.append({
+                slots.setdefault(item, []).append({
                     "item": item,
                     "type": result_type,
                     "result": search_result,
@@ -3061,13 +7602,18 @@ def api_bulk_search():
                 })
                 
             except Exception as e:
-                results.append({
+                slots.setdefault(item, []).append({
                     "item": item,
                     "type": "error",
                     "result": {"error": str(e)},
                     "status": "error"
                 })
         
+        # Report results in the order the items were submitted
+        for item in items:
+            if slots.get(item):
+                results.append(slots[item].pop(0))
+        
         # Save bulk search to history
         try:
             bulk_summary = {
@@ -3088,7 +7634,8 @@ def api_bulk_search():
                 "successful": len([r for r in results if r["status"] == "success"]),
                 "failed": len([r for r in results if r["status"] == "error"]),
                 "search_type": search_type
-            }
+            },
+            "ip_groups": ip_groups
         })
         
     except Exception as e:
@@ -3488,6 +8035,10 @@ def create_email_pdf_content(data, styles):
         story.append(Paragraph("Domain Analysis", styles['Heading3']))
         story.append(Paragraph(f"<b>Provider Type:</b> {domain.get('provider_type', 'Unknown')}", styles['Normal']))
         story.append(Paragraph(f"<b>Reputation:</b> {domain.get('domain_reputation', 'Unknown')}", styles['Normal']))
+        registration = domain.get('registration') or {}
+        if registration.get('registrar') or registration.get('registration_date'):
+            story.append(Paragraph(f"<b>Registrar:</b> {registration.get('registrar') or 'Unknown'}", styles['Normal']))
+            story.append(Paragraph(f"<b>Registered:</b> {registration.get('registration_date') or 'Unknown'} ({registration.get('domain_age', 'Unknown')})", styles['Normal']))
         story.append(Spacer(1, 12))
     
     # Breach Intelligence
@@ -3626,6 +8177,7 @@ def api_monitor_watchlist():
     try:
         watchlist = fetch_watchlist()
         results = []
+        prefetch_hibp_domains(group_emails_by_domain([w["item"] for w in watchlist if w["item_type"] == "email"]))
         
         for item_data in watchlist:
             item = item_data["item"]
@@ -0,0 +1,95 @@
+"""
+Shared test fixtures: a local DNS stand-in so resolver code paths run without real resolvers.
+"""
+
+import socketserver
+import threading
+
+import dns.message
+import dns.rcode
+import dns.resolver
+import dns.rrset
+import pytest
+
+import app
+
+
+class DNSStandIn(socketserver.ThreadingUDPServer):
+    """Tiny authoritative server: A/MX answers for registered names, NXDOMAIN with an SOA otherwise."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, a_records=None, aaaa_records=None, mx_records=None):
+        super().__init__(("127.0.0.1", 0), DNSStandInHandler)
+        self.a_records = {name.lower(): value for name, value in (a_records or {}).items()}
+        self.aaaa_records = {name.lower(): value for name, value in (aaaa_records or {}).items()}
+        self.mx_records = {name.lower(): value for name, value in (mx_records or {}).items()}
+        self.queries = []
+        self.lock = threading.Lock()
+
+
+class DNSStandInHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        data, sock = self.request
+        query = dns.message.from_wire(data)
+        question = query.question[0]
+        name = question.name.to_text().rstrip(".").lower()
+        rtype = dns.rdatatype.to_text(question.rdtype)
+        server = self.server
+        with server.lock:
+            server.queries.append((name, rtype))
+        response = dns.message.make_response(query)
+        if name in server.a_records or name in server.aaaa_records or name in server.mx_records:
+            if rtype == "A" and name in server.a_records:
+                response.answer.append(dns.rrset.from_text(question.name, 300, "IN", "A", server.a_records[name]))
+            elif rtype == "AAAA" and name in server.aaaa_records:
+                response.answer.append(dns.rrset.from_text(question.name, 300, "IN", "AAAA", server.aaaa_records[name]))
+            elif rtype == "MX" and name in server.mx_records:
+                response.answer.append(dns.rrset.from_text(question.name, 300, "IN", "MX", server.mx_records[name]))
+        else:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+            response.authority.append(dns.rrset.from_text(
+                "test.", 300, "IN", "SOA", "ns.test. admin.test. 1 3600 600 86400 300"
+            ))
+        sock.sendto(response.to_wire(), self.client_address)
+
+
+@pytest.fixture
+def standin(monkeypatch, tmp_path):
+    servers = []
+
+    def start(**kwargs):
+        server = DNSStandIn(**kwargs)
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        servers.append(server)
+        resolver = dns.resolver.Resolver(configure=False)
+        resolver.nameservers = ["127.0.0.1"]
+        resolver.port = server.server_address[1]
+        resolver.timeout = resolver.lifetime = 1.0
+        monkeypatch.setattr(app, "_ptr_resolver", resolver)
+        return server
+
+    app._lookalike_dns_cache.clear()
+    app._lookalike_cache.clear()
+    # Observations go to a throwaway passive-DNS store
+    monkeypatch.setattr(app, "PASSIVE_DNS_PATH", str(tmp_path / "passive_dns.db"))
+    monkeypatch.setattr(app, "_pdns_schema_ready", False)
+    app._pdns_buffer.clear()
+    app._pdns_written.clear()
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    app._pdns_buffer.clear()
+
+
+@pytest.fixture
+def history_db(monkeypatch, tmp_path):
+    """A fresh history database (and archive directory) in place of DB_PATH."""
+    monkeypatch.setattr(app, "DB_PATH", str(tmp_path / "history.db"))
+    monkeypatch.setattr(app, "HISTORY_ARCHIVE_DIR", str(tmp_path / "history_archive"))
+    monkeypatch.setattr(app, "HISTORY_RETENTION_INTERVAL", 0)
+    app.connect_db().close()
+    return app.DB_PATH
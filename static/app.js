@@ -21,6 +21,7 @@ const watchlistItems = document.getElementById("watchlistItems");
 const monitorWatchlist = document.getElementById("monitorWatchlist");
 const filterBtns = document.querySelectorAll(".filter-btn");
 const sortHistory = document.getElementById("sortHistory");
+const historySearch = document.getElementById("historySearch");
 const totalSearches = document.getElementById("totalSearches");
 const foundResults = document.getElementById("foundResults");
 
@@ -29,6 +30,10 @@ let currentBulkResults = null;
 let allHistory = [];
 let currentFilter = "all";
 let currentSort = "recent";
+let historyCursor = null;
+let historyLoading = false;
+let historyGeneration = 0;
+const HISTORY_PAGE_SIZE = 25;
 
 function el(tag, cls, text) {
   const e = document.createElement(tag);
@@ -37,47 +42,62 @@ function el(tag, cls, text) {
   return e;
 }
 
-async function fetchHistory() {
-  historyList.innerHTML = "<div class='text-muted'>Loading...</div>";
+// History is filtered, sorted and paginated server-side; scrolling the list loads the next page
+async function fetchHistory(append = false) {
+  if (append && historyLoading) return;
+  // A new filter/sort supersedes any page still in flight
+  const generation = append ? historyGeneration : ++historyGeneration;
+  historyLoading = true;
+  if (!append) {
+    historyList.innerHTML = "<div class='text-muted'>Loading...</div>";
+    historyCursor = null;
+  }
   try {
-    const res = await fetch("/api/history");
+    const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE, sort: currentSort });
+    if (currentFilter !== "all") params.set("type", currentFilter);
+    if (historySearch && historySearch.value.trim()) params.set("q", historySearch.value.trim());
+    if (append && historyCursor) params.set("cursor", historyCursor);
+    const res = await fetch(`/api/history?${params}`);
     const j = await res.json();
-    allHistory = j.history || [];
+    if (generation !== historyGeneration) return;
+    const page = j.history || [];
+    historyCursor = j.next_cursor || null;
     
-    // Update stats
-    updateStats();
+    if (append) {
+      allHistory = allHistory.concat(page);
+      renderHistoryItems(page);
+    } else {
+      allHistory = page;
+      displayFilteredHistory();
+    }
     
-    // Apply current filter and sort
-    displayFilteredHistory();
+    if (!append) updateStats();
     
   } catch (e) {
-    historyList.innerHTML = "<div class='text-danger'>Failed to load history</div>";
+    if (!append && generation === historyGeneration) {
+      historyList.innerHTML = "<div class='text-danger'>Failed to load history</div>";
+    }
+  } finally {
+    if (generation === historyGeneration) historyLoading = false;
   }
 }
 
-function updateStats() {
-  totalSearches.textContent = allHistory.length;
-  
-  // Count found results (simplified estimation)
-  let foundCount = 0;
-  allHistory.forEach(item => {
-    const result = item.result;
-    if (result && typeof result === 'object') {
-      if (result.type === 'username' && result.username_results) {
-        const platforms = Object.values(result.username_results);
-        foundCount += platforms.filter(p => p.exists).length;
-      } else if (result.ok || result.type) {
-        foundCount++;
-      }
-    }
-  });
-  foundResults.textContent = foundCount;
+// Counters are maintained server-side on every history insert, so they cover the whole history
+async function updateStats() {
+  try {
+    const res = await fetch("/api/stats?days=1");
+    if (!res.ok) return;
+    const stats = await res.json();
+    totalSearches.textContent = stats.totals.searches;
+    foundResults.textContent = stats.totals.found_items;
+  } catch (e) {
+    console.error("Failed to load stats:", e);
+  }
 }
 
 function getItemType(item) {
-  const result = item.result;
-  if (result && result.type) {
-    return result.type;
+  if (item.result_type) {
+    return item.result_type;
   }
   // Fallback detection
   const username = item.username;
@@ -89,36 +109,41 @@ function getItemType(item) {
   return 'username';
 }
 
+// Full history results are fetched on demand and kept for the session
+const historyDetails = new Map();
+
+async function openHistoryEntry(entryId) {
+  try {
+    let entry = historyDetails.get(entryId);
+    if (!entry) {
+      const res = await fetch(`/api/history/${entryId}`);
+      entry = await res.json();
+      if (!res.ok) {
+        throw new Error(entry.error || "Failed to load history entry");
+      }
+      historyDetails.set(entryId, entry);
+    }
+    renderResults(entry.username, entry.result);
+  } catch (e) {
+    statusArea.innerHTML = showSuccessAlert(e.message, "error");
+  }
+}
+
 function displayFilteredHistory() {
   historyList.innerHTML = "";
   
   if (allHistory.length === 0) {
-    historyList.innerHTML = "<div class='text-muted'>No recent searches.</div>";
+    historyList.innerHTML = currentFilter === "all"
+      ? "<div class='text-muted'>No recent searches.</div>"
+      : `<div class='text-muted'>No ${currentFilter} searches found.</div>`;
     return;
   }
   
-  // Filter history
-  let filteredHistory = allHistory;
-  if (currentFilter !== "all") {
-    filteredHistory = allHistory.filter(item => getItemType(item) === currentFilter);
-  }
-  
-  // Sort history
-  filteredHistory.sort((a, b) => {
-    switch (currentSort) {
-      case "oldest":
-        return new Date(a.checked_at) - new Date(b.checked_at);
-      case "alphabetical":
-        return a.username.localeCompare(b.username);
-      case "type":
-        return getItemType(a).localeCompare(getItemType(b));
-      default: // recent
-        return new Date(b.checked_at) - new Date(a.checked_at);
-    }
-  });
-  
-  // Display history
-  filteredHistory.forEach(item => {
+  renderHistoryItems(allHistory);
+}
+
+function renderHistoryItems(items) {
+  items.forEach(item => {
     const row = el("div", "history-item mb-2 p-2 border rounded");
     const t = new Date(item.checked_at).toLocaleString();
     const itemType = getItemType(item);
@@ -138,10 +163,10 @@ function displayFilteredHistory() {
             <strong>${item.username}</strong>
             <span class="badge bg-light text-dark">${itemType}</span>
           </div>
-          <div class="text-muted small">${t}</div>
+          <div class="text-muted small">${t}${item.risk_level ? ` · ${item.risk_level} risk` : ''}${item.provider_status === 'error' ? ' · failed' : ''}</div>
         </div>
         <div class="d-flex gap-1">
-          <button class="btn btn-sm btn-outline-primary" onclick="renderResults('${item.username}', ${JSON.stringify(item.result).replace(/"/g, '&quot;')})">
+          <button class="btn btn-sm btn-outline-primary" onclick="openHistoryEntry(${item.id})">
             <i class="fa-solid fa-eye"></i>
           </button>
           <button class="btn btn-sm btn-outline-success" onclick="addItemToWatchlist('${item.username}')">
@@ -153,15 +178,11 @@ function displayFilteredHistory() {
     row.style.cursor = "pointer";
     row.onclick = (e) => {
       if (!e.target.closest('button')) {
-        renderResults(item.username, item.result);
+        openHistoryEntry(item.id);
       }
     };
     historyList.appendChild(row);
   });
-  
-  if (filteredHistory.length === 0) {
-    historyList.innerHTML = `<div class='text-muted'>No ${currentFilter} searches found.</div>`;
-  }
 }
 
 function clearResults() {
@@ -455,6 +476,21 @@ function renderEmailResults(resultObj) {
                     <strong>👤 Local:</strong> ${data.local_part}<br>
                     <strong>🌐 Domain:</strong> ${data.domain}`;
   
+  // SMTP mailbox verification
+  if (data.deliverability && data.deliverability.address) {
+    const mailbox = data.deliverability.address;
+    const mailboxLabels = {
+      deliverable: "Mailbox exists",
+      undeliverable: "Mailbox rejected",
+      accept_all: "Catch-all domain (accepts any address)",
+      unknown: "Could not verify"
+    };
+    overviewInfo += `<br><strong>📬 Mailbox:</strong> ${mailboxLabels[mailbox.status] || mailbox.status}`;
+    if (data.deliverability.deliverable_variations && data.deliverability.deliverable_variations.length > 0) {
+      overviewInfo += `<br><strong>🔁 Also deliverable:</strong> ${data.deliverability.deliverable_variations.slice(0, 3).join(', ')}`;
+    }
+  }
+  
   // Add validation sources badge
   if (data.validation_sources && data.validation_sources.length > 0) {
     overviewInfo += `<br><div class="mt-2">
@@ -509,6 +545,17 @@ function renderEmailResults(resultObj) {
     domainToggle.appendChild(domainRight);
     domainBody.appendChild(domainToggle);
     
+    // Registration data from RDAP (filled in on a later lookup while pending)
+    const registration = domainData.registration || {};
+    let registrationInfo = '';
+    if (registration.pending) {
+      registrationInfo = `<br><strong>Registration:</strong> Lookup in progress`;
+    } else if (registration.registrar || registration.registration_date) {
+      registrationInfo = `<br><strong>Registrar:</strong> ${registration.registrar || 'Unknown'}<br>
+        <strong>Registered:</strong> ${registration.registration_date || 'Unknown'} (${registration.domain_age || 'Unknown'})<br>
+        <strong>Expires:</strong> ${registration.expiration_date || 'Unknown'}`;
+    }
+
     // Collapsible domain details
     const domainDetails = el("div", "collapse mt-3");
     domainDetails.id = "domainDetails";
@@ -521,12 +568,44 @@ function renderEmailResults(resultObj) {
         <strong>Educational:</strong> ${domainData.is_educational ? 'Yes' : 'No'}<br>
         <strong>Government:</strong> ${domainData.is_government ? 'Yes' : 'No'}<br>
         <strong>Corporate:</strong> ${domainData.is_corporate ? 'Yes' : 'No'}
+        ${registrationInfo}
       </div>`;
     domainBody.appendChild(domainDetails);
     domainCard.appendChild(domainBody);
     resultsGrid.appendChild(domainCard);
   }
   
+  // Lookalike Domains Card
+  if (data.lookalike_domains && data.lookalike_domains.candidates_checked) {
+    const lookalikeData = data.lookalike_domains;
+    const lookalikeCard = el("div", "card card-platform p-2 shadow-sm");
+    const lookalikeBody = el("div", "card-body p-2");
+    const lookalikeRow = el("div", "d-flex justify-content-between align-items-start");
+    const lookalikeLeft = el("div", "");
+    lookalikeLeft.innerHTML = `<div style="font-weight:600">🎭 Lookalike Domains</div>
+                              <div class="text-muted" style="font-size:0.85rem">${lookalikeData.candidates_checked} typosquat candidates checked</div>`;
+    
+    const lookalikeRight = el("div", "");
+    let lookalikeInfo = lookalikeData.with_mx_count > 0
+      ? `<div class="result-no"><i class="fa-solid fa-exclamation-triangle"></i> ${lookalikeData.with_mx_count} can receive mail</div>`
+      : lookalikeData.registered_count > 0
+        ? `<div class="result-maybe"><i class="fa-solid fa-exclamation-circle"></i> ${lookalikeData.registered_count} registered</div>`
+        : `<div class="result-yes"><i class="fa-solid fa-check-circle"></i> None registered</div>`;
+    if (lookalikeData.registered.length > 0) {
+      lookalikeInfo += `<div class="text-muted mt-2" style="font-size: 0.9rem;">`;
+      lookalikeData.registered.slice(0, 5).forEach(item => {
+        lookalikeInfo += `${item.domain} <small class="badge bg-secondary">${item.fuzzer}</small>${item.has_mx ? ' <small class="badge bg-danger">MX</small>' : ''}<br>`;
+      });
+      lookalikeInfo += `</div>`;
+    }
+    lookalikeRight.innerHTML = lookalikeInfo;
+    lookalikeRow.appendChild(lookalikeLeft);
+    lookalikeRow.appendChild(lookalikeRight);
+    lookalikeBody.appendChild(lookalikeRow);
+    lookalikeCard.appendChild(lookalikeBody);
+    resultsGrid.appendChild(lookalikeCard);
+  }
+  
   // Risk Assessment Card
   if (data.risk_assessment) {
     const riskCard = el("div", "card card-platform p-2 shadow-sm");
@@ -1464,10 +1543,14 @@ async function runEnhancedAnalysis(username) {
   }
 }
 
-form.addEventListener("submit", async (e) => {
-  e.preventDefault();
-  const username = usernameInput.value.trim();
-  if (!username) return;
+function formatAge(seconds) {
+  if (seconds < 60) return `${seconds}s`;
+  if (seconds < 3600) return `${Math.round(seconds / 60)} min`;
+  if (seconds < 86400) return `${Math.round(seconds / 3600)} h`;
+  return `${Math.round(seconds / 86400)} d`;
+}
+
+async function runCheck(username, refresh = false) {
   clearResults();
   statusArea.innerHTML = showLoadingSpinner(`Investigating ${username}...`);
   
@@ -1475,16 +1558,27 @@ form.addEventListener("submit", async (e) => {
     const res = await fetch("/api/check", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ username })
+      body: JSON.stringify({ username, refresh })
     });
     const j = await res.json();
     
     if (res.ok) {
-      // Show success message briefly
-      statusArea.innerHTML = showSuccessAlert(`Investigation completed for ${username}`, "success");
-      setTimeout(() => {
-        statusArea.innerHTML = "";
-      }, 3000);
+      if (j.history_cache) {
+        // Served from history; offer a fresh run
+        const cache = j.history_cache;
+        statusArea.innerHTML = showSuccessAlert(
+          `Showing the saved result from ${formatAge(cache.age_seconds)} ago${cache.refreshing ? " (refreshing in the background)" : ""}. ` +
+          `<button class="btn btn-sm btn-link p-0 align-baseline" id="rerunCheck">Re-run now</button>`,
+          "warning"
+        );
+        document.getElementById("rerunCheck").onclick = () => runCheck(username, true);
+      } else {
+        // Show success message briefly
+        statusArea.innerHTML = showSuccessAlert(`Investigation completed for ${username}`, "success");
+        setTimeout(() => {
+          statusArea.innerHTML = "";
+        }, 3000);
+      }
       
       // Handle different response types
       if (j.type === "email") {
@@ -1507,6 +1601,13 @@ form.addEventListener("submit", async (e) => {
   } catch (err) {
     statusArea.innerHTML = showSuccessAlert('Network error - please try again', "danger");
   }
+}
+
+form.addEventListener("submit", async (e) => {
+  e.preventDefault();
+  const username = usernameInput.value.trim();
+  if (!username) return;
+  runCheck(username);
 });
 
 async function runBulkSearch() {
@@ -1518,7 +1619,8 @@ async function runBulkSearch() {
     return;
   }
   
-  if (items.length > 50) {
+  // IP lists are batch-processed server-side and may exceed 50 items
+  if (items.length > 50 && searchType !== "ip" && searchType !== "auto") {
     statusArea.innerHTML = showSuccessAlert('Maximum 50 items allowed for bulk search', "warning");
     return;
   }
@@ -1596,6 +1698,34 @@ function renderBulkResults(bulkData) {
   
   resultsGrid.insertAdjacentHTML('beforeend', summaryCard);
   
+  // Network group summaries for bulk IP lists
+  if (bulkData.ip_groups && bulkData.ip_groups.length > 0) {
+    const groupRows = bulkData.ip_groups.slice(0, 25).map(group => `
+      <tr>
+        <td><code>${group.network}</code></td>
+        <td>${group.asn}${group.organization !== "Unknown" ? ` (${group.organization})` : ""}</td>
+        <td>${group.country}</td>
+        <td class="text-end">${group.members} / ${group.unique_addresses}</td>
+        <td>${group.highest_risk}${group.listed_in.length ? ` <small class="text-muted">${group.listed_in.join(", ")}</small>` : ""}</td>
+      </tr>
+    `).join("");
+    const groupContent = `
+      <div class="table-responsive">
+        <table class="table table-sm mb-0">
+          <thead><tr><th>Network</th><th>ASN</th><th>Country</th><th class="text-end">Items / Unique</th><th>Risk</th></tr></thead>
+          <tbody>${groupRows}</tbody>
+        </table>
+      </div>
+    `;
+    resultsGrid.insertAdjacentHTML('beforeend', createModernCard(
+      "IP Network Groups",
+      `${bulkData.ip_groups.length} networks${bulkData.ip_groups.length > 25 ? " (largest 25 shown)" : ""}`,
+      "success",
+      groupContent,
+      { icon: "fas fa-network-wired" }
+    ));
+  }
+  
   // Individual Results
   bulkData.bulk_results.forEach((result, index) => {
     let details = "";
@@ -1611,6 +1741,10 @@ function renderBulkResults(bulkData) {
         details = result.result.data.valid ? `Valid number - ${result.result.data.carrier}` : "Invalid phone number";
       } else if (result.type === "name" && result.result.ok) {
         details = `Found ${result.result.data.variations.length} name variations`;
+      } else if (result.type === "ip" && result.result.ok) {
+        const ipData = result.result.data;
+        details = ipData.is_private ? "Private network address" :
+          `${ipData.network_info.network_class} - ${(ipData.geolocation && ipData.geolocation.country) || "Unknown location"}`;
       } else {
         details = "Investigation completed successfully";
       }
@@ -1842,13 +1976,35 @@ filterBtns.forEach(btn => {
     filterBtns.forEach(b => b.classList.remove('active'));
     btn.classList.add('active');
     currentFilter = btn.dataset.filter;
-    displayFilteredHistory();
+    fetchHistory();
   };
 });
 
 sortHistory.onchange = () => {
   currentSort = sortHistory.value;
-  displayFilteredHistory();
+  fetchHistory();
+};
+
+// Exports stream from the server with the list's current type and prefix filters
+document.querySelectorAll(".history-export-btn").forEach(btn => {
+  btn.onclick = () => {
+    const params = new URLSearchParams({ format: btn.dataset.format });
+    if (currentFilter !== "all") params.set("type", currentFilter);
+    if (historySearch.value.trim()) params.set("q", historySearch.value.trim());
+    window.location.href = `/api/history/export?${params}`;
+  };
+});
+
+let historySearchTimer = null;
+historySearch.oninput = () => {
+  clearTimeout(historySearchTimer);
+  historySearchTimer = setTimeout(() => fetchHistory(), 250);
+};
+
+historyList.onscroll = () => {
+  if (historyCursor && historyList.scrollTop + historyList.clientHeight >= historyList.scrollHeight - 40) {
+    fetchHistory(true);
+  }
 };
 
 clearBtn.onclick = () => {
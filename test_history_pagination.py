@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+History Pagination Tests
+Pages through a throwaway history database with keyset cursors.
+"""
+
+import json
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def mixed_history(history_db):
+    """Summarized rows of three types plus rows still waiting for the summary backfill."""
+    targets = [
+        ("alice@example.org", {"type": "email", "email": "alice@example.org"}),
+        ("192.0.2.1", {"type": "ip", "ip": "192.0.2.1"}),
+        ("alice", {"type": "username"}),
+    ]
+    rows = []
+    for i in range(18):
+        target, result = targets[i % 3]
+        rows.append((target, json.dumps(dict(result, n=i)), f"2026-09-{1 + i % 6:02d}T10:00:00",
+                     app.summarize_history_result(target, result), ""))
+    app._write_history_rows(rows)
+    db = app.connect_db()
+    with db:
+        db.execute("UPDATE history SET result_type = NULL, found_count = NULL, risk_level = NULL, provider_status = NULL WHERE id % 3 = 0")
+    ids = [row[0] for row in db.execute("SELECT id FROM history")]
+    db.close()
+    return ids
+
+
+def page_through(sort, limit):
+    pages, cursor = [], None
+    with app.app.app_context():
+        while True:
+            page, cursor = app.fetch_history(limit=limit, cursor=cursor, sort=sort)
+            pages.append(page)
+            if not cursor:
+                return pages
+
+
+@pytest.mark.parametrize("sort", sorted(app.HISTORY_SORTS))
+def test_pages_cover_unsummarized_rows_once(mixed_history, sort):
+    pages = page_through(sort, limit=4)
+    seen = [item["id"] for page in pages for item in page]
+
+    assert len(seen) == len(set(seen))
+    assert sorted(seen) == sorted(mixed_history)
+    # Rows are summarized as they are shown
+    assert all(item["result_type"] for page in pages for item in page)
+
+
+def test_type_sort_lists_unsummarized_rows_first(mixed_history):
+    db = app.connect_db()
+    unsummarized = {row[0] for row in db.execute("SELECT id FROM history WHERE result_type IS NULL")}
+    db.close()
+    seen = [item["id"] for page in page_through("type", limit=4) for item in page]
+
+    assert len(unsummarized) == 6
+    assert set(seen[:6]) == unsummarized
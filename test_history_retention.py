@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+History Retention Tests
+Archives expired history partitions in a throwaway database and reads them back.
+"""
+
+import json
+import os
+from datetime import datetime
+
+import app
+
+
+def add_history(target, result, checked_at):
+    app._write_history_rows([(
+        target, json.dumps(result), checked_at,
+        app.summarize_history_result(target, result), app.extract_history_search_text(result)
+    )])
+    db = app.connect_db()
+    try:
+        return db.execute("SELECT MAX(id) FROM history").fetchone()[0]
+    finally:
+        db.close()
+
+
+def count(db, sql, params=()):
+    return db.execute(sql, params).fetchone()[0]
+
+
+def test_expired_partitions_are_archived_and_deleted(history_db):
+    shared = {"type": "ip", "ip": "192.0.2.7", "asn": "AS64500"}
+    old_ip = add_history("192.0.2.7", shared, "2026-01-15T10:00:00")
+    old_ip_other = add_history("192.0.2.8", {"type": "ip", "ip": "192.0.2.8"}, "2026-01-20T10:00:00")
+    recent_ip = add_history("192.0.2.7", shared, "2026-09-15T10:00:00")
+    # Email history is kept for a year, so the same month is not expired yet
+    old_email = add_history("alice@example.org", {"type": "email", "email": "alice@example.org"}, "2026-01-15T10:00:00")
+
+    archived = app.run_history_retention(now=datetime(2026, 10, 1))
+
+    assert [(a["result_type"], a["month"], a["rows"]) for a in archived] == [("ip", "2026-01", 2)]
+    path = archived[0]["path"]
+    assert os.path.exists(path) and not os.path.exists(path + ".tmp")
+    assert sorted(entry["id"] for entry in app._read_archive(path)) == [old_ip, old_ip_other]
+
+    db = app.connect_db()
+    try:
+        ids = {row[0] for row in db.execute("SELECT id FROM history")}
+        assert ids == {recent_ip, old_email}
+        assert count(db, "SELECT COUNT(*) FROM identifier_index WHERE history_id IN (?, ?)", (old_ip, old_ip_other)) == 0
+        if app.HISTORY_FTS_AVAILABLE:
+            assert count(db, "SELECT COUNT(*) FROM history_fts WHERE rowid IN (?, ?)", (old_ip, old_ip_other)) == 0
+        # The blob still used by the recent row survives; the other one is dropped
+        assert count(db, "SELECT COUNT(*) FROM result_blobs") == 2
+        assert count(db, "SELECT COUNT(*) FROM history_archive") == 1
+        # Counters keep every investigation ever run
+        assert count(db, "SELECT SUM(searches) FROM history_stats") == 4
+    finally:
+        db.close()
+
+    # A second pass finds nothing left to archive
+    assert app.run_history_retention(now=datetime(2026, 10, 1)) == []
+
+
+def test_archived_entries_stay_readable(history_db):
+    result = {"type": "ip", "ip": "192.0.2.9", "asn": "AS64501"}
+    entry_id = add_history("192.0.2.9", result, "2026-01-15T10:00:00")
+    app.run_history_retention(now=datetime(2026, 10, 1))
+
+    with app.app.test_client() as client:
+        response = client.get(f"/api/history/{entry_id}")
+        assert response.status_code == 200
+        entry = response.get_json()
+        assert entry["archived"] is True
+        assert entry["username"] == "192.0.2.9"
+        assert entry["result"] == result
+        assert client.get(f"/api/history/{entry_id + 1}").status_code == 404
+
+    with app.app.app_context():
+        partitions, entries = app.query_history_archive(types=["ip"])
+    assert [p["month"] for p in partitions] == ["2026-01"]
+    assert [(e["id"], e["archived"]) for e in entries] == [(entry_id, True)]
+    assert "result" not in entries[0]
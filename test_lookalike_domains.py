@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Lookalike Domain Sweep Tests
+Generates typosquat candidates and sweeps them against a local DNS stand-in (no real resolvers).
+"""
+
+import app
+
+
+def test_candidates_cover_the_fuzzers():
+    candidates = app.generate_lookalike_domains("example.com")
+
+    assert "example.com" not in candidates
+    assert candidates["exmple.com"] == "omission"
+    assert candidates["exmaple.com"] == "transposition"
+    assert candidates["examp1e.com"] == "homoglyph"
+    assert candidates["example.net"] == "tld-swap"
+    assert candidates["example-login.com"] == "dictionary"
+    assert candidates["examplecom.com"] == "dot-omission"
+    # IDN homoglyphs are sent as punycode
+    assert any(name.startswith("xn--") for name in candidates)
+    assert all(app.LOOKALIKE_VALID_LABEL.match(label) for name in candidates for label in name.split("."))
+
+
+def test_candidates_keep_multi_label_suffix_and_limit():
+    candidates = app.generate_lookalike_domains("shop.example.co.uk", max_candidates=50)
+
+    assert len(candidates) == 50
+    # The registrable label is fuzzed under its own suffix first
+    assert all(name.endswith(".co.uk") for name in candidates)
+    assert app.split_registrable_domain("shop.example.co.uk") == ("example", "co.uk")
+
+
+def test_sweep_reports_registered_lookalikes(standin):
+    standin(
+        a_records={"exmple.com": "192.0.2.10", "exampel.com": "192.0.2.20"},
+        mx_records={"exmple.com": "10 mail.exmple.com."},
+    )
+    result = app.sweep_lookalike_domains("example.com", max_candidates=200)
+
+    assert result["candidates_checked"] == 200
+    assert result["unresolved_count"] == 0
+    registered = {item["domain"]: item for item in result["registered"]}
+    assert set(registered) == {"exmple.com", "exampel.com"}
+    assert registered["exmple.com"]["has_mx"] is True
+    assert registered["exampel.com"]["has_mx"] is False
+    assert registered["exmple.com"]["addresses"] == ["192.0.2.10"]
+    # Mail-capable lookalikes are listed first
+    assert result["registered"][0]["domain"] == "exmple.com"
+
+
+def test_repeated_sweeps_are_served_from_cache(standin):
+    server = standin(a_records={"exmple.com": "192.0.2.10"})
+    first = app.get_lookalike_domains("example.com")
+    queries = len(server.queries)
+    second = app.get_lookalike_domains("example.com")
+
+    assert second is first
+    assert len(server.queries) == queries
+
+    # A fresh sweep still reuses cached answers, negative ones included
+    app._lookalike_cache.clear()
+    app.sweep_lookalike_domains("example.com")
+    assert len(server.queries) == queries
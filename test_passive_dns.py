@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Passive DNS Tests
+Runs investigations against a local DNS stand-in and reads their answers back from the store.
+"""
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """No registry or profile lookups; only DNS goes to the stand-in."""
+    monkeypatch.setattr(app, "rdap_lookup", lambda kind, query, wait=True: {"ok": False})
+    monkeypatch.setattr(app, "check_gravatar_presence", lambda email: {"found": False, "profile_url": None, "hash": None})
+    app._domain_cache.clear()
+    yield
+    app._domain_cache.clear()
+
+
+def test_email_investigation_records_mx_and_addresses(standin, offline):
+    standin(
+        a_records={"example.org": "192.0.2.1", "mail.example.org": "192.0.2.25"},
+        aaaa_records={"mail.example.org": "2001:db8:0:0::25"},
+        mx_records={"example.org": "10 mail.example.org."},
+    )
+    result = app.check_email_investigation_enhanced("alice@example.org")
+
+    assert result["ok"]
+    domain = result["data"]["domain_analysis"]
+    assert domain["mx_records"] == ["10 mail.example.org"]
+    assert domain["addresses"] == ["192.0.2.1"]
+    assert domain["has_mail_service"] is True
+
+    app.flush_passive_dns()
+    forward = {(r["type"], r["value"]) for r in app.query_passive_dns(name="example.org")}
+    assert forward == {("MX", "mail.example.org"), ("A", "192.0.2.1")}
+    # The mail host's IPv6 address is found under any spelling
+    pivot = app.pivot_passive_dns_ip("2001:DB8::25")
+    assert [r["name"] for r in pivot["domains"]] == ["mail.example.org"]
+    assert [r["name"] for r in pivot["mail_domains"]] == ["example.org"]
+
+
+def test_domain_without_mx_uses_its_address(standin, offline):
+    standin(a_records={"example.net": "192.0.2.2"})
+    domain = app.check_email_investigation_enhanced("bob@example.net")["data"]["domain_analysis"]
+
+    assert domain["mx_records"] == []
+    assert domain["has_mail_service"] is True
+    assert [r["name"] for r in app.pivot_passive_dns_ip("192.0.2.2")["domains"]] == ["example.net"]
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+SMTP Verification Engine Tests
+Runs the deliverability engine against a local SMTP stand-in (no real mail servers).
+"""
+
+import socketserver
+import threading
+import time
+
+import pytest
+
+import app
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Tiny ESMTP server: known mailboxes, catch-all domains and greylisting."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, mailboxes=(), catch_all_domains=(), greylist_domains=(), pipelining=True):
+        super().__init__(("127.0.0.1", 0), SMTPStandInHandler)
+        self.mailboxes = {m.lower() for m in mailboxes}
+        self.catch_all_domains = set(catch_all_domains)
+        self.greylist_domains = set(greylist_domains)
+        self.pipelining = pipelining
+        self.greylisted_seen = set()
+        self.sessions = 0
+        self.chunks = []  # commands received per recv() call
+        self.lock = threading.Lock()
+
+    def rcpt_reply(self, address):
+        address = address.lower()
+        domain = address.rsplit("@", 1)[1]
+        with self.lock:
+            if domain in self.greylist_domains and address not in self.greylisted_seen:
+                self.greylisted_seen.add(address)
+                return "451 4.7.1 Greylisted, try again later"
+        if domain in self.catch_all_domains or address in self.mailboxes:
+            return "250 2.1.5 OK"
+        return "550 5.1.1 No such user"
+
+
+class SMTPStandInHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.sessions += 1
+        self.request.sendall(b"220 standin.test ESMTP\r\n")
+        buffer = b""
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            buffer += data
+            *lines, buffer = buffer.split(b"\r\n")
+            with server.lock:
+                server.chunks.append([line.decode() for line in lines])
+            replies = []
+            for line in lines:
+                command = line.decode().upper()
+                if command.startswith("EHLO"):
+                    extensions = ["250-standin.test", "250-SIZE 10240000"]
+                    if server.pipelining:
+                        extensions.append("250-PIPELINING")
+                    extensions.append("250 8BITMIME")
+                    replies.extend(extensions)
+                elif command.startswith("HELO") or command.startswith("MAIL FROM") or command == "RSET":
+                    replies.append("250 OK")
+                elif command.startswith("RCPT TO"):
+                    replies.append(server.rcpt_reply(line.decode()[9:-1]))
+                elif command == "QUIT":
+                    self.request.sendall(("\r\n".join(replies + ["221 Bye"]) + "\r\n").encode())
+                    return
+                else:
+                    replies.append("502 Command not implemented")
+            if replies:
+                self.request.sendall(("\r\n".join(replies) + "\r\n").encode())
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    servers = []
+
+    def start(**kwargs):
+        server = SMTPStandIn(**kwargs)
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(app, "SMTP_PORT", server.server_address[1])
+        monkeypatch.setattr(app, "resolve_mx_hosts", lambda domains: {d: ["127.0.0.1"] for d in domains})
+        return server
+
+    app._smtp_cache.clear()
+    app._smtp_buckets.clear()
+    app._smtp_host_failures.clear()
+    app._smtp_retrying.clear()
+    monkeypatch.setattr(app, "SMTP_GREYLIST_RETRY_DELAYS", [0.05])
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_pipelined_probes_share_one_session(standin):
+    server = standin(mailboxes=["alice@example.test", "dave@other.test"])
+    results = app.verify_email_addresses(["alice@example.test", "bob@example.test", "dave@other.test"])
+
+    assert results["alice@example.test"]["status"] == "deliverable"
+    assert results["bob@example.test"]["status"] == "undeliverable"
+    assert results["bob@example.test"]["smtp_code"] == 550
+    assert results["dave@other.test"]["status"] == "deliverable"
+    # Both domains share the MX host, so one session carries every probe
+    assert server.sessions == 1
+    # MAIL FROM and all RCPT TO commands arrived in a single write
+    assert any(len(chunk) >= 4 and chunk[0].startswith("MAIL FROM") for chunk in server.chunks)
+
+
+def test_catch_all_domain_is_reported(standin):
+    standin(catch_all_domains=["catchall.test"])
+    result = app.verify_email_addresses(["anyone@catchall.test"])["anyone@catchall.test"]
+
+    assert result["status"] == "accept_all"
+    assert result["catch_all"] is True
+
+
+def test_greylisted_addresses_are_retried_in_background(standin):
+    server = standin(mailboxes=["carol@grey.test"], greylist_domains=["grey.test"])
+    result = app.verify_email_addresses(["carol@grey.test"])["carol@grey.test"]
+
+    # The request returns at once; the retry fills the cache for the next lookup
+    assert result["status"] == "unknown"
+    assert result["greylisted"] is True
+    assert result["retry_scheduled"] is True
+    deadline = time.monotonic() + 5
+    while "carol@grey.test" not in app._smtp_cache and time.monotonic() < deadline:
+        time.sleep(0.02)
+    result = app.verify_email_addresses(["carol@grey.test"])["carol@grey.test"]
+
+    assert result["status"] == "deliverable"
+    assert result["cached"] is True
+    assert server.sessions == 2
+
+
+def test_variations_use_the_same_session(standin):
+    server = standin(mailboxes=["john.smith@example.test", "johnsmith@example.test"])
+    report = app.verify_email_deliverability("john.smith@example.test")
+
+    assert report["address"]["status"] == "deliverable"
+    assert "johnsmith@example.test" in report["deliverable_variations"]
+    assert report["variations_checked"] > 0
+    assert server.sessions == 1
+
+
+def test_server_without_pipelining(standin):
+    server = standin(mailboxes=["alice@example.test"], pipelining=False)
+    results = app.verify_email_addresses(["alice@example.test", "bob@example.test"])
+
+    assert results["alice@example.test"]["status"] == "deliverable"
+    assert results["bob@example.test"]["status"] == "undeliverable"
+    assert all(len(chunk) == 1 for chunk in server.chunks)
+
+
+def test_results_are_cached(standin):
+    server = standin(mailboxes=["alice@example.test"])
+    app.verify_email_addresses(["alice@example.test"])
+    result = app.verify_email_addresses(["alice@example.test"])["alice@example.test"]
+
+    assert result["cached"] is True
+    assert server.sessions == 1
+
+
+def test_unreachable_mx_is_unknown(standin, monkeypatch):
+    standin()
+    monkeypatch.setattr(app, "SMTP_PORT", 1)
+    result = app.verify_email_addresses(["alice@example.test"])["alice@example.test"]
+
+    assert result["status"] == "unknown"
+
+
+def test_per_mx_rate_limit(monkeypatch):
+    app._smtp_buckets.clear()
+    monkeypatch.setattr(app, "SMTP_MX_BURST", 2)
+    monkeypatch.setattr(app, "SMTP_MX_RCPT_PER_MINUTE", 600)  # 10 per second
+    started = time.monotonic()
+    app._smtp_acquire("mx.ratelimit.test", 2)
+    app._smtp_acquire("mx.ratelimit.test", 2)
+
+    assert time.monotonic() - started >= 0.15